@@ -1,39 +1,18 @@
 import lightgbm as lgb
 import numpy as np
+import sys
 import cv2
+import os
 
-# Function to resize, center crop, and extract HSV histogram
-def process_image(image_path):
-    # Load the image
-    resized_image = cv2.imread(image_path)
-
-    # Center crop to 256x256
-    center_x, center_y = resized_image.shape[1] // 2, resized_image.shape[0] // 2
-    cropped_image = resized_image[center_y - 128:center_y + 128, center_x - 128:center_x + 128]
-
-    # Convert to HSV color space
-    hsv_image = cv2.cvtColor(cropped_image, cv2.COLOR_BGR2HSV)
-
-    # Extract histograms for H, S, and V channels
-    h_hist = cv2.calcHist([hsv_image], [0], None, [256], [0, 256]).flatten()
-    s_hist = cv2.calcHist([hsv_image], [1], None, [256], [0, 256]).flatten()
-    v_hist = cv2.calcHist([hsv_image], [2], None, [256], [0, 256]).flatten()
-
-    # Normalize histograms
-    h_hist = h_hist / h_hist.sum()
-    s_hist = s_hist / s_hist.sum()
-    v_hist = v_hist / v_hist.sum()
-
-    # Concatenate the histograms to form a single feature vector
-    feature_vector = np.concatenate([h_hist, s_hist, v_hist])
-
-    return feature_vector
+# Shared HSV-histogram kernel, identical to the one the server uses
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../server-py'))
+from src.ml.features import extract_features
 
 # Process the image to get the feature vector
 image_path = './data/datasets_raw/G/53239_0_crop.jpg'
 folder_labels = {'Normal': 0, 'Kun': 1, 'Red': 2, 'Green': 3}
 
-feature_vector = process_image(image_path)
+feature_vector = extract_features(cv2.imread(image_path))
 
 # Load the pre-trained LightGBM model
 loaded_model = lgb.Booster(model_file='./models/lightgbm_model.txt')
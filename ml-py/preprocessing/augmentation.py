@@ -1,14 +1,21 @@
 #pip install albumentations
 
+from multiprocessing import Pool
 import albumentations as A
+import numpy as np
 import itertools
+import argparse
+import hashlib
+import random
 import cv2
 import os
+from tqdm import tqdm
+
+from feature_extraction import init_worker
 
 # Input and output directories
 input_dir = '../data/datasets_raw'
 output_dir = '../data/datasets_augment'
-os.makedirs(output_dir, exist_ok=True)
 
 # Define individual augmentations
 augmentations_list = [
@@ -25,14 +32,72 @@ augmentations_list = [
 # Create all possible combinations of augmentations (256 combinations)
 combinations = list(itertools.product([0, 1], repeat=len(augmentations_list)))  # 256 combinations of 8 augmentations
 
+image_extensions = ('.png', '.jpg', '.jpeg', '.bmp', '.tiff')
+progress_file_name = '.augment_done'
+
+def node_seed(seed, image_key, prefix):
+    # The random draw of the transform that ends `prefix` depends only on (seed, image, prefix),
+    # so every combination sharing that prefix sees the same intermediate image
+    digest = hashlib.sha256(f'{seed}|{image_key}|{"".join(map(str, prefix))}'.encode()).digest()
+    return int.from_bytes(digest[:4], 'little')
+
+def apply_augmentation(idx, image, seed):
+    augmentation = augmentations_list[idx][1]
+    if hasattr(augmentation, 'set_random_seed'):
+        augmentation.set_random_seed(seed)
+    else:
+        # albumentations < 2 draws from the global generators
+        random.seed(seed)
+        np.random.seed(seed)
+    return augmentation(image=image)['image']
+
+def iter_augmentations(image, image_key, seed=0, keep=None):
+    """Yields (combination index, combo, augmented image) for all 256 combinations.
+
+    Walks the on/off tree depth first: a transform is applied once per shared prefix
+    (255 applications per image instead of ~1024) and the "off" branch reuses the
+    parent image as is. Leaves come out in itertools.product order, so index i is
+    the same combination the original script saved as _A{i+1}.
+
+    With `keep` (a set of combination indices) only those leaves are produced and
+    subtrees without any of them are never rendered.
+    """
+    depth = len(augmentations_list)
+
+    def walk(prefix, current):
+        if keep is not None:
+            # Leaves under this prefix are the index range [first, first + 2**remaining)
+            remaining = depth - len(prefix)
+            first = int(''.join(map(str, prefix)) or '0', 2) << remaining
+            if not any(first <= i < first + (1 << remaining) for i in keep):
+                return
+        if len(prefix) == depth:
+            yield int(''.join(map(str, prefix)), 2), prefix, current
+            return
+        idx = len(prefix)
+        yield from walk(prefix + (0,), current)
+        on_prefix = prefix + (1,)
+        yield from walk(on_prefix, apply_augmentation(idx, current, node_seed(seed, image_key, on_prefix)))
+
+    yield from walk((), image)
+
+def render_combination(image, image_key, combo, seed=0):
+    # Rebuilds a single combination independently; identical to what iter_augmentations yields
+    augmented_image = image
+    for depth, apply_aug in enumerate(combo):
+        if apply_aug:
+            augmented_image = apply_augmentation(depth, augmented_image, node_seed(seed, image_key, combo[:depth + 1]))
+    return augmented_image
+
 # Function to augment and save images
-def augment_and_save(image_path, relative_path):
+def augment_and_save(task):
+    image_path, relative_path, output_dir, seed = task
+
     # Load the original image
     image = cv2.imread(image_path)
 
     if image is None:
-        print(f"Could not load image {image_path}")
-        return
+        return image_path, 0
 
     # Extract the base filename without extension
     original_filename = os.path.splitext(os.path.basename(image_path))[0]
@@ -41,28 +106,54 @@ def augment_and_save(image_path, relative_path):
     output_subfolder = os.path.join(output_dir, relative_path)
     os.makedirs(output_subfolder, exist_ok=True)
 
-    # Apply each combination of augmentations
-    for i, combo in enumerate(combinations):
-        augmented_image = image.copy()  # Start with the original image
-
-        # Apply selected augmentations
-        for idx, apply_aug in enumerate(combo):
-            if apply_aug:  # If 1, apply the corresponding augmentation
-                augmentation = augmentations_list[idx][1]
-                augmented_image = augmentation(image=augmented_image)['image']
-
+    image_key = os.path.join(relative_path, os.path.basename(image_path))
+    saved = 0
+    for i, combo, augmented_image in iter_augmentations(image, image_key, seed):
         # Save augmented image with unique name (e.g., original_filename_A1.jpg, original_filename_A256.jpg)
         output_path = os.path.join(output_subfolder, f"{original_filename}_A{i+1}.jpg")
         cv2.imwrite(output_path, augmented_image)
-        print(f"Saved: {output_path}")
-
-# Traverse through all files in the input directory (including subfolders)
-for root, dirs, files in os.walk(input_dir):
-    for file in files:
-        if file.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.tiff')):
-            # Get the relative path of the current file with respect to the input_dir
-            relative_path = os.path.relpath(root, input_dir)
-            image_path = os.path.join(root, file)
-
-            # Augment and save images in the corresponding subfolder
-            augment_and_save(image_path, relative_path)
+        saved += 1
+    return image_path, saved
+
+def list_source_images(input_dir):
+    # Traverse through all files in the input directory (including subfolders)
+    tasks = []
+    for root, dirs, files in os.walk(input_dir):
+        dirs.sort()
+        for file in sorted(files):
+            if file.lower().endswith(image_extensions):
+                # Get the relative path of the current file with respect to the input_dir
+                tasks.append((os.path.join(root, file), os.path.relpath(root, input_dir)))
+    return tasks
+
+def augment_folder(input_dir, output_dir, workers=None, seed=0):
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Source images finished by an earlier (interrupted) run are skipped
+    progress_path = os.path.join(output_dir, progress_file_name)
+    done = set()
+    if os.path.exists(progress_path):
+        with open(progress_path) as progress_file:
+            done = set(progress_file.read().splitlines())
+
+    tasks = [(image_path, relative_path, output_dir, seed) for image_path, relative_path in list_source_images(input_dir) if image_path not in done]
+    if done:
+        print(f"Resuming: {len(done)} source images already augmented")
+
+    with Pool(processes=workers or os.cpu_count(), initializer=init_worker) as pool, open(progress_path, 'a') as progress_file:
+        for image_path, saved in tqdm(pool.imap_unordered(augment_and_save, tasks), total=len(tasks), unit='img'):
+            if saved:
+                progress_file.write(image_path + '\n')
+                progress_file.flush()
+            else:
+                print(f"Could not load image {image_path}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write all 256 augmentation combinations of every raw image')
+    parser.add_argument('--input-dir', default=input_dir)
+    parser.add_argument('--output-dir', default=output_dir)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    augment_folder(args.input_dir, args.output_dir, args.workers, args.seed)
@@ -1,104 +1,211 @@
+from multiprocessing import Pool
+import argparse
+import hashlib
+import json
+import csv
 import cv2
 import os
+import sys
 import numpy as np
 import pandas as pd
 from tqdm import tqdm
 
-# Function to resize, center crop, and extract HSV histogram
-def display_histograms():
-    # Example usage
-    image_path = '../data/datasets_augment_random/R/53239_0_crop.jpg'
-
-    # Load the image
-    image = cv2.imread(image_path)
-    # Resize the image to 512x512
-    resized_image = cv2.resize(image, (512, 512))
-
-    # Center crop to 256x256
-    center_x, center_y = resized_image.shape[1] // 2, resized_image.shape[0] // 2
-    cropped_image = resized_image[center_y - 128:center_y + 128, center_x - 128:center_x + 128]
-
-    # Convert to HSV color space
-    hsv_image = cv2.cvtColor(cropped_image, cv2.COLOR_BGR2HSV)
-
-    # Extract histograms for H, S, and V channels
-    h_hist = cv2.calcHist([hsv_image], [0], None, [256], [0, 256])
-    s_hist = cv2.calcHist([hsv_image], [1], None, [256], [0, 256])
-    v_hist = cv2.calcHist([hsv_image], [2], None, [256], [0, 256])
-
-    # Normalize histograms
-    h_hist = h_hist / h_hist.sum()
-    s_hist = s_hist / s_hist.sum()
-    v_hist = v_hist / v_hist.sum()
-    h_hist, s_hist, v_hist, cropped_image = process_image(image_path)
-    display_histograms(h_hist, s_hist, v_hist, cropped_image)
-
-    return display_histograms(h_hist, s_hist, v_hist, cropped_image)
+# Shared HSV-histogram kernel, identical to the one the server uses
+sys.path.append(os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../server-py')))
+from src.ml.features import extract_features, FEATURE_NAMES, FEATURE_SIZE
+from feature_store import FeatureStore, file_signature, is_frame_path
 
 # Function to resize, center crop, and extract HSV histogram
 def process_image(image_path):
     # Load the image
     image = cv2.imread(image_path)
 
-    # Resize the image to 512x512
-    resized_image = cv2.resize(image, (512, 512))
-
-    # Center crop to 256x256
-    center_x, center_y = resized_image.shape[1] // 2, resized_image.shape[0] // 2
-    cropped_image = resized_image[center_y - 128:center_y + 128, center_x - 128:center_x + 128]
-
-    # Convert to HSV color space
-    hsv_image = cv2.cvtColor(cropped_image, cv2.COLOR_BGR2HSV)
+    # Same 768-bin kernel the server uses for prediction
+    return extract_features(image)
 
-    # Extract histograms for H, S, and V channels
-    h_hist = cv2.calcHist([hsv_image], [0], None, [256], [0, 256]).flatten()
-    s_hist = cv2.calcHist([hsv_image], [1], None, [256], [0, 256]).flatten()
-    v_hist = cv2.calcHist([hsv_image], [2], None, [256], [0, 256]).flatten()
+# Labels for folders
+folder_labels = {'N': 0, 'K': 1, 'R': 2, 'G': 3}
+image_extensions = ('.png', '.jpg', '.jpeg', '.bmp', '.tiff')
 
-    # Normalize histograms
-    h_hist = h_hist / h_hist.sum()
-    s_hist = s_hist / s_hist.sum()
-    v_hist = v_hist / v_hist.sum()
-
-    # Concatenate all features into a single array
-    features = np.concatenate([h_hist, s_hist, v_hist])
-
-    return features
-
-# Function to process images from folders and save to CSV
-def process_images_from_folders(base_path, output_csv):
-    # Labels for folders
-    folder_labels = {'N': 0, 'K': 1, 'R': 2, 'G': 3}
-
-    # List to store image features and labels
-    data = []
-
-    # Loop over each folder
+def list_labelled_images(base_path):
+    # Deterministic (path, label) list; row i of the output always belongs to entry i
+    tasks = []
     for folder_name, label in folder_labels.items():
         folder_path = os.path.join(base_path, folder_name)
-
         if os.path.exists(folder_path):
-            print(f'Processing folder {folder_name}...')
-
-            # Process each image in the folder
-            for image_name in tqdm(os.listdir(folder_path)):
-                image_path = os.path.join(folder_path, image_name)
-
-                # Process the image and extract features
-                features = process_image(image_path)
-
-                # Append the features and label to the data list
-                data.append(np.append(features, label))
-
-    # Convert data to a Pandas DataFrame
-    columns = [f'H_{i}' for i in range(256)] + [f'S_{i}' for i in range(256)] + [f'V_{i}' for i in range(256)] + ['Label']
-    df = pd.DataFrame(data, columns=columns)
-
-    # Save the DataFrame to CSV
-    df.to_csv(output_csv, index=False)
+            for image_name in sorted(os.listdir(folder_path)):
+                if image_name.lower().endswith(image_extensions):
+                    tasks.append((os.path.join(folder_path, image_name), label))
+    return tasks
+
+def write_manifest(manifest_path, tasks):
+    with open(manifest_path, 'w', newline='') as manifest_file:
+        writer = csv.writer(manifest_file)
+        writer.writerow(['path', 'label'])
+        writer.writerows(tasks)
+
+def read_manifest(manifest_path):
+    # (path, label) list written by random.py; used instead of walking the folders
+    with open(manifest_path, newline='') as manifest_file:
+        return [(row['path'], int(row['label'])) for row in csv.DictReader(manifest_file)]
+
+def init_worker():
+    # One OpenCV thread per process; the pool provides the parallelism
+    cv2.setNumThreads(1)
+
+def extract_chunk(chunk):
+    indices, image_paths = chunk
+    features = np.zeros((len(image_paths), FEATURE_SIZE), dtype=np.float32)
+    ok = np.ones(len(image_paths), dtype=bool)
+    for row, image_path in enumerate(image_paths):
+        image = cv2.imread(image_path)
+        if image is None:
+            ok[row] = False
+            continue
+        extract_features(image, out=features[row])
+    return indices, features, ok
+
+def tasks_fingerprint(tasks):
+    digest = hashlib.sha256()
+    for image_path, label in tasks:
+        digest.update(f'{image_path}\t{label}\n'.encode())
+    return digest.hexdigest()
+
+def open_outputs(output_prefix, tasks):
+    # features/labels are preallocated .npy memmaps; <prefix>.done.npy marks finished rows
+    features_path = f'{output_prefix}.npy'
+    labels_path = f'{output_prefix}_labels.npy'
+    done_path = f'{output_prefix}.done.npy'
+    checkpoint_path = f'{output_prefix}.checkpoint.json'
+    count = len(tasks)
+    fingerprint = tasks_fingerprint(tasks)
+    os.makedirs(os.path.dirname(os.path.abspath(output_prefix)), exist_ok=True)
+
+    resume = False
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+        resume = checkpoint.get('fingerprint') == fingerprint and all(os.path.exists(p) for p in (features_path, labels_path, done_path))
+
+    if resume:
+        features = np.load(features_path, mmap_mode='r+')
+        labels = np.load(labels_path, mmap_mode='r+')
+        done = np.load(done_path, mmap_mode='r+')
+    else:
+        features = np.lib.format.open_memmap(features_path, mode='w+', dtype=np.float32, shape=(count, FEATURE_SIZE))
+        labels = np.lib.format.open_memmap(labels_path, mode='w+', dtype=np.int8, shape=(count,))
+        done = np.lib.format.open_memmap(done_path, mode='w+', dtype=np.uint8, shape=(count,))
+        with open(checkpoint_path, 'w') as checkpoint_file:
+            json.dump({'fingerprint': fingerprint, 'count': count}, checkpoint_file)
+    return features, labels, done
+
+def flush_outputs(features, labels, done):
+    # Rows are flushed before the done mask so a resumed run never trusts unwritten rows
+    features.flush()
+    labels.flush()
+    done.flush()
+
+# Function to extract a list of (path, label) tasks into a float32 feature matrix
+def extract_to_memmap(tasks, output_prefix, workers=None, chunk_size=64, checkpoint_every=16):
+    features, labels, done = open_outputs(output_prefix, tasks)
+
+    pending = np.flatnonzero(done == 0)
+    if len(pending) < len(tasks):
+        print(f'Resuming: {len(tasks) - len(pending)} of {len(tasks)} images already extracted')
+
+    chunks = [
+        (indices, [tasks[i][0] for i in indices])
+        for indices in (pending[start:start + chunk_size] for start in range(0, len(pending), chunk_size))
+    ]
+
+    failed = 0
+    with Pool(processes=workers or os.cpu_count(), initializer=init_worker) as pool:
+        with tqdm(total=len(tasks), initial=len(tasks) - len(pending), unit='img') as progress:
+            # Chunks finish in any order; each result is written back at its own row indices
+            for n, (indices, chunk_features, ok) in enumerate(pool.imap_unordered(extract_chunk, chunks), start=1):
+                features[indices] = chunk_features
+                labels[indices] = np.where(ok, [tasks[i][1] for i in indices], -1)
+                done[indices] = 1
+                failed += int((~ok).sum())
+                progress.update(len(indices))
+                if n % checkpoint_every == 0:
+                    flush_outputs(features, labels, done)
+    flush_outputs(features, labels, done)
+
+    if failed:
+        print(f'Could not load {failed} images; their rows are labelled -1')
+    return features, labels
+
+def remove_outputs(output_prefix):
+    for suffix in ('.npy', '_labels.npy', '.done.npy', '.checkpoint.json'):
+        if os.path.exists(output_prefix + suffix):
+            os.remove(output_prefix + suffix)
+
+# Function to bring the feature store up to date with the images in the folders (or a manifest)
+def update_store(store_path, base_path, workers=None, chunk_size=64, manifest=None):
+    store = FeatureStore(store_path)
+    known = store.active_signatures()
+
+    # Only new or changed images are extracted; rows for unchanged images are kept as they are
+    tasks, records, seen = [], [], set()
+    for image_path, label in (read_manifest(manifest) if manifest else list_labelled_images(base_path)):
+        path = os.path.abspath(image_path)
+        seen.add(path)
+        size, mtime_ns = file_signature(path)
+        if known.get(path) != (size, mtime_ns):
+            tasks.append((path, label))
+            records.append({'path': path, 'label': label, 'size': size, 'mtime_ns': mtime_ns})
+    # Rows from other folders, or from stream_pipeline.py, in the same store are left alone.
+    # A manifest defines the whole file-based subset, so anything not listed in it is retired.
+    root = '' if manifest else os.path.join(os.path.abspath(base_path), '')
+    removed = [path for path in known if path.startswith(root) and not is_frame_path(path) and path not in seen]
+
+    if tasks:
+        # Staging memmaps carry the resume checkpoint until the rows are committed to the store
+        staging_prefix = os.path.join(store_path, 'staging')
+        features, labels = extract_to_memmap(tasks, staging_prefix, workers, chunk_size)
+        for record, label in zip(records, labels):
+            record['label'] = int(label)
+        store.append(features, labels, records, deactivate=removed)
+        del features, labels
+        remove_outputs(staging_prefix)
+    elif removed:
+        store.append(np.empty((0, FEATURE_SIZE), dtype=np.float32), np.empty(0, dtype=np.int8), [], deactivate=removed)
+
+    print(f'{len(tasks)} new or changed images, {len(removed)} removed; {int(store.active_mask().sum())} active rows in {store_path}')
+    return store
+
+# Function to process images from folders into a standalone float32 feature matrix
+def process_images_from_folders(base_path, output_prefix, workers=None, chunk_size=64, checkpoint_every=16):
+    tasks = list_labelled_images(base_path)
+    features, labels = extract_to_memmap(tasks, output_prefix, workers, chunk_size, checkpoint_every)
+    print(f'Saved histogram features to {output_prefix}.npy')
+    return features, labels
+
+def export_csv(features, labels, output_csv, chunk_rows=10000):
+    # Stream the memmap out in chunks instead of building one huge DataFrame
+    columns = FEATURE_NAMES + ['Label']
+    with open(output_csv, 'w', newline='') as csv_file:
+        csv_file.write(','.join(columns) + '\n')
+        for start in range(0, len(labels), chunk_rows):
+            chunk_labels = np.asarray(labels[start:start + chunk_rows])
+            keep = chunk_labels >= 0
+            frame = pd.DataFrame(np.asarray(features[start:start + chunk_rows])[keep], columns=FEATURE_NAMES)
+            frame['Label'] = chunk_labels[keep]
+            frame.to_csv(csv_file, header=False, index=False)
     print(f'Saved histogram features to {output_csv}')
 
-# Example usage
-base_path = '../data/datasets_augment_random'  # The base directory containing folders A, B, C, and D
-output_csv = 'hsv_histogram_features.csv'  # Output CSV file path
-process_images_from_folders(base_path, output_csv)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Extract 768-bin HSV histogram features from the N/K/R/G folders')
+    parser.add_argument('--base-path', default='../data/datasets_augment_random')  # The base directory containing folders N, K, R and G
+    parser.add_argument('--manifest', default='')                                 # path,label list from random.py, used instead of --base-path
+    parser.add_argument('--store', default='feature_store')                       # Feature store read by the training scripts
+    parser.add_argument('--csv', default='')                                      # Optional CSV export of the active rows
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int, default=64)
+    args = parser.parse_args()
+
+    store = update_store(args.store, args.base_path, args.workers, args.chunk_size, args.manifest or None)
+    if args.csv:
+        X, y = store.load()
+        export_csv(X, y, args.csv)
@@ -0,0 +1,154 @@
+import numpy as np
+import struct
+import json
+import sys
+import csv
+import re
+import os
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../server-py'))
+from src.ml.features import FEATURE_SIZE, FEATURE_NAMES
+
+# Columnar feature store that replaces hsv_histogram_features.csv:
+#
+#   <store>/features.npy   float32 (rows, 768), opened zero-copy with np.load(mmap_mode='r')
+#   <store>/labels.npy     int8 (rows,)
+#   <store>/manifest.csv   path, label, size, mtime_ns, active - one line per row
+#   <store>/store.json     committed row count
+#
+# Rows are only ever appended. When a source image changes or disappears its old
+# row is marked inactive in the manifest instead of being rewritten.
+
+MANIFEST_FIELDS = ['path', 'label', 'size', 'mtime_ns', 'active']
+
+# Fixed-size .npy header so the shape can be rewritten in place as rows are appended
+NPY_HEADER_SIZE = 128
+
+def _write_npy_header(npy_file, dtype, shape):
+    header = repr({'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)), 'fortran_order': False, 'shape': tuple(shape)}).encode('latin1')
+    padding = NPY_HEADER_SIZE - 10 - len(header) - 1
+    npy_file.seek(0)
+    npy_file.write(np.lib.format.magic(1, 0))
+    npy_file.write(struct.pack('<H', NPY_HEADER_SIZE - 10))
+    npy_file.write(header + b' ' * padding + b'\n')
+
+def _create_npy(path, dtype, row_shape):
+    with open(path, 'wb') as npy_file:
+        _write_npy_header(npy_file, dtype, (0, *row_shape))
+
+def _append_npy(path, rows, committed_rows):
+    # Drop anything past the committed row count (an interrupted append), then extend
+    row_bytes = rows.dtype.itemsize * int(np.prod(rows.shape[1:], dtype=np.int64))
+    with open(path, 'r+b') as npy_file:
+        npy_file.truncate(NPY_HEADER_SIZE + committed_rows * row_bytes)
+        npy_file.seek(0, os.SEEK_END)
+        npy_file.write(np.ascontiguousarray(rows).tobytes())
+        _write_npy_header(npy_file, rows.dtype, (committed_rows + len(rows), *rows.shape[1:]))
+
+# Rows produced by in-memory augmentation (stream_pipeline.py) have no file of their own;
+# their path is "<raw image path>#A<n>", the _A<n> numbering augmentation.py uses for files
+FRAME_PATH = re.compile(r'#A\d+$')
+
+def frame_path(image_path, combination_index):
+    return f'{image_path}#A{combination_index + 1}'
+
+def is_frame_path(path):
+    return FRAME_PATH.search(path) is not None
+
+def file_signature(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+class FeatureStore:
+    """Append-only float32 features + int8 labels + per-row manifest in one directory."""
+
+    def __init__(self, path):
+        self.path = path
+        self.features_path = os.path.join(path, 'features.npy')
+        self.labels_path = os.path.join(path, 'labels.npy')
+        self.manifest_path = os.path.join(path, 'manifest.csv')
+        self.meta_path = os.path.join(path, 'store.json')
+        if not os.path.exists(self.meta_path):
+            os.makedirs(path, exist_ok=True)
+            _create_npy(self.features_path, np.float32, (FEATURE_SIZE,))
+            _create_npy(self.labels_path, np.int8, ())
+            self._write_manifest([])
+            self._commit(0)
+        with open(self.meta_path) as meta_file:
+            self.rows = json.load(meta_file)['rows']
+        self.manifest = self._read_manifest()
+
+    def _commit(self, rows):
+        # store.json is the commit point: rows past this count are ignored and overwritten
+        tmp_path = self.meta_path + '.tmp'
+        with open(tmp_path, 'w') as meta_file:
+            json.dump({'rows': rows, 'feature_size': FEATURE_SIZE}, meta_file)
+        os.replace(tmp_path, self.meta_path)
+        self.rows = rows
+
+    def _read_manifest(self):
+        with open(self.manifest_path, newline='') as manifest_file:
+            records = [
+                {'path': r['path'], 'label': int(r['label']), 'size': int(r['size']), 'mtime_ns': int(r['mtime_ns']), 'active': r['active'] == '1'}
+                for r in csv.DictReader(manifest_file)
+            ]
+        return records[:self.rows]
+
+    def _write_manifest(self, records):
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w', newline='') as manifest_file:
+            writer = csv.DictWriter(manifest_file, fieldnames=MANIFEST_FIELDS)
+            writer.writeheader()
+            for record in records:
+                writer.writerow({**record, 'active': int(record['active'])})
+        os.replace(tmp_path, self.manifest_path)
+
+    def active_signatures(self):
+        # path -> (size, mtime_ns) of the row currently representing that file
+        return {r['path']: (r['size'], r['mtime_ns']) for r in self.manifest if r['active']}
+
+    def append(self, features, labels, records, deactivate=()):
+        """Appends rows (features, labels and their manifest records) and retires rows for the given paths."""
+        features = np.asarray(features, dtype=np.float32).reshape(-1, FEATURE_SIZE)
+        labels = np.asarray(labels, dtype=np.int8)
+        if not len(features) == len(labels) == len(records):
+            raise ValueError('features, labels and records must have the same length')
+
+        retired = set(deactivate) | {record['path'] for record in records}
+        manifest = [dict(r, active=r['active'] and r['path'] not in retired) for r in self.manifest]
+        manifest += [dict(record, active=True) for record in records]
+
+        _append_npy(self.features_path, features, self.rows)
+        _append_npy(self.labels_path, labels, self.rows)
+        self._write_manifest(manifest)
+        self._commit(self.rows + len(records))
+        self.manifest = manifest
+
+    def features(self):
+        # Zero-copy view over every committed row (active or not)
+        return np.load(self.features_path, mmap_mode='r')[:self.rows]
+
+    def labels(self):
+        return np.load(self.labels_path, mmap_mode='r')[:self.rows]
+
+    def active_mask(self):
+        return np.array([r['active'] and r['label'] >= 0 for r in self.manifest], dtype=bool)
+
+    def load(self):
+        """(X, y) for training: memmapped views when every row is active, otherwise the active rows."""
+        X, y = self.features(), self.labels()
+        mask = self.active_mask()
+        if mask.all():
+            return X, y
+        return X[mask], y[mask]
+
+    def compact(self):
+        # Rewrite the store with only the active rows (copied out before the files are truncated)
+        keep = np.array([r['active'] for r in self.manifest], dtype=bool)
+        X, y = np.array(self.features()[keep]), np.array(self.labels()[keep])
+        records = [r for r in self.manifest if r['active']]
+        _create_npy(self.features_path, np.float32, (FEATURE_SIZE,))
+        _create_npy(self.labels_path, np.int8, ())
+        self._commit(0)
+        self.manifest = []
+        self.append(X, y, records)
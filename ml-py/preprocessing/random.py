@@ -1,42 +1,70 @@
+import argparse
 import os
-import shutil
-from pathlib import Path
+import numpy as np
 
-# Input and output directories
-input_dir = '../data/datasets_augment_random'  # Replace with your root input folder
-output_dir = 'result2'  # Replace with your output folder
-os.makedirs(output_dir, exist_ok=True)
+from feature_extraction import folder_labels, image_extensions, write_manifest
 
-# Maximum number of images to copy from each subfolder
-max_images_per_folder = 1000
+# Input directory and output manifest
+input_dir = '../data/datasets_augment'  # Root folder with one subfolder per class (N, K, R, G)
+manifest_path = 'sample_manifest.csv'    # path,label per selected image; read by feature_extraction.py --manifest
 
-# File extensions to consider as images
-image_extensions = ('.png', '.jpg', '.jpeg', '.bmp', '.tiff')
+# Maximum number of images to select from each class folder
+max_images_per_folder = 1000
 
-# Function to copy images from subfolders
-def copy_images(input_dir, output_dir, max_images_per_folder):
-    # Traverse through all files in the input directory (including subfolders)
-    for root, dirs, files in os.walk(input_dir):
-        # Filter out image files
-        image_files = [file for file in files if file.lower().endswith(image_extensions)]
+# NOTE: this module shadows the standard library `random` for scripts run from this
+# folder, so it must stay import-safe and must not import `random` itself.
 
-        # Limit to the first `max_images_per_folder` images in the folder
-        selected_images = image_files[:max_images_per_folder]
+def list_class_images(class_dir):
+    # Every image under the class folder (including subfolders), in a stable order
+    image_paths = []
+    for root, dirs, files in os.walk(class_dir):
+        dirs.sort()
+        for file in sorted(files):
+            if file.lower().endswith(image_extensions):
+                image_paths.append(os.path.abspath(os.path.join(root, file)))
+    return image_paths
 
-        # Get the relative path of the current subfolder
-        relative_path = os.path.relpath(root, input_dir)
+def sample_images(input_dir, max_per_class, seed=0):
+    """Seeded random selection of up to `max_per_class` images from each class folder.
 
-        # Create the corresponding subfolder in the output directory
-        destination_subfolder = os.path.join(output_dir, relative_path)
-        os.makedirs(destination_subfolder, exist_ok=True)
+    Returns (path, label) pairs. The same seed and folder contents always give the same
+    sample, and each class is drawn independently so adding images to one class does not
+    change the others.
+    """
+    selected = []
+    for folder_name, label in folder_labels.items():
+        image_paths = list_class_images(os.path.join(input_dir, folder_name))
+        if len(image_paths) > max_per_class:
+            rng = np.random.default_rng([seed, label])
+            picks = np.sort(rng.choice(len(image_paths), size=max_per_class, replace=False))
+            image_paths = [image_paths[i] for i in picks]
+        selected += [(image_path, label) for image_path in image_paths]
+        print(f'{folder_name}: {len(image_paths)} images selected')
+    return selected
 
-        # Copy the selected images
-        for file in selected_images:
-            src_file_path = os.path.join(root, file)
-            dst_file_path = os.path.join(destination_subfolder, file)
+def materialize(selected, input_dir, output_dir, link='hardlink'):
+    # Recreates the subset as a folder tree of links instead of copies
+    make_link = os.link if link == 'hardlink' else os.symlink
+    for image_path, _ in selected:
+        destination = os.path.join(output_dir, os.path.relpath(image_path, os.path.abspath(input_dir)))
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        if os.path.lexists(destination):
+            os.remove(destination)
+        make_link(image_path, destination)
 
-            shutil.copy2(src_file_path, dst_file_path)
-            print(f"Copied: {src_file_path} -> {dst_file_path}")
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Select a seeded, stratified random subset of images per class and write it as a manifest')
+    parser.add_argument('--input-dir', default=input_dir)
+    parser.add_argument('--manifest', default=manifest_path)
+    parser.add_argument('--max-per-class', type=int, default=max_images_per_folder)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output-dir', default='')                                  # Optional: also lay the subset out as a folder tree
+    parser.add_argument('--link', choices=['hardlink', 'symlink'], default='hardlink')
+    args = parser.parse_args()
 
-# Execute the copying process
-copy_images(input_dir, output_dir, max_images_per_folder)
+    selected = sample_images(args.input_dir, args.max_per_class, args.seed)
+    write_manifest(args.manifest, selected)
+    print(f'Wrote {len(selected)} images to {args.manifest}')
+    if args.output_dir:
+        materialize(selected, args.input_dir, args.output_dir, args.link)
+        print(f'Linked the subset into {args.output_dir} ({args.link}s)')
@@ -0,0 +1,146 @@
+from multiprocessing import Pool
+import argparse
+import hashlib
+import cv2
+import os
+import numpy as np
+from tqdm import tqdm
+
+from augmentation import iter_augmentations, combinations
+from feature_extraction import folder_labels, list_labelled_images, init_worker, extract_features, FEATURE_SIZE
+from feature_store import FeatureStore, file_signature, frame_path, is_frame_path
+
+# Disk-free replacement for augmentation.py -> random.py -> feature_extraction.py:
+# raw images are augmented in memory and the frames go straight into the HSV
+# histogram kernel and the feature store. Nothing is written to datasets_augment
+# or result2, and features are computed on the frames themselves instead of on a
+# JPEG re-encode of them.
+#
+# Each store row is one (raw image, combination) pair, see feature_store.frame_path.
+
+def sample_combinations(image_key, per_image, seed=0):
+    # The sample only depends on (seed, image), so re-runs pick the same combinations
+    if per_image >= len(combinations):
+        return tuple(range(len(combinations)))
+    digest = hashlib.sha256(f'{seed}|sample|{image_key}'.encode()).digest()
+    rng = np.random.default_rng(int.from_bytes(digest[:8], 'little'))
+    return tuple(sorted(rng.choice(len(combinations), size=per_image, replace=False).tolist()))
+
+def augment_to_features(task):
+    image_path, image_key, keep, seed, dump_dir = task
+    features = np.zeros((len(keep), FEATURE_SIZE), dtype=np.float32)
+
+    image = cv2.imread(image_path)
+    if image is None:
+        return image_path, (), features[:0]
+
+    indices = []
+    for row, (i, combo, augmented_image) in enumerate(iter_augmentations(image, image_key, seed, keep=set(keep))):
+        extract_features(augmented_image, out=features[row])
+        indices.append(i)
+        if dump_dir:
+            # Debugging side output: the exact frames that were featurized
+            name = os.path.splitext(image_key)[0]
+            output_path = os.path.join(dump_dir, f'{name}_A{i + 1}.jpg')
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            cv2.imwrite(output_path, augmented_image)
+    return image_path, tuple(indices), features
+
+def image_quotas(image_keys, per_image, max_per_class, seed=0, label=None):
+    """Combinations to take from each of one class's images, at most `per_image` each.
+
+    `max_per_class` is split evenly over every image of the class rather than filled in
+    filename order; the images that get the remainder are a seeded pick, so a budget
+    smaller than the number of images still draws from across the whole class.
+    """
+    if max_per_class is None or not image_keys:
+        return [per_image] * len(image_keys)
+    base, extra = divmod(max_per_class, len(image_keys))
+    digest = hashlib.sha256(f'{seed}|quota|{label}'.encode()).digest()
+    rank = np.random.default_rng(int.from_bytes(digest[:8], 'little')).permutation(len(image_keys))
+    return [min(per_image, base + (1 if rank[i] < extra else 0)) for i in range(len(image_keys))]
+
+def plan_tasks(base_path, per_image, max_per_class, seed, known):
+    """Picks the (raw image, combinations) work for this run, in a deterministic order.
+
+    Sampling happens here instead of on a folder of files: every raw image contributes up
+    to `per_image` combinations and each class's `max_per_class` rows are spread over all
+    of its images (see image_quotas). Images whose selected rows are already active in the
+    store with the same size/mtime are skipped.
+    """
+    base = os.path.abspath(base_path)
+    by_label = {}
+    for image_path, label in list_labelled_images(base_path):
+        by_label.setdefault(label, []).append(os.path.abspath(image_path))
+
+    tasks, signatures, wanted = [], {}, set()
+    for label, paths in by_label.items():
+        image_keys = [os.path.relpath(path, base) for path in paths]
+        for path, image_key, quota in zip(paths, image_keys, image_quotas(image_keys, per_image, max_per_class, seed, label)):
+            if quota <= 0:
+                continue
+            keep = sample_combinations(image_key, quota, seed)
+
+            signature = file_signature(path)
+            frame_paths = [frame_path(path, i) for i in keep]
+            wanted.update(frame_paths)
+            if any(known.get(p) != signature for p in frame_paths):
+                tasks.append((path, image_key, keep, label))
+                signatures[path] = signature
+    return tasks, signatures, wanted
+
+def stream_to_store(store_path, base_path, per_image=256, max_per_class=None, seed=0, workers=None, dump_dir=None, commit_every=32):
+    store = FeatureStore(store_path)
+    root = os.path.join(os.path.abspath(base_path), '')
+    known = {p: s for p, s in store.active_signatures().items() if p.startswith(root) and is_frame_path(p)}
+
+    tasks, signatures, wanted = plan_tasks(base_path, per_image, max_per_class, seed, known)
+    removed = [p for p in known if p not in wanted]
+    labels = {path: label for path, _, _, label in tasks}
+
+    features, row_labels, records = [], [], []
+    def commit(deactivate=()):
+        if records or deactivate:
+            store.append(np.concatenate(features) if features else np.empty((0, FEATURE_SIZE), dtype=np.float32), row_labels, records, deactivate=deactivate)
+            features.clear()
+            row_labels.clear()
+            records.clear()
+
+    failed = 0
+    total_rows = sum(len(keep) for _, _, keep, _ in tasks)
+    work = [(path, image_key, keep, seed, dump_dir) for path, image_key, keep, _ in tasks]
+    # Ordered imap: rows land in the store in the same order on every run.
+    # Committing every few images makes an interrupted run resume where it stopped.
+    with Pool(processes=workers or os.cpu_count(), initializer=init_worker) as pool:
+        with tqdm(total=total_rows, unit='frame') as progress:
+            for n, (image_path, indices, image_features) in enumerate(pool.imap(augment_to_features, work), start=1):
+                if not indices:
+                    failed += 1
+                    continue
+                size, mtime_ns = signatures[image_path]
+                label = labels[image_path]
+                features.append(image_features)
+                row_labels.extend([label] * len(indices))
+                records.extend({'path': frame_path(image_path, i), 'label': label, 'size': size, 'mtime_ns': mtime_ns} for i in indices)
+                progress.update(len(indices))
+                if n % commit_every == 0:
+                    commit()
+    commit(deactivate=removed)
+
+    if failed:
+        print(f'Could not load {failed} raw images; they will be retried on the next run')
+    print(f'{len(tasks) - failed} raw images streamed, {len(removed)} rows retired; {int(store.active_mask().sum())} active rows in {store_path}')
+    return store
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Augment raw images in memory and write their HSV histogram features to the feature store')
+    parser.add_argument('--base-path', default='../data/datasets_raw')        # Raw images in N, K, R and G folders
+    parser.add_argument('--store', default='feature_store')
+    parser.add_argument('--per-image', type=int, default=len(combinations))   # Combinations sampled per raw image
+    parser.add_argument('--max-per-class', type=int, default=None)            # Row cap per class (random.py's max_images_per_folder)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--dump-dir', default='')                             # Optional: also write the sampled frames as JPEGs
+    args = parser.parse_args()
+
+    stream_to_store(args.store, args.base_path, args.per_image, args.max_per_class, args.seed, args.workers, args.dump_dir or None)
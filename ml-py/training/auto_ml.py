@@ -1,21 +1,182 @@
-#pip install pycaret
+from sklearn.model_selection import StratifiedKFold, ParameterSampler
+from scipy.stats import loguniform, uniform
+from multiprocessing import Pool
+import lightgbm as lgb
+import numpy as np
+import argparse
+import json
+import time
+import sys
+import os
 
-from pycaret.classification import *
-import pandas as pd
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../preprocessing'))
+from feature_store import FeatureStore, FEATURE_NAMES
+from training import params, store_path, load_rows, accuracy
 
-# Step 2: Load the data
-data = pd.read_csv('../preprocessing/hsv_histogram_features.csv')
+# Focused LightGBM search in place of PyCaret setup() + compare_models(), which spent
+# most of its time on classifier families that never beat LightGBM.
+#
+# Every trial is a stratified k-fold CV run of the training.py parameters with one
+# setting from the search space below. Trials run in parallel processes that all
+# open the same pre-binned Dataset, and a trial is pruned after any fold where it is
+# behind the median of the finished trials. Results go to trials.jsonl one line per
+# trial, so an interrupted search resumes where it stopped.
 
-# Step 3: Set up the PyCaret environment
-# 'Label' is the target column for classification
-clf_setup = setup(data, target='Label', verbose=False, session_id=123, data_split_stratify=True,fold=5)
-best_model = compare_models()
+tuning_dir = '../models/tuning'
 
-# Light Gradient Boosting Machine
+search_space = {
+    'num_leaves': [15, 31, 63, 127],
+    'learning_rate': loguniform(0.02, 0.3),
+    'max_depth': [-1, 6, 8, 12],
+    'feature_fraction': uniform(0.5, 0.5),   # 0.5 - 1.0
+}
+
+_worker_state = {}
+
+def init_worker(binary_path, folds, num_class, num_threads):
+    # Each worker loads the shared binned dataset once; folds are subsets of it that keep its bins
+    dataset = lgb.Dataset(binary_path, params={**params, 'num_class': num_class}).construct()
+    _worker_state.update(dataset=dataset, folds=folds, num_class=num_class, num_threads=num_threads)
+
+def run_trial(task):
+    trial_id, trial_params, prune_at = task
+    state = _worker_state
+    # multi_error on the binned validation fold gives the accuracy without touching raw features
+    train_params = {**params, **trial_params, 'metric': ['multi_logloss', 'multi_error'], 'num_class': state['num_class'], 'num_threads': state['num_threads']}
+
+    start = time.perf_counter()
+    scores, iterations = [], []
+    for k, (train_idx, valid_idx) in enumerate(state['folds']):
+        evals = {}
+        model = lgb.train(
+            train_params,
+            state['dataset'].subset(train_idx),
+            num_boost_round=1000,
+            valid_sets=[state['dataset'].subset(valid_idx)],
+            valid_names=['valid'],
+            callbacks=[lgb.early_stopping(stopping_rounds=20, first_metric_only=True, verbose=False), lgb.record_evaluation(evals)]
+        )
+        scores.append(1.0 - evals['valid']['multi_error'][model.best_iteration - 1])
+        iterations.append(model.best_iteration)
+        # Median pruning: stop once the running mean is behind the finished trials at this fold
+        if k < len(state['folds']) - 1 and prune_at[k] is not None and np.mean(scores) < prune_at[k]:
+            return {'trial': trial_id, 'params': trial_params, 'status': 'pruned', 'fold_scores': scores, 'iterations': iterations, 'seconds': time.perf_counter() - start}
+    return {'trial': trial_id, 'params': trial_params, 'status': 'complete', 'fold_scores': scores, 'iterations': iterations,
+            'accuracy': float(np.mean(scores)), 'seconds': time.perf_counter() - start}
+
+def read_json(path):
+    with open(path) as json_file:
+        return json.load(json_file)
+
+def read_trials(trials_path):
+    if not os.path.exists(trials_path):
+        return []
+    with open(trials_path) as trials_file:
+        return [json.loads(line) for line in trials_file if line.strip()]
+
+def prune_thresholds(trials, n_folds, min_trials):
+    # Median running-mean score of the completed trials after each fold (None until enough finished)
+    complete = [t['fold_scores'] for t in trials if t['status'] == 'complete']
+    if len(complete) < min_trials:
+        return [None] * n_folds
+    running = np.cumsum(complete, axis=1) / np.arange(1, n_folds + 1)
+    return np.median(running, axis=0).tolist()
+
+def sample_trials(n_trials, seed):
+    # Deterministic for a given seed, so trial i means the same parameters after a resume
+    return [{key: (round(float(value), 6) if isinstance(value, (float, np.floating)) else int(value)) for key, value in trial.items()}
+            for trial in ParameterSampler(search_space, n_iter=n_trials, random_state=seed)]
+
+def tune(store, output_dir, n_trials=40, n_folds=5, workers=None, seed=42, min_trials=5):
+    os.makedirs(output_dir, exist_ok=True)
+    trials_path = os.path.join(output_dir, 'trials.jsonl')
+    binary_path = os.path.join(output_dir, 'train.bin')
+
+    X, y, usable, is_test = load_rows(store)
+    train_rows = np.flatnonzero(usable & ~is_test)
+    num_class = len(np.unique(y[usable]))
+
+    # One binned Dataset for every trial and fold (rebuilt only when the training rows change)
+    meta_path = os.path.join(output_dir, 'train.json')
+    meta = {'store_rows': store.rows, 'train_rows': len(train_rows), 'n_folds': n_folds, 'seed': seed}
+    if not (os.path.exists(binary_path) and os.path.exists(meta_path) and read_json(meta_path) == meta):
+        if os.path.exists(binary_path):
+            os.remove(binary_path)
+        if os.path.exists(trials_path):
+            os.remove(trials_path)                                  # Old trials were scored on different folds
+        lgb.Dataset(X[train_rows], label=y[train_rows], feature_name=FEATURE_NAMES, params={**params, 'num_class': num_class}).save_binary(binary_path)
+        with open(meta_path, 'w') as meta_file:
+            json.dump(meta, meta_file)
+
+    labels = np.asarray(y[train_rows])
+    folds = list(StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=seed).split(np.zeros(len(labels)), labels))
+
+    trials = read_trials(trials_path)
+    done = {t['trial'] for t in trials}
+    pending = [(i, p) for i, p in enumerate(sample_trials(n_trials, seed)) if i not in done]
+    if done:
+        print(f'Resuming: {len(done)} of {n_trials} trials already finished')
+
+    workers = workers or os.cpu_count()
+    num_threads = max(1, os.cpu_count() // workers)
+    with Pool(processes=workers, initializer=init_worker, initargs=(binary_path, folds, num_class, num_threads)) as pool, \
+            open(trials_path, 'a') as trials_file:
+        # Keep `workers` trials in flight; each new one is submitted with the current pruning thresholds
+        in_flight = []
+        while pending or in_flight:
+            while pending and len(in_flight) < workers:
+                trial_id, trial_params = pending.pop(0)
+                in_flight.append(pool.apply_async(run_trial, ((trial_id, trial_params, prune_thresholds(trials, n_folds, min_trials)),)))
+            finished = next((r for r in in_flight if r.ready()), None)
+            if finished is None:
+                in_flight[0].wait(0.05)
+                continue
+            in_flight.remove(finished)
+            result = finished.get()
+            trials.append(result)
+            trials_file.write(json.dumps(result) + '\n')
+            trials_file.flush()
+            score = f"{result['accuracy'] * 100:.2f}%" if result['status'] == 'complete' else f"pruned after {len(result['fold_scores'])} folds"
+            print(f"trial {result['trial']:>3}: {score} in {result['seconds']:.1f}s {result['params']}")
+
+    return [t for t in trials if t['status'] == 'complete'], (X, y, usable, is_test, num_class)
+
+def train_best(best, data, model_path):
+    # Final model on every training row, for the mean early-stopped round count of the best trial
+    X, y, usable, is_test, num_class = data
+    train_idx, test_idx = np.flatnonzero(usable & ~is_test), np.flatnonzero(usable & is_test)
+    best_params = {**params, **best['params'], 'num_class': num_class}
+    model = lgb.train(best_params, lgb.Dataset(X[train_idx], label=y[train_idx], feature_name=FEATURE_NAMES),
+                      num_boost_round=int(np.mean(best['iterations'])))
+    model.save_model(model_path)
+    return model, accuracy(model, X[test_idx], y[test_idx])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Parallel k-fold LightGBM hyperparameter search over the feature store')
+    parser.add_argument('--store', default=store_path)
+    parser.add_argument('--output-dir', default=tuning_dir)                          # trials.jsonl, best_params.json, shared train.bin
+    parser.add_argument('--model', default='../models/lightgbm_tuned.txt')
+    parser.add_argument('--trials', type=int, default=40)
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    complete, data = tune(FeatureStore(args.store), args.output_dir, args.trials, args.folds, args.workers, args.seed)
+    best = max(complete, key=lambda t: t['accuracy'])
+    with open(os.path.join(args.output_dir, 'best_params.json'), 'w') as params_file:
+        json.dump(best['params'], params_file, indent=2)
+    print(f"Best trial {best['trial']}: {best['accuracy'] * 100:.2f}% CV accuracy {best['params']}")
+
+    model, test_accuracy = train_best(best, data, args.model)
+    print(f"Model saved as '{args.model}', accuracy on the held-out split {test_accuracy * 100:.2f}%")
+    print(f"Use these parameters for training.py with --params {os.path.join(args.output_dir, 'best_params.json')}")
+
+# PyCaret compare_models baseline - Light Gradient Boosting Machine
 # Accuracy = 0.9554
 # AUC      = 0.9958
 # Recall   = 0.9554
 # Prec.    = 0.9557
 # F1       = 0.9554
 # Kappa	   = 0.9405
-# MCC      = 0.9406
\ No newline at end of file
+# MCC      = 0.9406
@@ -1,58 +1,181 @@
-from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score
 import lightgbm as lgb
-import pandas as pd
+import numpy as np
+import argparse
+import hashlib
+import json
+import time
+import sys
+import os
 
-# Load your data
-data = pd.read_csv('../preprocessing/hsv_histogram_features.csv')
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../preprocessing'))
+from feature_store import FeatureStore, FEATURE_NAMES
 
-# Separate features and target labels
-X = data.drop(columns=['Label'])  # Features
-y = data['Label']  # Target
-
-# Perform an 80:20 train-test split with stratification
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.20, random_state=42, stratify=y)
-
-# Convert data to LightGBM dataset
-train_data = lgb.Dataset(X_train, label=y_train)
-test_data = lgb.Dataset(X_test, label=y_test, reference=train_data)
+store_path = '../preprocessing/feature_store'
+model_path = '../models/lightgbm_model.txt'
+cache_dir = '../models/dataset_cache'    # Binned LightGBM datasets (save_binary) + training_state.json
 
 # Define LightGBM parameters (this is just an example, you can adjust as needed)
 params = {
     'objective': 'multiclass',
-    'num_class': len(y.unique()),  # Number of classes in the dataset
     'metric': 'multi_logloss',
     'boosting_type': 'gbdt',
     'learning_rate': 0.1,
     'num_leaves': 31,
     'max_depth': -1,
-    'random_state': 42
+    'random_state': 42,
+    'verbose': -1
 }
 
-# Train the LightGBM model with early stopping
-model = lgb.train(
-    params,
-    train_data,
-    num_boost_round=100,  # Number of boosting iterations
-    valid_sets=[train_data, test_data],
-    valid_names=['train', 'test'],
-    callbacks=[lgb.early_stopping(stopping_rounds=10)]  # Early stopping callback
-)
-
-# Save the trained model
-model.save_model('../models/lightgbm_model.txt')
-print("Model saved as 'lightgbm_model.txt'.")
-
-# Load the saved model
-loaded_model = lgb.Booster(model_file='../models/lightgbm_model.txt')
-print("Model loaded successfully.")
-
-# Predict on the test set using the loaded model
-y_pred_loaded = loaded_model.predict(X_test, num_iteration=loaded_model.best_iteration)
-y_pred_labels_loaded = [list(x).index(max(x)) for x in y_pred_loaded]  # Convert probability to class label
-
-# Evaluate the accuracy of the loaded model
-accuracy_loaded = accuracy_score(y_test, y_pred_labels_loaded)
-print(f'Accuracy of loaded model: {accuracy_loaded * 100:.2f}%')
-
-# Accuracy of loaded model: 96.38%
\ No newline at end of file
+def test_mask(paths, test_size=0.20):
+    # 80:20 split by a hash of the image path: a row stays on the same side of the split
+    # as the store grows, so incremental runs never train on an earlier test row
+    buckets = np.array([int.from_bytes(hashlib.sha1(path.encode()).digest()[:4], 'little') % 10000 for path in paths])
+    return buckets < test_size * 10000
+
+def load_rows(store):
+    # Row index -> split side for every trainable row (active, readable) in the store
+    X, y = store.features(), store.labels()
+    usable = store.active_mask()
+    is_test = test_mask([r['path'] for r in store.manifest])
+    return X, y, usable, is_test
+
+def retired_rows(store, upto):
+    # Labelled rows among the first `upto` that are no longer active
+    return sum(not r['active'] and r['label'] >= 0 for r in store.manifest[:upto])
+
+def accuracy(model, X, y):
+    return accuracy_score(y, np.argmax(model.predict(X, num_iteration=model.best_iteration), axis=1))
+
+def read_state(cache_dir):
+    state_path = os.path.join(cache_dir, 'training_state.json')
+    if not os.path.exists(state_path):
+        return None
+    with open(state_path) as state_file:
+        return json.load(state_file)
+
+def write_state(cache_dir, state):
+    with open(os.path.join(cache_dir, 'training_state.json'), 'w') as state_file:
+        json.dump(state, state_file, indent=2)
+
+def train_full(store, model_path, cache_dir, num_boost_round=100, save=True):
+    """Trains from scratch on every trainable row and caches the binned train dataset."""
+    start = time.perf_counter()
+    X, y, usable, is_test = load_rows(store)
+    train_idx, test_idx = np.flatnonzero(usable & ~is_test), np.flatnonzero(usable & is_test)
+
+    # Convert data to LightGBM dataset
+    train_data = lgb.Dataset(X[train_idx], label=y[train_idx], feature_name=FEATURE_NAMES, params=params)
+    test_data = lgb.Dataset(X[test_idx], label=y[test_idx], reference=train_data)
+
+    # Train the LightGBM model with early stopping
+    model = lgb.train(
+        {**params, 'num_class': len(np.unique(y[usable]))},
+        train_data,
+        num_boost_round=num_boost_round,  # Number of boosting iterations
+        valid_sets=[train_data, test_data],
+        valid_names=['train', 'test'],
+        callbacks=[lgb.early_stopping(stopping_rounds=10, verbose=False)]  # Early stopping callback
+    )
+    elapsed = time.perf_counter() - start
+    result = {'mode': 'full', 'seconds': elapsed, 'accuracy': accuracy(model, X[test_idx], y[test_idx]), 'train_rows': len(train_idx), 'test_rows': len(test_idx)}
+
+    if save:
+        # The binned train dataset fixes the bin boundaries that later incremental runs reuse
+        os.makedirs(cache_dir, exist_ok=True)
+        binary_path = os.path.join(cache_dir, 'train.bin')
+        if os.path.exists(binary_path):
+            os.remove(binary_path)
+        train_data.save_binary(binary_path)
+        model.save_model(model_path)
+        write_state(cache_dir, {'rows': store.rows, 'retired_rows': retired_rows(store, store.rows), 'full_rows': len(train_idx), 'incremental_rows': 0, 'incremental_runs': 0, 'num_class': model.num_model_per_iteration()})
+    return model, result
+
+def train_incremental(store, model_path, cache_dir, num_boost_round=20):
+    """Continues boosting the saved model on the rows appended to the store since the last run.
+
+    New rows are binned with the cached train dataset as reference, so they share the bin
+    boundaries of the model's original training data. Returns (None, None) when there is nothing
+    to add, and falls back to a full run when there is no model or cache yet.
+    """
+    state = read_state(cache_dir)
+    if state is None or not os.path.exists(model_path) or not os.path.exists(os.path.join(cache_dir, 'train.bin')):
+        print('No cached dataset or model yet; running a full training')
+        return train_full(store, model_path, cache_dir)
+
+    start = time.perf_counter()
+    X, y, usable, is_test = load_rows(store)
+    is_new = np.arange(store.rows) >= state['rows']
+    new_idx = np.flatnonzero(usable & is_new & ~is_test)
+    test_idx = np.flatnonzero(usable & is_test)
+    retired = retired_rows(store, state['rows']) - state['retired_rows']
+    if retired:
+        print(f'{retired} rows seen by the current model have since been retired; only a full retrain removes their influence')
+    if len(new_idx) == 0:
+        print('No new training rows since the last run')
+        return None, None
+
+    train_params = {**params, 'num_class': state['num_class']}
+    reference = lgb.Dataset(os.path.join(cache_dir, 'train.bin'), params=train_params)
+    new_data = lgb.Dataset(X[new_idx], label=y[new_idx], feature_name=FEATURE_NAMES, reference=reference)
+    # The test split grows with the store, so it is rebinned from the memmap (cheap next to training)
+    test_data = lgb.Dataset(X[test_idx], label=y[test_idx], reference=reference)
+
+    model = lgb.train(
+        train_params,
+        new_data,
+        num_boost_round=num_boost_round,
+        init_model=model_path,                # Boosting continues from the current model's trees
+        valid_sets=[test_data],
+        valid_names=['test'],
+        callbacks=[lgb.early_stopping(stopping_rounds=5, verbose=False)]
+    )
+    elapsed = time.perf_counter() - start
+    model.save_model(model_path)
+
+    state.update({'rows': store.rows, 'incremental_rows': state['incremental_rows'] + len(new_idx), 'incremental_runs': state['incremental_runs'] + 1})
+    write_state(cache_dir, state)
+    result = {'mode': 'incremental', 'seconds': elapsed, 'accuracy': accuracy(model, X[test_idx], y[test_idx]), 'train_rows': len(new_idx), 'test_rows': len(test_idx),
+              'drift': state['incremental_rows'] / max(state['full_rows'], 1)}
+    return model, result
+
+def report(result):
+    line = f"{result['mode']:>11}: {result['seconds']:.2f}s, accuracy {result['accuracy'] * 100:.2f}% on {result['test_rows']} test rows ({result['train_rows']} rows trained)"
+    if 'drift' in result:
+        line += f", {result['drift'] * 100:.1f}% of the data added since the last full rebuild"
+    print(line)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Train the HSV-histogram LightGBM model from the feature store')
+    parser.add_argument('--mode', choices=['full', 'incremental'], default='full')
+    parser.add_argument('--store', default=store_path)
+    parser.add_argument('--model', default=model_path)
+    parser.add_argument('--cache-dir', default=cache_dir)
+    parser.add_argument('--params', default='')              # JSON overrides, e.g. best_params.json from auto_ml.py
+    parser.add_argument('--rounds', type=int, default=None)   # Boosting rounds (full: 100, incremental: 20)
+    parser.add_argument('--compare', action='store_true')     # Incremental only: also time a full retrain (not saved) for reference
+    parser.add_argument('--max-accuracy-drop', type=float, default=0.5)  # Percentage points behind a full retrain before a rebuild is advised
+    args = parser.parse_args()
+
+    if args.params:
+        with open(args.params) as params_file:
+            params.update(json.load(params_file))
+
+    store = FeatureStore(args.store)
+    if args.mode == 'full':
+        model, result = train_full(store, args.model, args.cache_dir, args.rounds or 100)
+    else:
+        model, result = train_incremental(store, args.model, args.cache_dir, args.rounds or 20)
+    if result is not None:
+        print(f"Model saved as '{args.model}'.")
+        report(result)
+
+    if args.compare and result is not None and result['mode'] == 'incremental':
+        _, full_result = train_full(store, args.model, args.cache_dir, save=False)
+        report(full_result)
+        gap = (full_result['accuracy'] - result['accuracy']) * 100
+        print(f"Incremental is {full_result['seconds'] / result['seconds']:.1f}x faster; full retrain accuracy {gap:+.2f} points relative to incremental")
+        if gap > args.max_accuracy_drop:
+            print('A full rebuild is recommended (--mode full)')
+
+# Accuracy of loaded model: 96.38%
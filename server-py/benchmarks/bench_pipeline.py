@@ -0,0 +1,197 @@
+# Times every stage of the image -> label hot path on synthetic images. No MongoDB needed.
+#
+#   cd server-py
+#   python -m benchmarks.bench_pipeline [--quick] [--output results.json] [--baseline baseline.json]
+#
+# With --baseline the run exits non-zero when any median is both more than --tolerance
+# and more than --min-delta-ms slower than the stored result with the same name.
+# --quick runs still print the comparison but never fail: too few samples to gate on.
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from src.ml.model_loader import ModelHolder, DEFAULT_MODEL_PATH
+from src.ml.features import crop_center, hsv_histograms, extract_features, FEATURE_SIZE
+from src.ml.pipeline import decode_image, label_from_probabilities
+
+RESOLUTIONS = [(640, 480), (1280, 960), (1920, 1080), (4032, 3024)]
+BATCH_SIZES = [1, 8, 32, 128]
+
+def synthetic_jpeg(width, height, seed=0):
+    # Smooth color gradients plus noise: compresses like a photo rather than flat color or pure noise
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    image = np.stack([
+        127 + 100 * np.sin(x / width * np.pi * (1 + seed % 3)),
+        127 + 100 * np.cos(y / height * np.pi * 2),
+        127 + 100 * np.sin((x + y) / (width + height) * np.pi * 3),
+    ], axis=-1)
+    image += rng.normal(0, 12, image.shape)
+    ok, encoded = cv2.imencode(".jpg", np.clip(image, 0, 255).astype(np.uint8), [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return encoded.tobytes()
+
+def time_call(fn, repeat, warmup=2):
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1e3)
+    timings.sort()
+    return {
+        "median_ms": statistics.median(timings),
+        "p95_ms": timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        "min_ms": timings[0],
+        "repeat": repeat,
+    }
+
+def bench_stages(model, repeat, resolutions=RESOLUTIONS):
+    results = {}
+    for width, height in resolutions:
+        size = f"{width}x{height}"
+        image_bytes = synthetic_jpeg(width, height)
+        image = decode_image(image_bytes)
+        cropped = crop_center(image)
+        hsv_image = cv2.cvtColor(cropped, cv2.COLOR_BGR2HSV)
+        features = np.empty(FEATURE_SIZE, dtype=np.float32)
+        row = extract_features(image).reshape(1, -1)
+
+        results[f"decode/{size}"] = time_call(lambda: decode_image(image_bytes), repeat)
+        results[f"crop/{size}"] = time_call(lambda: crop_center(image), repeat)
+        results[f"hsv/{size}"] = time_call(lambda: cv2.cvtColor(cropped, cv2.COLOR_BGR2HSV), repeat)
+        results[f"histograms/{size}"] = time_call(lambda: hsv_histograms(hsv_image, features), repeat)
+        results[f"predict/{size}"] = time_call(lambda: model.predict(row), repeat)
+        # The whole single-image chain, as process_image_bytes runs it
+        results[f"end_to_end/{size}"] = time_call(lambda: label_from_probabilities(model.predict(extract_features(decode_image(image_bytes)).reshape(1, -1))[0]), repeat)
+    return results
+
+def bench_batches(model, repeat):
+    results = {}
+    rng = np.random.default_rng(0)
+    X = rng.dirichlet(np.full(256, 0.3), size=(max(BATCH_SIZES), 3)).reshape(-1, FEATURE_SIZE).astype(np.float32)
+    for batch_size in BATCH_SIZES:
+        batch = X[:batch_size]
+        result = time_call(lambda: model.predict(batch), repeat)
+        result["per_image_ms"] = result["median_ms"] / batch_size
+        results[f"predict_batch/{batch_size}"] = result
+    return results
+
+def bench_serving(requests, concurrency, model_path, backend):
+    # Inference pool + micro-batcher exactly as /blood/upload-image-prediction/ uses them, without HTTP or Mongo
+    from src.ml.executor import InferencePool, decode_and_extract, predict_matrix
+    from src.ml.batcher import PredictionBatcher
+
+    pool = InferencePool(workers=os.cpu_count() or 1, queue_size=requests, model_path=model_path, backend=backend)
+    batcher = PredictionBatcher(predict_fn=lambda X: pool.run(predict_matrix, X))
+    payloads = [synthetic_jpeg(1280, 960, seed) for seed in range(8)]
+
+    async def one(i, semaphore):
+        async with semaphore:
+            with pool.admit():
+                features = await pool.run(decode_and_extract, payloads[i % len(payloads)])
+                return await batcher.predict(features)
+
+    async def run():
+        pool.start()
+        await batcher.start()
+        try:
+            semaphore = asyncio.Semaphore(concurrency)
+            await asyncio.gather(*(one(i, semaphore) for i in range(concurrency)))                 # Warm-up
+            start = time.perf_counter()
+            await asyncio.gather(*(one(i, semaphore) for i in range(requests)))
+            return time.perf_counter() - start
+        finally:
+            await batcher.stop()
+            pool.shutdown()
+
+    elapsed = asyncio.run(run())
+    return {f"serving/c{concurrency}": {"median_ms": elapsed / requests * 1e3, "requests_per_second": requests / elapsed,
+                                        "mean_batch": batcher.stats()["mean_batch_size"], "repeat": requests}}
+
+def compare(results, baseline, tolerance, min_delta_ms=0.0):
+    """Names whose median got more than `tolerance` (fraction) and `min_delta_ms` slower than the baseline."""
+    regressions = []
+    print(f"{'benchmark':<28} {'baseline ms':>12} {'current ms':>11} {'change':>8}")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name]["median_ms"], result["median_ms"]
+        change = after / before - 1 if before else 0.0
+        flag = ""
+        # Sub-millisecond stages swing by tens of percent on noise alone; require a real absolute delta too
+        if change > tolerance and after - before > min_delta_ms:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<28} {before:>12.3f} {after:>11.3f} {change:>+8.1%}{flag}")
+    return regressions
+
+def environment(holder):
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "cpu_count": os.cpu_count(),
+        "machine": platform.machine(),
+        "model": holder.identity(),
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--backend", default="lightgbm", choices=["lightgbm", "numpy"])
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--quick", action="store_true", help="15 repeats, smallest two resolutions; compares but never fails")
+    parser.add_argument("--serving-requests", type=int, default=256)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--output", default="", help="Write the results as JSON")
+    parser.add_argument("--baseline", default="", help="JSON from an earlier --output run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown before failing, as a fraction")
+    parser.add_argument("--min-delta-ms", type=float, default=0.05, help="Slowdowns smaller than this many ms never fail")
+    args = parser.parse_args()
+
+    resolutions, repeat = (RESOLUTIONS[:2], 15) if args.quick else (RESOLUTIONS, args.repeat)
+
+    holder = ModelHolder(args.model, args.backend)
+    holder.load()
+    cv2.setNumThreads(1)                                                                            # Same as one inference worker
+
+    results = {}
+    results.update(bench_stages(holder, repeat, resolutions))
+    results.update(bench_batches(holder, repeat))
+    results.update(bench_serving(args.serving_requests // (8 if args.quick else 1), args.concurrency, args.model, args.backend))
+
+    for name, result in results.items():
+        print(f"{name:<28} median {result['median_ms']:>9.3f} ms   p95 {result.get('p95_ms', result['median_ms']):>9.3f} ms")
+
+    report = {"environment": environment(holder), "results": results}
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline["environment"]["model"]["sha256"] != holder.sha256:
+            print("Warning: the baseline was recorded with a different model file")
+        regressions = compare(results, baseline["results"], args.tolerance, args.min_delta_ms)
+        if regressions and args.quick:
+            print(f"{len(regressions)} possible regressions ({', '.join(regressions)}); not gating a --quick run")
+        elif regressions:
+            print(f"{len(regressions)} benchmarks regressed by more than {args.tolerance:.0%} and {args.min_delta_ms} ms: {', '.join(regressions)}")
+            sys.exit(1)
+        else:
+            print("No regressions against the baseline")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+# Compares the pure-NumPy CompiledForest with the native LightGBM Booster.
+#
+#   cd server-py
+#   python -m benchmarks.bench_tree_model [--repeat 20]
+
+import argparse
+import time
+
+import lightgbm as lgb
+import numpy as np
+
+from src.ml.model_loader import DEFAULT_MODEL_PATH
+from src.ml.tree_compiler import CompiledForest
+
+BATCH_SIZES = [1, 4, 16, 64, 256, 1024]
+
+def histogram_rows(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.dirichlet(np.full(256, 0.3), size=(n, 3)).reshape(n, 768).astype(np.float32)
+
+def best_time(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    booster = lgb.Booster(model_file=args.model)
+    booster_load = time.perf_counter() - start
+    start = time.perf_counter()
+    forest = CompiledForest.from_file(args.model)
+    forest_load = time.perf_counter() - start
+    print(f"load: booster {booster_load * 1e3:.1f} ms, numpy {forest_load * 1e3:.1f} ms")
+
+    X = histogram_rows(max(BATCH_SIZES))
+    print(f"{'batch':>6} {'booster ms':>11} {'numpy ms':>9} {'ratio':>6} {'max |diff|':>11}")
+    for batch_size in BATCH_SIZES:
+        batch = X[:batch_size]
+        native = booster.predict(batch, num_iteration=booster.best_iteration)
+        compiled = forest.predict(batch, num_iteration=booster.best_iteration)
+        booster_time = best_time(lambda: booster.predict(batch, num_iteration=booster.best_iteration), args.repeat)
+        forest_time = best_time(lambda: forest.predict(batch, num_iteration=booster.best_iteration), args.repeat)
+        print(f"{batch_size:>6} {booster_time * 1e3:>11.3f} {forest_time * 1e3:>9.3f} {forest_time / booster_time:>6.2f} {np.abs(native - compiled).max():>11.2e}")
+
+if __name__ == "__main__":
+    main()
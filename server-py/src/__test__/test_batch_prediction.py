@@ -0,0 +1,74 @@
+from fastapi import FastAPI
+from httpx import AsyncClient, ASGITransport
+import numpy as np
+import pytest
+import cv2
+
+from src.routers import blood
+from src.auth.auth import get_current_user
+from src.ml.executor import InferencePool
+from src.ml.prediction_cache import PredictionCache
+
+def photo(seed):
+    rng = np.random.default_rng(seed)
+    image = rng.integers(0, 256, size=(300, 400, 3), dtype=np.uint8)
+    return cv2.imencode(".jpg", image)[1].tobytes()
+
+@pytest.fixture
+def batch_client(monkeypatch):
+    pool = InferencePool(kind="thread", workers=1, queue_size=2)
+    monkeypatch.setattr(blood, "inference_pool", pool)
+    monkeypatch.setattr(blood, "prediction_cache", PredictionCache(max_entries=16, ttl_seconds=60, model_identity=lambda: "test"))
+    app = FastAPI()
+    app.include_router(blood.router, prefix="/blood")
+    yield AsyncClient(transport=ASGITransport(app=app), base_url="http://test"), pool, app
+    pool.shutdown()
+
+def files(count):
+    return [("images", (f"{i}.jpg", photo(i), "image/jpeg")) for i in range(count)]
+
+@pytest.mark.asyncio
+async def test_batch_prediction_counts_labels(batch_client):
+    client, pool, _ = batch_client
+    async with client:
+        response = await client.post("/blood/upload-images-prediction/", files=files(3))
+    assert response.status_code == 200
+    body = response.json()
+    assert [p["filename"] for p in body["predictions"]] == ["0.jpg", "1.jpg", "2.jpg"]
+    assert body["total"] == 3
+    assert sum(body[name] for name in ("green", "normal", "red", "kun")) == 3
+    assert body["saved"] is None
+    assert pool.stats()["in_flight"] == 0
+
+@pytest.mark.asyncio
+async def test_batch_admission_counts_every_image(batch_client):
+    client, pool, _ = batch_client
+    async with client:
+        # One image already in flight leaves two of the three slots free
+        with pool.admit():
+            rejected = await client.post("/blood/upload-images-prediction/", files=files(3))
+            admitted = await client.post("/blood/upload-images-prediction/", files=files(2))
+    assert rejected.status_code == 503
+    assert rejected.headers["retry-after"] == "1"
+    assert admitted.status_code == 200
+    assert pool.stats()["rejected_total"] == 1
+
+@pytest.mark.asyncio
+async def test_saving_requires_a_user(batch_client):
+    client, _, _ = batch_client
+    async with client:
+        response = await client.post("/blood/upload-images-prediction/", params={"save": "true"}, files=files(1))
+    assert response.status_code == 401
+
+@pytest.mark.asyncio
+async def test_model_and_stats_require_a_user(batch_client):
+    client, _, app = batch_client
+    async with client:
+        model = await client.get("/blood/model")
+        stats = await client.get("/blood/stats")
+        app.dependency_overrides[get_current_user] = lambda: {"_id": "u1"}
+        identity = await client.get("/blood/model")
+    assert model.status_code == stats.status_code == 401
+    assert identity.status_code == 200
+    assert "path" not in identity.json()
+    assert identity.json()["num_feature"] == 768
@@ -0,0 +1,52 @@
+import numpy as np
+import asyncio
+import pytest
+
+from src.ml.batcher import PredictionBatcher
+
+class RecordingModel:
+    def __init__(self):
+        self.batch_sizes = []
+
+    def predict(self, feature_matrix):
+        self.batch_sizes.append(len(feature_matrix))
+        # Row i scores its own first feature so results can be matched to callers
+        return np.repeat(feature_matrix[:, :1], 4, axis=1)
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_one_predict_call():
+    model = RecordingModel()
+    batcher = PredictionBatcher(model.predict, max_batch_size=32, max_wait_ms=50)
+
+    vectors = [np.full(768, i, dtype=np.float32) for i in range(10)]
+    results = await asyncio.gather(*(batcher.predict(vector) for vector in vectors))
+    await batcher.stop()
+
+    assert model.batch_sizes == [10]
+    assert [int(row[0]) for row in results] == list(range(10))
+    stats = batcher.stats()
+    assert stats["batches_total"] == 1
+    assert stats["rows_total"] == 10
+    assert stats["batch_size_counts"] == {10: 1}
+
+@pytest.mark.asyncio
+async def test_batches_are_capped_at_max_batch_size():
+    model = RecordingModel()
+    batcher = PredictionBatcher(model.predict, max_batch_size=4, max_wait_ms=50)
+
+    vectors = [np.full(768, i, dtype=np.float32) for i in range(10)]
+    results = await asyncio.gather(*(batcher.predict(vector) for vector in vectors))
+    await batcher.stop()
+
+    assert model.batch_sizes == [4, 4, 2]
+    assert [int(row[0]) for row in results] == list(range(10))
+
+@pytest.mark.asyncio
+async def test_predict_errors_reach_every_caller():
+    def failing_predict(feature_matrix):
+        raise RuntimeError("boom")
+
+    batcher = PredictionBatcher(failing_predict, max_wait_ms=1)
+    with pytest.raises(RuntimeError):
+        await batcher.predict(np.zeros(768, dtype=np.float32))
+    await batcher.stop()
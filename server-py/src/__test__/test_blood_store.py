@@ -0,0 +1,252 @@
+from fastapi import FastAPI
+from fastapi.middleware.cors import CORSMiddleware
+from httpx import AsyncClient, ASGITransport
+from datetime import date, datetime, timedelta
+import pytest
+
+from src import blood_store
+from src.auth.auth import get_current_user
+from src.routers import blood
+from src.blood_store import find_readings, find_rollups, increment_day, increment_days, reading_out, rollup_updates
+from src.migrations.blood_readings import merge_entries, reading_upserts
+from src.migrations import blood_rollups as rollups_migration
+
+class FakeCursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def sort(self, key, direction):
+        self.documents = sorted(self.documents, key=lambda document: document[key], reverse=direction < 0)
+        return self
+
+    def limit(self, count):
+        self.documents = self.documents[:count]
+        return self
+
+    def __aiter__(self):
+        self._iterator = iter(self.documents)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iterator)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    async def to_list(self, length):
+        return self.documents[:length]
+
+class FakeReadings:
+    def __init__(self, documents=()):
+        self.documents = list(documents)
+        self.queries = []
+        self.bulk_calls = []
+        self.updates = []
+
+    def find(self, query, projection=None):
+        self.queries.append(query)
+        date_range = query.get("date", {})
+        matches = [
+            document for document in self.documents
+            if document["user_id"] == query["user_id"]
+            and document["date"] in date_range.get("$in", [document["date"]])
+            and document["date"] >= date_range.get("$gte", datetime.min)
+            and document["date"] <= date_range.get("$lte", datetime.max)
+            and document["date"] < date_range.get("$lt", datetime.max)
+        ]
+        return FakeCursor(matches)
+
+    async def bulk_write(self, operations, ordered=True):
+        self.bulk_calls.append(len(operations))
+        for operation in operations:
+            self._inc(operation._filter, operation._doc)
+
+    async def find_one_and_update(self, query, update, upsert, projection, return_document):
+        self.updates.append(query)
+        return self._inc(query, update)
+
+    def _inc(self, query, update):
+        document = next((d for d in self.documents if d["user_id"] == query["user_id"] and d["date"] == query["date"]), None)
+        if document is None:
+            document = dict(query)
+            self.documents.append(document)
+        for field, value in update["$inc"].items():
+            document[field] = document.get(field, 0) + value
+        return document
+
+class FakeRollups:
+    def __init__(self):
+        self.buckets = {}
+
+    async def bulk_write(self, operations, ordered=True):
+        for operation in operations:
+            key = (operation._filter["user_id"], operation._filter["period"], operation._filter["start"])
+            bucket = self.buckets.setdefault(key, {"start": key[2]})
+            for field, value in operation._doc["$inc"].items():
+                bucket[field] = bucket.get(field, 0) + value
+
+    def find(self, query, projection=None):
+        start = query["start"]
+        return FakeCursor([
+            bucket for (user_id, period, _), bucket in self.buckets.items()
+            if user_id == query["user_id"] and period == query["period"] and start["$gte"] <= bucket["start"] <= start["$lte"]
+        ])
+
+@pytest.fixture
+def rollups(monkeypatch):
+    fake = FakeRollups()
+    monkeypatch.setattr(blood_store, "blood_rollups_collection", fake)
+    return fake
+
+def reading(user_id, day, green=1):
+    return {"user_id": user_id, "date": datetime(2024, 1, day), "green": green, "normal": 0, "red": 0, "kun": 0, "total": green}
+
+@pytest.mark.asyncio
+async def test_find_readings_pages_newest_first(monkeypatch):
+    readings = FakeReadings([reading("u1", day) for day in range(1, 11)] + [reading("u2", 5)])
+    monkeypatch.setattr(blood_store, "blood_readings_collection", readings)
+
+    first = await find_readings("u1", from_date=date(2024, 1, 3), limit=4)
+    assert [r["date"] for r in first] == ["2024-01-10", "2024-01-09", "2024-01-08", "2024-01-07"]
+    rest = await find_readings("u1", from_date=date(2024, 1, 3), limit=4, before=date.fromisoformat(first[-1]["date"]))
+    assert [r["date"] for r in rest] == ["2024-01-06", "2024-01-05", "2024-01-04", "2024-01-03"]
+    assert readings.queries[-1]["date"] == {"$gte": datetime(2024, 1, 3), "$lt": datetime(2024, 1, 7)}
+
+@pytest.mark.asyncio
+async def test_increment_day_creates_then_adds(monkeypatch, rollups):
+    monkeypatch.setattr(blood_store, "blood_readings_collection", FakeReadings())
+    await increment_day("u1", date(2024, 1, 1), {"green": 1, "red": 2})
+    saved = await increment_day("u1", date(2024, 1, 1), {"green": 3, "normal": 0, "red": 0, "kun": 1})
+    assert saved == {"date": "2024-01-01", "green": 4, "normal": 0, "red": 2, "kun": 1, "total": 7}
+
+@pytest.mark.asyncio
+async def test_increment_days_returns_the_touched_days(monkeypatch, rollups):
+    readings = FakeReadings([reading("u1", 1, green=5), reading("u1", 3)])
+    monkeypatch.setattr(blood_store, "blood_readings_collection", readings)
+    updated = await increment_days("u1", [
+        (date(2024, 1, 1), {"green": 1, "total": 99}),
+        (date(2024, 1, 2), {"red": 2}),
+        (date(2024, 1, 1), {"kun": 1}),
+    ])
+    # Same-day entries are merged into one update; one bulk write and one read for the whole batch
+    assert readings.bulk_calls == [2]
+    assert readings.updates == []
+    assert readings.queries == [{"user_id": "u1", "date": {"$in": [datetime(2024, 1, 1), datetime(2024, 1, 2)]}}]
+    assert updated == [
+        {"date": "2024-01-02", "green": 0, "normal": 0, "red": 2, "kun": 0, "total": 2},
+        {"date": "2024-01-01", "green": 6, "normal": 0, "red": 0, "kun": 1, "total": 7},
+    ]
+
+def test_rollup_updates_merge_days_per_bucket():
+    increments = {"green": 1, "normal": 0, "red": 0, "kun": 0, "total": 1}
+    # Mon 29 Jan and Wed 31 Jan share a week and a month; Thu 1 Feb shares only the week
+    operations = rollup_updates("u1", {date(2024, 1, 29): increments, date(2024, 1, 31): increments, date(2024, 2, 1): increments})
+    buckets = {(op._filter["period"], op._filter["start"]): op._doc["$inc"]["total"] for op in operations}
+    assert buckets == {
+        ("week", datetime(2024, 1, 29)): 3,
+        ("month", datetime(2024, 1, 1)): 2,
+        ("month", datetime(2024, 2, 1)): 1,
+    }
+
+@pytest.mark.asyncio
+async def test_rollups_follow_writes(monkeypatch, rollups):
+    monkeypatch.setattr(blood_store, "blood_readings_collection", FakeReadings())
+    await increment_days("u1", [(date(2024, 1, 1), {"green": 3, "red": 1}), (date(2024, 1, 9), {"normal": 4})])
+    await increment_day("u1", date(2024, 1, 2), {"kun": 2})
+
+    buckets, summary = await find_rollups("u1", "week", date(2024, 1, 3), date(2024, 1, 31))
+    assert [(b["start"], b["total"]) for b in buckets] == [("2024-01-01", 6), ("2024-01-08", 4)]
+    assert buckets[0]["ratios"]["green"] == 0.5
+    assert summary["total"] == 10
+    assert summary["ratios"] == {"green": 0.3, "normal": 0.4, "red": 0.1, "kun": 0.2}
+
+    months, _ = await find_rollups("u1", "month", date(2024, 1, 15), date(2024, 1, 31))
+    assert [(b["start"], b["total"]) for b in months] == [("2024-01-01", 10)]
+
+def test_reading_out_defaults_missing_fields():
+    assert reading_out({"date": datetime(2024, 1, 1), "green": 2}) == {
+        "date": "2024-01-01", "green": 2, "normal": 0, "red": 0, "kun": 0, "total": 2
+    }
+
+def test_migration_merges_duplicate_dates():
+    entries = [
+        {"date": "2024-01-01", "green": 1, "normal": 2, "red": 0, "kun": 0, "total": 3},
+        {"date": "2024-01-01", "green": 1, "normal": None, "red": 1, "kun": 0},
+        {"date": "2024-01-02T08:00:00", "kun": 5},
+        {"green": 9},
+    ]
+    assert merge_entries(entries) == {
+        date(2024, 1, 1): {"green": 2, "normal": 2, "red": 1, "kun": 0, "total": 5},
+        date(2024, 1, 2): {"green": 0, "normal": 0, "red": 0, "kun": 5, "total": 5},
+    }
+    operations = reading_upserts("u1", entries)
+    assert len(operations) == 2
+    assert operations[0]._filter == {"user_id": "u1", "date": datetime(2024, 1, 1)}
+    # Existing days are never overwritten, so a re-run cannot undo live $inc writes
+    assert operations[0]._doc == {"$setOnInsert": {"green": 2, "normal": 2, "red": 1, "kun": 0, "total": 5}}
+
+@pytest.mark.asyncio
+async def test_rollup_rebuild_merges_before_deleting_stale_buckets(monkeypatch):
+    calls = []
+
+    class RecordingCollection:
+        name = "blood_rollups"
+
+        def aggregate(self, pipeline):
+            calls.append(("merge", pipeline[-1]["$merge"]["into"], pipeline[1]["$project"]["rebuilt_at"]["$literal"]))
+            return FakeCursor([])
+
+        async def delete_many(self, query):
+            calls.append(("delete", query))
+
+        async def count_documents(self, query):
+            return 0
+
+    async def no_indexes():
+        pass
+
+    collection = RecordingCollection()
+    monkeypatch.setattr(rollups_migration, "blood_readings_collection", collection)
+    monkeypatch.setattr(rollups_migration, "blood_rollups_collection", collection)
+    monkeypatch.setattr(rollups_migration, "ensure_indexes", no_indexes)
+    await rollups_migration.rebuild(("week",))
+
+    # Live buckets are only replaced, never emptied while the rebuild runs
+    assert [call[0] for call in calls] == ["merge", "delete"]
+    rebuilt_at = calls[0][2]
+    assert calls[1][1] == rollups_migration.stale_buckets("week", rebuilt_at)
+    assert calls[1][1]["rebuilt_at"] == {"$ne": rebuilt_at}
+    assert calls[1][1]["_id"]["$lt"].generation_time == rebuilt_at
+
+@pytest.mark.asyncio
+async def test_default_page_covers_the_default_window(monkeypatch):
+    today = datetime.combine(date.today(), datetime.min.time())
+    readings = FakeReadings([{**reading("u1", 1), "date": today - timedelta(days=i)} for i in range(40)])
+    monkeypatch.setattr(blood_store, "blood_readings_collection", readings)
+    app = FastAPI()
+    app.include_router(blood.router, prefix="/blood")
+    app.dependency_overrides[get_current_user] = lambda: {"_id": "u1"}
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.get("/blood/")
+        page = await client.get("/blood/", params={"limit": 5})
+    assert len(response.json()) == 31
+    assert response.json()[-1]["date"] == (date.today() - timedelta(days=30)).isoformat()
+    assert page.headers["x-next-cursor"] == page.json()[-1]["date"]
+
+def test_cursor_header_is_exposed_to_browsers():
+    from src.main import app as main_app
+    cors = next(middleware for middleware in main_app.user_middleware if middleware.cls is CORSMiddleware)
+    assert "X-Next-Cursor" in cors.kwargs["expose_headers"]
+
+@pytest.mark.asyncio
+async def test_negative_counts_are_rejected(monkeypatch, rollups):
+    readings = FakeReadings()
+    monkeypatch.setattr(blood_store, "blood_readings_collection", readings)
+    app = FastAPI()
+    app.include_router(blood.router, prefix="/blood")
+    app.dependency_overrides[get_current_user] = lambda: {"_id": "u1"}
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.put("/blood/", json={"blood": [{"date": "2024-01-01", "green": 3, "red": -2}]})
+    # A negative $inc would quietly subtract from the day and its rollups
+    assert response.status_code == 422
+    assert readings.documents == [] and rollups.buckets == {}
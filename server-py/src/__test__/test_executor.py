@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from src.ml.executor import InferencePool, PoolSaturatedError, predict_matrix
+
+def test_admission_is_bounded():
+    pool = InferencePool(kind="thread", workers=1, queue_size=1)
+    with pool.admit():
+        with pool.admit():
+            with pytest.raises(PoolSaturatedError):
+                with pool.admit():
+                    pass
+    assert pool.stats()["in_flight"] == 0
+    assert pool.stats()["rejected_total"] == 1
+
+def test_invalid_pool_kind():
+    with pytest.raises(ValueError):
+        InferencePool(kind="gpu")
+
+@pytest.mark.asyncio
+async def test_predict_runs_on_worker():
+    pool = InferencePool(kind="thread", workers=2, queue_size=0)
+    try:
+        probabilities = await pool.run(predict_matrix, np.full((3, 768), 1 / 256, dtype=np.float32))
+    finally:
+        pool.shutdown()
+    assert probabilities.shape == (3, 4)
+
+def test_batch_admission_reserves_one_slot_per_job():
+    pool = InferencePool(kind="thread", workers=1, queue_size=3)
+    with pool.admit(3):
+        assert pool.stats()["in_flight"] == 3
+        with pytest.raises(PoolSaturatedError):
+            with pool.admit(2):
+                pass
+        with pool.admit():
+            pass
+    # An idle pool still takes a batch larger than the bound rather than refusing it forever
+    with pool.admit(10):
+        pass
+    assert pool.stats()["in_flight"] == 0
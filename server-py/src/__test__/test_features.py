@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+import sys
+import cv2
+import os
+
+from src.ml.features import extract_features, extract_batch, FEATURE_SIZE
+from src.ml.pipeline import decode_image
+
+ML_PY_PREPROCESSING = os.path.join(os.path.dirname(__file__), "../../../ml-py/preprocessing")
+
+def reference_features(image):
+    # The training kernel as it was in ml-py/preprocessing/feature_extraction.py
+    resized_image = cv2.resize(image, (512, 512))
+    center_x, center_y = resized_image.shape[1] // 2, resized_image.shape[0] // 2
+    cropped_image = resized_image[center_y - 128:center_y + 128, center_x - 128:center_x + 128]
+    hsv_image = cv2.cvtColor(cropped_image, cv2.COLOR_BGR2HSV)
+    h_hist = cv2.calcHist([hsv_image], [0], None, [256], [0, 256]).flatten()
+    s_hist = cv2.calcHist([hsv_image], [1], None, [256], [0, 256]).flatten()
+    v_hist = cv2.calcHist([hsv_image], [2], None, [256], [0, 256]).flatten()
+    return np.concatenate([h_hist / h_hist.sum(), s_hist / s_hist.sum(), v_hist / v_hist.sum()])
+
+def make_image(seed, size):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 256, size=(*size, 3), dtype=np.uint8)
+
+@pytest.mark.parametrize("size", [(256, 256), (480, 640), (1200, 900), (300, 2000)])
+def test_kernel_matches_training_reference(size):
+    image = make_image(0, size)
+    features = extract_features(image)
+    assert features.dtype == np.float32
+    assert features.shape == (FEATURE_SIZE,)
+    assert np.array_equal(features, reference_features(image))
+
+def test_kernel_writes_into_preallocated_buffer():
+    image = make_image(1, (600, 800))
+    out = np.full(FEATURE_SIZE, 7, dtype=np.float32)
+    assert extract_features(image, out=out) is out
+    assert np.array_equal(out, reference_features(image))
+
+def test_batch_rows_match_single_extraction():
+    images = [make_image(seed, (400 + 40 * seed, 500)) for seed in range(5)]
+    batch = extract_batch(images)
+    assert batch.shape == (5, FEATURE_SIZE)
+    assert batch.dtype == np.float32
+    for row, image in zip(batch, images):
+        assert np.array_equal(row, extract_features(image))
+
+def test_training_and_serving_see_identical_vectors(tmp_path):
+    image = make_image(2, (720, 960))
+    ok, encoded = cv2.imencode(".png", image)
+    image_path = tmp_path / "sample.png"
+    image_path.write_bytes(encoded.tobytes())
+
+    # Serving decodes upload bytes; training reads the file from disk
+    serving = extract_features(decode_image(encoded.tobytes()))
+
+    pytest.importorskip("pandas")
+    pytest.importorskip("tqdm")
+    sys.path.insert(0, os.path.abspath(ML_PY_PREPROCESSING))
+    try:
+        import feature_extraction
+    finally:
+        sys.path.pop(0)
+    training = feature_extraction.process_image(str(image_path))
+    assert np.array_equal(serving, training)
@@ -0,0 +1,191 @@
+from fastapi import FastAPI, HTTPException, UploadFile
+from starlette.datastructures import Headers
+from httpx import AsyncClient, ASGITransport
+from gridfs.errors import NoFile
+from datetime import datetime
+from bson import ObjectId
+import asyncio
+import io
+import pytest
+
+from src.routers import file_upload
+from src.routers.file_upload import ALLOWED_IMAGE_TYPES, sniff_image_type, upload_files
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 100
+JPEG = b"\xff\xd8\xff\xe0" + b"\x00" * 100
+
+class FakeGridIn:
+    def __init__(self, bucket, filename, chunk_size_bytes, metadata):
+        self.bucket = bucket
+        self._id = ObjectId()
+        self.filename = filename
+        self.metadata = metadata
+        self.chunks = []
+
+    async def write(self, chunk):
+        self.bucket.active += 1
+        self.bucket.peak = max(self.bucket.peak, self.bucket.active)
+        await asyncio.sleep(0)
+        self.bucket.active -= 1
+        self.chunks.append(chunk)
+
+    async def close(self):
+        self.bucket.files[self._id] = self
+
+    async def abort(self):
+        self.bucket.aborted.append(self.filename)
+
+class FakeBucket:
+    def __init__(self):
+        self.files = {}
+        self.aborted = []
+        self.active = 0
+        self.peak = 0
+
+    def open_upload_stream(self, filename, chunk_size_bytes=None, metadata=None):
+        return FakeGridIn(self, filename, chunk_size_bytes, metadata)
+
+    async def delete(self, file_id):
+        del self.files[file_id]
+
+def upload(content, filename="photo.png", content_type="image/png"):
+    return UploadFile(io.BytesIO(content), filename=filename, headers=Headers({"content-type": content_type}))
+
+def test_sniff_image_type():
+    assert sniff_image_type(PNG) == "image/png"
+    assert sniff_image_type(JPEG) == "image/jpeg"
+    assert sniff_image_type(b"RIFF\x00\x00\x00\x00WEBPVP8 ") == "image/webp"
+    assert sniff_image_type(b"GIF89a") is None
+
+@pytest.mark.asyncio
+async def test_files_are_streamed_in_chunks(monkeypatch):
+    monkeypatch.setattr(file_upload, "UPLOAD_CHUNK_SIZE", 32)
+    bucket = FakeBucket()
+    file_ids = await upload_files([upload(PNG), upload(JPEG, "b.jpg", "image/jpeg")], ALLOWED_IMAGE_TYPES, bucket)
+
+    stored = [bucket.files[ObjectId(file_id)] for file_id in file_ids]
+    assert [file.filename for file in stored] == ["photo.png", "b.jpg"]
+    assert b"".join(stored[0].chunks) == PNG
+    assert max(len(chunk) for chunk in stored[0].chunks) == 32
+    assert stored[1].metadata == {"contentType": "image/jpeg"}
+
+@pytest.mark.asyncio
+async def test_mismatched_magic_bytes_are_rejected():
+    bucket = FakeBucket()
+    with pytest.raises(HTTPException) as error:
+        await upload_files([upload(PNG), upload(JPEG)], ALLOWED_IMAGE_TYPES, bucket)
+    assert error.value.status_code == 400
+    assert bucket.files == {}
+
+@pytest.mark.asyncio
+async def test_oversized_file_rolls_back_the_request(monkeypatch):
+    monkeypatch.setattr(file_upload, "UPLOAD_CHUNK_SIZE", 16)
+    monkeypatch.setattr(file_upload, "UPLOAD_MAX_BYTES", 64)
+    bucket = FakeBucket()
+    small = upload(PNG[:40])
+    large = upload(PNG)
+    large.size = None    # size unknown up front, so the limit is enforced while streaming
+    with pytest.raises(HTTPException) as error:
+        await upload_files([small, large], ALLOWED_IMAGE_TYPES, bucket)
+    assert error.value.status_code == 413
+    assert bucket.aborted == ["photo.png"]
+    assert bucket.files == {}
+
+@pytest.mark.asyncio
+async def test_concurrent_writes_are_capped(monkeypatch):
+    monkeypatch.setattr(file_upload, "UPLOAD_CHUNK_SIZE", 8)
+    monkeypatch.setattr(file_upload, "upload_slots", asyncio.Semaphore(2))
+    bucket = FakeBucket()
+    await upload_files([upload(PNG, f"{i}.png") for i in range(5)], ALLOWED_IMAGE_TYPES, bucket)
+    assert len(bucket.files) == 5
+    assert bucket.peak == 2
+
+class FakeGridOut:
+    def __init__(self, content, chunk_size=10, metadata=None, filename="photo.png"):
+        self._id = ObjectId()
+        self.content = content
+        self.length = len(content)
+        self.chunk_size = chunk_size
+        self.upload_date = datetime(2024, 1, 2, 3, 4, 5, 678000)
+        self.filename = filename
+        self.metadata = metadata
+        self.position = 0
+        self.chunks_read = 0
+
+    def seek(self, position):
+        self.position = position
+
+    async def readchunk(self):
+        # Like GridFS: the rest of the chunk that holds the current position
+        chunk_end = (self.position // self.chunk_size + 1) * self.chunk_size
+        chunk = self.content[self.position:chunk_end]
+        self.position += len(chunk)
+        self.chunks_read += bool(chunk)
+        return chunk
+
+class FakeDownloads:
+    def __init__(self, files):
+        self.files = {file._id: file for file in files}
+
+    async def open_download_stream(self, file_id):
+        if file_id not in self.files:
+            raise NoFile(file_id)
+        file = self.files[file_id]
+        file.position = 0
+        return file
+
+@pytest.fixture
+def image_client(monkeypatch):
+    stored = FakeGridOut(bytes(range(50)), metadata={"contentType": "image/jpeg"})
+    monkeypatch.setattr(file_upload, "image_fs", FakeDownloads([stored]))
+    app = FastAPI()
+    app.include_router(file_upload.router, prefix="/files")
+    return AsyncClient(transport=ASGITransport(app=app), base_url="http://test"), stored
+
+@pytest.mark.asyncio
+async def test_image_has_validators_and_stored_type(image_client):
+    client, stored = image_client
+    async with client:
+        response = await client.get(f"/files/images/{stored._id}")
+        missing = await client.get(f"/files/images/{ObjectId()}")
+    assert response.status_code == 200
+    assert response.content == stored.content
+    assert response.headers["content-type"] == "image/jpeg"
+    assert response.headers["content-length"] == "50"
+    assert response.headers["etag"] == f'"{stored._id}-50-1704164645"'
+    assert response.headers["last-modified"] == "Tue, 02 Jan 2024 03:04:05 GMT"
+    assert "max-age=" in response.headers["cache-control"]
+    assert missing.status_code == 404
+
+@pytest.mark.asyncio
+async def test_conditional_get_returns_304(image_client):
+    client, stored = image_client
+    async with client:
+        etag = (await client.get(f"/files/images/{stored._id}")).headers["etag"]
+        by_etag = await client.get(f"/files/images/{stored._id}", headers={"If-None-Match": f'"other", W/{etag}'})
+        by_date = await client.get(f"/files/download_image/{stored._id}", headers={"If-Modified-Since": "Tue, 02 Jan 2024 03:04:05 GMT"})
+        stale = await client.get(f"/files/images/{stored._id}", headers={"If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT"})
+    assert by_etag.status_code == 304
+    assert by_etag.content == b""
+    assert by_date.status_code == 304
+    assert stale.status_code == 200
+
+@pytest.mark.asyncio
+async def test_range_reads_only_the_needed_chunks(image_client):
+    client, stored = image_client
+    async with client:
+        partial = await client.get(f"/files/images/{stored._id}", headers={"Range": "bytes=25-34"})
+        chunks_read = stored.chunks_read
+        suffix = await client.get(f"/files/download_image/{stored._id}", headers={"Range": "bytes=-5"})
+        unsatisfiable = await client.get(f"/files/images/{stored._id}", headers={"Range": "bytes=60-"})
+        if_range = await client.get(f"/files/images/{stored._id}", headers={"Range": "bytes=0-1", "If-Range": '"old"'})
+    assert partial.status_code == 206
+    assert partial.content == bytes(range(25, 35))
+    assert partial.headers["content-range"] == "bytes 25-34/50"
+    assert partial.headers["content-length"] == "10"
+    assert chunks_read == 2
+    assert suffix.content == bytes(range(45, 50))
+    assert suffix.headers["content-disposition"] == "attachment; filename*=UTF-8''photo.png"
+    assert unsatisfiable.status_code == 416
+    assert unsatisfiable.headers["content-range"] == "bytes */50"
+    assert if_range.status_code == 200
@@ -0,0 +1,146 @@
+from fastapi import FastAPI
+from httpx import AsyncClient, ASGITransport
+from gridfs.errors import NoFile
+from datetime import datetime
+from bson import ObjectId
+import numpy as np
+import asyncio
+import pytest
+import cv2
+
+from src import image_variants
+from src.image_variants import VariantCache, load_variant
+from src.ml.executor import InferencePool
+from src.ml.features import extract_features
+from src.ml.variants import render_variants
+from src.routers import file_upload
+
+def make_photo(size=(600, 800)):
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, size=(*size, 3), dtype=np.uint8)
+    return image, cv2.imencode(".jpg", image)[1].tobytes()
+
+class FakeGridOut:
+    def __init__(self, content, metadata=None):
+        self._id = ObjectId()
+        self.content = content
+        self.metadata = metadata
+        self.upload_date = datetime(2024, 1, 2)
+
+    async def read(self):
+        return self.content
+
+class FakeBucket:
+    def __init__(self, files=None):
+        self.by_id = dict(files or {})
+        self.by_name = {}
+        self.reads = 0
+
+    async def open_download_stream(self, file_id):
+        if file_id not in self.by_id:
+            raise NoFile(file_id)
+        self.reads += 1
+        return self.by_id[file_id]
+
+    async def open_download_stream_by_name(self, name):
+        if name not in self.by_name:
+            raise NoFile(name)
+        self.reads += 1
+        return self.by_name[name]
+
+    async def upload_from_stream(self, name, content, metadata=None):
+        self.by_name[name] = FakeGridOut(content, metadata)
+        return self.by_name[name]._id
+
+@pytest.fixture
+def stores(monkeypatch):
+    image, photo = make_photo()
+    original_id = ObjectId()
+    originals = FakeBucket({original_id: FakeGridOut(photo)})
+    variants = FakeBucket()
+    pool = InferencePool(kind="thread", workers=1, queue_size=0)
+    monkeypatch.setattr(image_variants, "image_fs", originals)
+    monkeypatch.setattr(image_variants, "variant_fs", variants)
+    monkeypatch.setattr(image_variants, "inference_pool", pool)
+    monkeypatch.setattr(image_variants, "variant_cache", VariantCache(max_bytes=1 << 20))
+    yield image, photo, original_id, originals, variants
+    pool.shutdown()
+
+def test_render_variants_matches_the_model_input():
+    image, photo = make_photo()
+    variants = render_variants(photo)
+    decoded = cv2.imdecode(np.frombuffer(photo, np.uint8), cv2.IMREAD_COLOR)
+    crop = cv2.imdecode(np.frombuffer(variants["crop"], np.uint8), cv2.IMREAD_COLOR)
+    thumbnail = cv2.imdecode(np.frombuffer(variants["thumbnail"], np.uint8), cv2.IMREAD_COLOR)
+    assert crop.shape == (256, 256, 3)
+    assert np.array_equal(np.frombuffer(variants["features"], "<f4"), extract_features(decoded))
+    assert max(thumbnail.shape[:2]) == 128
+
+def test_cache_is_bounded_by_bytes():
+    cache = VariantCache(max_bytes=10)
+    cache.put("a", (b"12345", "image/png", None, None))
+    cache.put("b", (b"12345", "image/png", None, None))
+    cache.put("c", (b"1", "image/png", None, None))
+    assert cache.get("a") is None
+    assert cache.get("c") is not None
+    assert cache.stats()["size_bytes"] == 6
+    cache.put("big", (b"x" * 11, "image/png", None, None))
+    assert cache.get("big") is None
+
+@pytest.mark.asyncio
+async def test_missing_variants_are_rendered_once_then_cached(stores):
+    image, photo, original_id, originals, variants = stores
+    first = await load_variant(original_id, "thumbnail")
+    second = await load_variant(original_id, "thumbnail")
+    features = await load_variant(original_id, "features")
+    assert first is second
+    assert first[1] == "image/webp"
+    assert originals.reads == 1
+    assert sorted(variants.by_name) == sorted(f"{original_id}/{name}" for name in ("crop", "thumbnail", "features"))
+    assert variants.by_name[f"{original_id}/crop"].metadata["original_id"] == original_id
+    assert np.frombuffer(features[0], "<f4").shape == (768,)
+    with pytest.raises(NoFile):
+        await load_variant(ObjectId(), "crop")
+
+@pytest.mark.asyncio
+async def test_variant_endpoint(stores):
+    image, photo, original_id, originals, variants = stores
+    app = FastAPI()
+    app.include_router(file_upload.router, prefix="/files")
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.get(f"/files/images/{original_id}", params={"variant": "crop"})
+        cached = await client.get(f"/files/images/{original_id}", params={"variant": "crop"}, headers={"If-None-Match": response.headers["etag"]})
+        unknown = await client.get(f"/files/images/{original_id}", params={"variant": "huge"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/png"
+    assert cv2.imdecode(np.frombuffer(response.content, np.uint8), cv2.IMREAD_COLOR).shape == (256, 256, 3)
+    assert cached.status_code == 304
+    assert unknown.status_code == 422
+
+@pytest.mark.asyncio
+async def test_failed_render_is_remembered_briefly(stores, monkeypatch):
+    image, photo, original_id, originals, variants = stores
+    monkeypatch.setattr(image_variants, "_failures", {})
+    broken_id = ObjectId()
+    originals.by_id[broken_id] = FakeGridOut(b"\xff\xd8\xff not really a jpeg")
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            await load_variant(broken_id, "thumbnail")
+    assert originals.reads == 1
+
+    monkeypatch.setattr(image_variants, "_failures", {broken_id: (0, ValueError("expired"))})
+    with pytest.raises(ValueError, match="decode"):
+        await load_variant(broken_id, "thumbnail")
+    assert originals.reads == 2
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_cancel_the_shared_render(stores):
+    image, photo, original_id, originals, variants = stores
+    first = asyncio.ensure_future(load_variant(original_id, "crop"))
+    second = asyncio.ensure_future(load_variant(original_id, "thumbnail"))
+    await asyncio.sleep(0.01)
+    first.cancel()
+    content, content_type, _, _ = await second
+    assert content_type == "image/webp"
+    assert first.cancelled()
+    assert originals.reads == 1
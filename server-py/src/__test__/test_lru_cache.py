@@ -0,0 +1,56 @@
+import pytest
+
+from src.admission import AdmissionGate
+from src.lru_cache import LRUCache
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+def test_size_bound_uses_entry_weight():
+    cache = LRUCache(10, sizeof=len)
+    cache.put("a", b"1234")
+    cache.put("b", b"1234")
+    cache.get("a")
+    cache.put("c", b"1234")
+    # "b" was least recently used; a value heavier than the bound is never stored
+    assert cache.get("b") is None
+    cache.put("d", b"x" * 11)
+    assert cache.get("d") is None
+    assert cache.total_size == 8
+    assert cache.stats()["evictions"] == 1
+
+def test_ttl_and_explicit_expiry():
+    clock = FakeClock()
+    cache = LRUCache(4, ttl_seconds=60, clock=clock)
+    cache.put("a", 1)
+    cache.put("b", 2, expires_at=clock.now + 5)
+    clock.now += 6
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    clock.now += 60
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 2
+    assert len(cache) == 0
+
+def test_disabled_cache_stores_nothing():
+    cache = LRUCache(0)
+    cache.put("a", 1)
+    assert cache.get("a") is None
+    assert cache.stats()["misses"] == 0
+
+def test_admission_gate_sheds_load_past_the_limit():
+    gate = AdmissionGate(2, RuntimeError, "full")
+    with gate.admit():
+        with pytest.raises(RuntimeError, match="full"):
+            with gate.admit(2):
+                pass
+        with gate.admit():
+            assert gate.in_flight == 2
+    with gate.admit(5):
+        pass
+    assert gate.in_flight == 0
+    assert gate.rejected_total == 1
@@ -0,0 +1,75 @@
+from fastapi import FastAPI
+from httpx import AsyncClient, ASGITransport
+import numpy as np
+import pytest
+
+from src import metrics
+from src.metrics import MetricsRegistry, ServerTimingMiddleware, registry, stage
+from src.ml.executor import InferencePool, predict_matrix
+
+@pytest.fixture
+def metrics_on(monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", True)
+    registry.clear()
+    yield
+    registry.clear()
+
+def test_stage_is_noop_when_disabled(monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", False)
+    registry.clear()
+    with stage("decode"):
+        pass
+    assert stage("decode") is stage("predict")
+    assert registry.snapshot("stage_duration_seconds") == {}
+
+def test_stage_records_histogram(metrics_on):
+    with stage("decode"):
+        pass
+    with stage("decode"):
+        pass
+    count, total = registry.snapshot("stage_duration_seconds")[("decode",)]
+    assert count == 2
+    assert total >= 0
+
+def test_render_prometheus_text():
+    local = MetricsRegistry(buckets=(0.01, 0.1))
+    local.observe("stage_duration_seconds", ("decode",), 0.005, help="Stage time")
+    local.observe("stage_duration_seconds", ("decode",), 0.05, help="Stage time")
+    text = local.render({"cache_hits": 3})
+    assert '# TYPE blood_scanner_stage_duration_seconds histogram' in text
+    assert 'blood_scanner_stage_duration_seconds_bucket{stage="decode",le="0.01"} 1' in text
+    assert 'blood_scanner_stage_duration_seconds_bucket{stage="decode",le="0.1"} 2' in text
+    assert 'blood_scanner_stage_duration_seconds_bucket{stage="decode",le="+Inf"} 2' in text
+    assert 'blood_scanner_stage_duration_seconds_count{stage="decode"} 2' in text
+    assert 'blood_scanner_cache_hits 3.0' in text
+
+@pytest.mark.asyncio
+async def test_server_timing_header(metrics_on):
+    app = FastAPI()
+    app.add_middleware(ServerTimingMiddleware)
+
+    @app.get("/items/{item_id}")
+    async def read_item(item_id: int):
+        with stage("user_lookup"):
+            pass
+        return {"item_id": item_id}
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.get("/items/7")
+
+    assert response.status_code == 200
+    assert response.headers["server-timing"].startswith("user_lookup;dur=")
+    assert "total;dur=" in response.headers["server-timing"]
+    assert ("GET", "read_item", "200") in registry.snapshot("http_request_duration_seconds")
+
+@pytest.mark.asyncio
+async def test_worker_stages_reach_the_request(metrics_on):
+    pool = InferencePool(kind="thread", workers=1, queue_size=0)
+    timings = []
+    token = metrics._request_timings.set(timings)
+    try:
+        await pool.run(predict_matrix, np.full((2, 768), 1 / 256, dtype=np.float32))
+    finally:
+        metrics._request_timings.reset(token)
+        pool.shutdown()
+    assert [name for name, _ in timings] == ["pool_queue", "predict"]
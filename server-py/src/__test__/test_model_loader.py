@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+import shutil
+import os
+
+from src.ml import model_loader
+from src.ml.model_loader import ModelHolder, ModelFingerprint, DEFAULT_MODEL_PATH, file_sha256
+from src.ml.prediction_cache import PredictionCache
+
+def test_model_is_loaded_once_and_shared(tmp_path):
+    model_path = tmp_path / "lightgbm_model.txt"
+    shutil.copy(DEFAULT_MODEL_PATH, model_path)
+    holder = ModelHolder(str(model_path))
+
+    booster = holder.load()
+    assert holder.get() is booster
+    assert holder.get() is booster
+
+    identity = holder.identity()
+    assert identity["sha256"] == file_sha256(model_path)
+    assert identity["num_feature"] == 768
+    assert identity["num_class"] == 4
+    assert "best_iteration" in identity
+
+def test_model_reloads_only_when_content_changes(tmp_path):
+    model_path = tmp_path / "lightgbm_model.txt"
+    shutil.copy(DEFAULT_MODEL_PATH, model_path)
+    holder = ModelHolder(str(model_path))
+    booster = holder.load()
+
+    # Same content with a new mtime keeps the loaded Booster
+    stat = os.stat(model_path)
+    os.utime(model_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert holder.get() is booster
+
+    # New content is picked up on the next call
+    with open(model_path, "a") as model_file:
+        model_file.write("\n")
+    os.utime(model_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2_000_000_000))
+    reloaded = holder.get()
+    assert reloaded is not booster
+    assert holder.sha256 == file_sha256(model_path)
+
+    probabilities = holder.predict(np.full((2, 768), 1 / 256))
+    assert probabilities.shape == (2, 4)
+
+def test_fingerprint_hashes_only_when_mtime_moves(tmp_path, monkeypatch):
+    model_path = tmp_path / "lightgbm_model.txt"
+    shutil.copy(DEFAULT_MODEL_PATH, model_path)
+    fingerprint = ModelFingerprint(str(model_path))
+    assert fingerprint.sha256 is None
+    assert fingerprint.refresh() == file_sha256(model_path)
+
+    hashed = []
+    monkeypatch.setattr(model_loader, "file_sha256", lambda path: hashed.append(path) or "changed")
+    fingerprint.refresh()
+    assert hashed == []
+
+    stat = os.stat(model_path)
+    os.utime(model_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert fingerprint.refresh() == "changed"
+
+def test_cache_key_never_loads_the_model(monkeypatch):
+    holder = ModelHolder(DEFAULT_MODEL_PATH)
+    monkeypatch.setattr(model_loader, "model_holder", holder)
+    monkeypatch.setattr(model_loader.model_fingerprint, "sha256", "model-a")
+    cache = PredictionCache(max_entries=2, ttl_seconds=60)
+    assert cache.get("image") == (("image", "model-a"), None)
+    assert holder._booster is None
+
+def test_bad_model_write_keeps_serving_the_last_good_model(tmp_path, monkeypatch):
+    model_path = tmp_path / "lightgbm_model.txt"
+    shutil.copy(DEFAULT_MODEL_PATH, model_path)
+    holder = ModelHolder(str(model_path))
+    booster = holder.load()
+    good_sha = holder.sha256
+
+    # A half-written file from an interrupted deploy
+    with open(model_path, "w") as model_file:
+        model_file.write("tree\nversion=v4\nnum_class=")
+    stat = os.stat(model_path)
+    os.utime(model_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    parses = []
+    read_model = holder._read_model
+    monkeypatch.setattr(holder, "_read_model", lambda: parses.append(1) or read_model())
+
+    assert holder.get() is booster
+    assert holder.get() is booster
+    assert parses == [1]
+    assert holder.sha256 == good_sha
+    assert holder.predict(np.full((1, 768), 1 / 256)).shape == (1, 4)
+
+    # Finishing the write swaps the model in
+    shutil.copy(DEFAULT_MODEL_PATH, model_path)
+    os.utime(model_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2_000_000_000))
+    assert holder.get() is booster
+    assert len(parses) == 1
+
+def test_first_load_of_a_bad_model_still_fails(tmp_path):
+    model_path = tmp_path / "lightgbm_model.txt"
+    model_path.write_text("not a model")
+    with pytest.raises(Exception):
+        ModelHolder(str(model_path)).load()
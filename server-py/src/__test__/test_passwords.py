@@ -0,0 +1,60 @@
+from passlib.context import CryptContext
+import asyncio
+import pytest
+
+from src.auth.passwords import PasswordHasher, PasswordQueueFullError
+
+def make_hasher(rounds=4, **kwargs):
+    return PasswordHasher(CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds), **kwargs)
+
+@pytest.mark.asyncio
+async def test_hash_and_verify():
+    hasher = make_hasher()
+    try:
+        hashed = await hasher.hash("secret")
+        assert await hasher.verify_and_update("secret", hashed) == (True, None)
+        assert (await hasher.verify_and_update("wrong", hashed))[0] is False
+    finally:
+        hasher.shutdown()
+    assert hasher.stats()["operations_total"] == 3
+
+@pytest.mark.asyncio
+async def test_hash_with_old_cost_is_upgraded():
+    old, new = make_hasher(rounds=4), make_hasher(rounds=5)
+    try:
+        hashed = await old.hash("secret")
+        verified, new_hash = await new.verify_and_update("secret", hashed)
+    finally:
+        old.shutdown()
+        new.shutdown()
+    assert verified
+    assert hashed.startswith("$2b$04$") and new_hash.startswith("$2b$05$")
+
+@pytest.mark.asyncio
+async def test_event_loop_keeps_running_while_hashing():
+    hasher = make_hasher(rounds=10, workers=1)
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.001)
+
+    task = asyncio.create_task(ticker())
+    try:
+        await hasher.hash("secret")
+    finally:
+        task.cancel()
+        hasher.shutdown()
+    assert ticks > 5
+
+@pytest.mark.asyncio
+async def test_queue_is_bounded():
+    hasher = make_hasher(rounds=8, workers=1, queue_size=1)
+    try:
+        results = await asyncio.gather(*(hasher.hash("secret") for _ in range(3)), return_exceptions=True)
+    finally:
+        hasher.shutdown()
+    assert sum(isinstance(result, PasswordQueueFullError) for result in results) == 1
+    assert hasher.stats()["rejected_total"] == 1
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+import cv2
+
+from src.ml.pipeline import decode_image, process_image, process_image_bytes, label_counts
+
+def make_image_bytes(seed=0, size=(480, 640)):
+    rng = np.random.default_rng(seed)
+    image = rng.integers(0, 256, size=(*size, 3), dtype=np.uint8)
+    ok, encoded = cv2.imencode(".png", image)
+    assert ok
+    return image, encoded.tobytes()
+
+def test_decode_image_from_bytes():
+    image, image_bytes = make_image_bytes()
+    decoded = decode_image(image_bytes)
+    assert np.array_equal(decoded, image)
+    assert np.array_equal(decode_image(memoryview(image_bytes)), image)
+
+def test_bytes_and_file_path_agree(tmp_path):
+    _, image_bytes = make_image_bytes(seed=1)
+    image_path = tmp_path / "sample.png"
+    image_path.write_bytes(image_bytes)
+
+    label = process_image_bytes(image_bytes)
+    assert label == process_image(str(image_path))
+    assert label in range(4)
+
+def test_undecodable_bytes_raise_value_error():
+    with pytest.raises(ValueError):
+        process_image_bytes(b"not an image")
+
+def test_label_counts_cover_every_class():
+    assert label_counts([3, 3, 0, 2]) == {"normal": 1, "kun": 0, "red": 1, "green": 2}
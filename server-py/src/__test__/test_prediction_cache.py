@@ -0,0 +1,56 @@
+import numpy as np
+import time
+
+from src.ml.prediction_cache import PredictionCache, content_hash
+
+class FakeModel:
+    sha256 = "model-a"
+
+def make_cache(**kwargs):
+    model = FakeModel()
+    return model, PredictionCache(model_identity=lambda: model.sha256, **kwargs)
+
+def test_hit_after_put():
+    _, cache = make_cache(max_entries=4, ttl_seconds=60)
+    image_hash = content_hash(b"same photo")
+    key, probabilities = cache.get(image_hash)
+    assert probabilities is None
+    cache.put(key, np.array([0.1, 0.2, 0.3, 0.4]))
+    assert np.array_equal(cache.get(content_hash(b"same photo"))[1], [0.1, 0.2, 0.3, 0.4])
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+def test_least_recently_used_entry_is_evicted():
+    _, cache = make_cache(max_entries=2, ttl_seconds=60)
+    for name in (b"a", b"b"):
+        cache.put(cache.get(content_hash(name))[0], np.zeros(4))
+    cache.get(content_hash(b"a"))
+    cache.put(cache.get(content_hash(b"c"))[0], np.zeros(4))
+    assert cache.get(content_hash(b"b"))[1] is None
+    assert cache.get(content_hash(b"a"))[1] is not None
+    assert cache.stats()["evictions"] == 1
+
+def test_entries_expire():
+    _, cache = make_cache(max_entries=2, ttl_seconds=0.01)
+    cache.put(cache.get(content_hash(b"a"))[0], np.zeros(4))
+    time.sleep(0.02)
+    assert cache.get(content_hash(b"a"))[1] is None
+    assert cache.stats()["expirations"] == 1
+
+def test_model_change_invalidates_entries():
+    model, cache = make_cache(max_entries=2, ttl_seconds=60)
+    cache.put(cache.get(content_hash(b"a"))[0], np.zeros(4))
+    model.sha256 = "model-b"
+    assert cache.get(content_hash(b"a"))[1] is None
+    assert cache.stats()["size"] == 0
+    assert cache.stats()["invalidations"] == 1
+
+def test_result_from_a_replaced_model_is_not_stored():
+    model, cache = make_cache(max_entries=2, ttl_seconds=60)
+    key, _ = cache.get(content_hash(b"a"))
+    # The model is swapped while the prediction for `key` is being computed
+    model.sha256 = "model-b"
+    cache.get(content_hash(b"other"))
+    cache.put(key, np.zeros(4))
+    assert cache.get(content_hash(b"a"))[1] is None
+    assert cache.stats()["size"] == 0
@@ -0,0 +1,49 @@
+import pytest
+import sys
+import os
+
+ML_PY_PREPROCESSING = os.path.join(os.path.dirname(__file__), "../../../ml-py/preprocessing")
+
+@pytest.fixture
+def stream_pipeline():
+    for module in ("albumentations", "pandas", "tqdm"):
+        pytest.importorskip(module)
+    sys.path.insert(0, os.path.abspath(ML_PY_PREPROCESSING))
+    try:
+        import stream_pipeline
+    finally:
+        sys.path.pop(0)
+    return stream_pipeline
+
+def make_dataset(base_path, images_per_class):
+    for folder in ("N", "R"):
+        (base_path / folder).mkdir()
+        for i in range(images_per_class):
+            (base_path / folder / f"{i:03d}.png").write_bytes(b"raw")
+
+def test_class_budget_is_spread_over_every_image(stream_pipeline, tmp_path):
+    make_dataset(tmp_path, images_per_class=10)
+    tasks, _, wanted = stream_pipeline.plan_tasks(tmp_path, per_image=64, max_per_class=25, seed=0, known={})
+
+    for label in (0, 2):
+        class_tasks = [task for task in tasks if task[3] == label]
+        assert len(class_tasks) == 10
+        assert sum(len(keep) for _, _, keep, _ in class_tasks) == 25
+        assert {len(keep) for _, _, keep, _ in class_tasks} == {2, 3}
+    assert len(wanted) == 50
+
+def test_budget_smaller_than_the_class_still_samples_across_it(stream_pipeline, tmp_path):
+    make_dataset(tmp_path, images_per_class=40)
+    tasks, _, _ = stream_pipeline.plan_tasks(tmp_path, per_image=256, max_per_class=8, seed=0, known={})
+    picked = sorted(int(os.path.basename(path)[:3]) for path, _, _, label in tasks if label == 0)
+
+    assert len(picked) == 8
+    # Not simply the first eight filenames
+    assert picked != list(range(8))
+    again, _, _ = stream_pipeline.plan_tasks(tmp_path, per_image=256, max_per_class=8, seed=0, known={})
+    assert again == tasks
+
+def test_unlimited_classes_take_per_image_from_each(stream_pipeline, tmp_path):
+    make_dataset(tmp_path, images_per_class=3)
+    tasks, _, _ = stream_pipeline.plan_tasks(tmp_path, per_image=5, max_per_class=None, seed=0, known={})
+    assert [len(keep) for _, _, keep, _ in tasks] == [5] * 6
@@ -0,0 +1,54 @@
+import lightgbm as lgb
+import numpy as np
+import pytest
+
+from src.ml.model_loader import DEFAULT_MODEL_PATH, ModelHolder
+from src.ml.tree_compiler import CompiledForest
+
+def histogram_rows(n, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = rng.dirichlet(np.full(256, 0.3), size=(n, 3)).reshape(n, 768).astype(np.float32)
+    rows[:, rng.integers(0, 768, 200)] = 0
+    return rows
+
+@pytest.fixture(scope="module")
+def served_model():
+    return lgb.Booster(model_file=DEFAULT_MODEL_PATH), CompiledForest.from_file(DEFAULT_MODEL_PATH)
+
+@pytest.mark.parametrize("batch_size", [1, 7, 256])
+def test_matches_booster_on_served_model(served_model, batch_size):
+    booster, forest = served_model
+    X = histogram_rows(batch_size)
+    expected = booster.predict(X, num_iteration=booster.best_iteration)
+    np.testing.assert_allclose(forest.predict(X, num_iteration=booster.best_iteration), expected, rtol=0, atol=1e-9)
+
+def test_partial_iterations_match(served_model):
+    booster, forest = served_model
+    X = histogram_rows(32, seed=1)
+    np.testing.assert_allclose(forest.predict(X, num_iteration=10), booster.predict(X, num_iteration=10), rtol=0, atol=1e-9)
+
+def test_booster_compatible_identity(served_model):
+    booster, forest = served_model
+    assert forest.num_trees() == booster.num_trees()
+    assert forest.num_feature() == booster.num_feature()
+    assert forest.num_model_per_iteration() == booster.num_model_per_iteration()
+
+@pytest.mark.parametrize("objective, extra", [("multiclass", {"num_class": 3}), ("binary", {})])
+@pytest.mark.parametrize("zero_as_missing", [False, True])
+def test_missing_value_handling(objective, extra, zero_as_missing):
+    rng = np.random.default_rng(2)
+    X = rng.normal(size=(600, 5))
+    X[rng.random(X.shape) < 0.1] = np.nan
+    X[rng.random(X.shape) < 0.1] = 0.0
+    num_class = extra.get("num_class", 2)
+    y = rng.integers(0, num_class, 600)
+    params = {"objective": objective, "verbose": -1, "num_leaves": 7, "min_data_in_leaf": 5, "zero_as_missing": zero_as_missing, **extra}
+    booster = lgb.train(params, lgb.Dataset(X, label=y), num_boost_round=5)
+    forest = CompiledForest(booster.model_to_string())
+    np.testing.assert_allclose(forest.predict(X), booster.predict(X), rtol=0, atol=1e-9)
+
+def test_numpy_backend_serves_same_labels():
+    X = histogram_rows(16, seed=3)
+    native = ModelHolder(DEFAULT_MODEL_PATH, "lightgbm").predict(X)
+    compiled = ModelHolder(DEFAULT_MODEL_PATH, "numpy").predict(X)
+    np.testing.assert_allclose(compiled, native, rtol=0, atol=1e-9)
@@ -0,0 +1,76 @@
+from fastapi import HTTPException
+from jose import jwt
+import pytest
+
+from src.auth import auth
+from src.auth.auth import create_access_token, get_current_user, SECRET_KEY, ALGORITHM
+from src.auth.user_cache import UserCache
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+class FakeUsers:
+    def __init__(self, users):
+        self.users = users
+        self.calls = []
+
+    async def find_one(self, query, projection=None):
+        self.calls.append((query, projection))
+        user = self.users.get(query["email"])
+        if user is None:
+            return None
+        return {key: value for key, value in user.items() if projection is None or key in projection}
+
+def test_entry_expires_after_ttl():
+    clock = FakeClock()
+    cache = UserCache(max_entries=4, ttl_seconds=60, clock=clock)
+    cache.put("a@example.com", {"_id": "1", "email": "a@example.com", "role": "user", "blood": [1, 2]})
+    assert cache.get("a@example.com") == {"_id": "1", "email": "a@example.com", "role": "user"}
+    clock.now += 61
+    assert cache.get("a@example.com") is None
+
+def test_entry_never_outlives_the_token():
+    clock = FakeClock()
+    cache = UserCache(max_entries=4, ttl_seconds=600, clock=clock)
+    cache.put("a@example.com", {"_id": "1", "email": "a@example.com"}, token_expires_at=clock.now + 5)
+    clock.now += 6
+    assert cache.get("a@example.com") is None
+
+def test_invalidate_and_lru_bound():
+    cache = UserCache(max_entries=2, ttl_seconds=60)
+    for email in ("a", "b", "c"):
+        cache.put(email, {"_id": email, "email": email})
+    assert cache.get("a") is None
+    cache.invalidate("b")
+    assert cache.get("b") is None
+    assert cache.stats()["invalidations"] == 1
+
+def test_token_has_exp_and_iat():
+    payload = jwt.decode(create_access_token("a@example.com"), SECRET_KEY, algorithms=[ALGORITHM])
+    assert payload["sub"] == "a@example.com"
+    assert payload["exp"] - payload["iat"] == auth.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+
+@pytest.mark.asyncio
+async def test_current_user_is_looked_up_once(monkeypatch):
+    users = FakeUsers({"a@example.com": {"_id": "1", "email": "a@example.com", "role": "user", "blood": [], "password": "x"}})
+    monkeypatch.setattr(auth, "users_collection", users)
+    monkeypatch.setattr(auth, "user_cache", UserCache(max_entries=4, ttl_seconds=60))
+    token = create_access_token("a@example.com")
+
+    first = await get_current_user(token)
+    second = await get_current_user(token)
+    assert first == second == {"_id": "1", "email": "a@example.com", "role": "user"}
+    assert len(users.calls) == 1
+    assert users.calls[0][1] == {"_id": 1, "email": 1, "role": 1}
+
+@pytest.mark.asyncio
+async def test_token_without_exp_is_rejected(monkeypatch):
+    monkeypatch.setattr(auth, "users_collection", FakeUsers({}))
+    token = jwt.encode({"sub": "a@example.com"}, SECRET_KEY, algorithm=ALGORITHM)
+    with pytest.raises(HTTPException) as error:
+        await get_current_user(token)
+    assert error.value.status_code == 401
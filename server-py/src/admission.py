@@ -0,0 +1,24 @@
+from contextlib import contextmanager
+
+class AdmissionGate:
+    """Bounds the work in progress on a pool; admit() sheds load instead of queueing past `limit`."""
+
+    def __init__(self, limit: int, error_class, message: str):
+        self.limit = limit
+        self.error_class = error_class
+        self.message = message
+        self.in_flight = 0
+        self.rejected_total = 0
+
+    @contextmanager
+    def admit(self, jobs: int = 1):
+        # Counts work items, not requests: a batch reserves one slot per item it will submit.
+        # A batch larger than the whole bound is still let through when nothing is in flight.
+        if self.in_flight and self.in_flight + jobs > self.limit:
+            self.rejected_total += 1
+            raise self.error_class(self.message)
+        self.in_flight += jobs
+        try:
+            yield
+        finally:
+            self.in_flight -= jobs
@@ -1,7 +1,7 @@
 # app/auth/auth.py
 from fastapi import APIRouter, HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
-from passlib.context import CryptContext
+from datetime import datetime, timedelta, timezone
 from jose import JWTError, jwt
 from pydantic import BaseModel
 from dotenv import load_dotenv
@@ -10,6 +10,9 @@ import os
 
 from ..models.userModel import UserCreateModel, UserModel
 from ..database import users_collection
+from ..metrics import stage
+from .user_cache import user_cache, USER_IDENTITY_PROJECTION
+from .passwords import password_hasher, PasswordQueueFullError
 
 router = APIRouter()
 load_dotenv()
@@ -19,8 +22,8 @@ SECRET_KEY = os.environ.get("SECRET_KEY")
 ALGORITHM = os.environ.get("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.environ.get("ACCESS_TOKEN_EXPIRE_MINUTES"))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login", auto_error=False)
 #------------------------------------------------------------------------------
 
 class Token(BaseModel):
@@ -30,28 +33,45 @@ class Token(BaseModel):
 class TokenData(BaseModel):
     email: Optional[str] = None
 
+def credentials_exception():
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+def create_access_token(email: str):
+    now = datetime.now(timezone.utc)
+    expires_at = now + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    return jwt.encode({"sub": email, "iat": now, "exp": expires_at}, SECRET_KEY, algorithm=ALGORITHM)
+
 async def get_current_user(token: str = Depends(oauth2_scheme)):
+    """Resolves the bearer token to {_id, email, role}; routes fetch any other fields themselves."""
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        # Expired tokens and tokens without an exp claim are rejected here
+        with stage("jwt_decode"):
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM], options={"require_exp": True})
         email: str = payload.get("sub")
         if email is None:
-            raise credentials_exception
+            raise credentials_exception()
         token_data = TokenData(email=email)
     except JWTError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    user = await users_collection.find_one({"email": token_data.email})
+        raise credentials_exception()
+
+    user = user_cache.get(token_data.email)
     if user is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+        with stage("user_lookup"):
+            user = await users_collection.find_one({"email": token_data.email}, USER_IDENTITY_PROJECTION)
+        if user is None:
+            raise credentials_exception()
+        user_cache.put(token_data.email, user, token_expires_at=payload["exp"])
     return user
 
+async def get_optional_current_user(token: Optional[str] = Depends(optional_oauth2_scheme)):
+    if token is None:
+        return None
+    return await get_current_user(token)
+
 @router.post("/register")
 async def register(user: UserCreateModel):
     user_exists = await users_collection.find_one({"email": user.email})
@@ -61,11 +81,15 @@ async def register(user: UserCreateModel):
             detail="Email already registered"
         )
     
-    hashed_password = pwd_context.hash(user.password)
+    try:
+        hashed_password = await password_hasher.hash(user.password)
+    except PasswordQueueFullError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e), headers={"Retry-After": "1"})
     user_dict = user.dict()
     user_dict['password'] = hashed_password
     
     new_user = UserModel(**user_dict)
     await users_collection.insert_one(new_user.dict(by_alias=True))
+    user_cache.invalidate(new_user.email)
     
     return {"User registered successfully"}
\ No newline at end of file
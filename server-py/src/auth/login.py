@@ -1,29 +1,37 @@
 from fastapi import APIRouter, HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordRequestForm
-from passlib.context import CryptContext
 from pydantic import BaseModel
-from jose import jwt
 
 from ..database import users_collection
-from .auth import SECRET_KEY, ALGORITHM
+from .auth import create_access_token
+from .passwords import password_hasher, PasswordQueueFullError
+from ..metrics import stage
 
 router = APIRouter()
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 class Token(BaseModel):
     access_token: str
     token_type: str
 
 async def authenticate_user(email: str, password: str):
-    user = await users_collection.find_one({"email": email})
-    if user and pwd_context.verify(password, user["password"]):
-        return user
-    return None
+    with stage("user_lookup"):
+        user = await users_collection.find_one({"email": email}, {"email": 1, "password": 1})
+    if user is None:
+        return None
+    verified, new_hash = await password_hasher.verify_and_update(password, user["password"])
+    if not verified:
+        return None
+    if new_hash:
+        # Stored with an older bcrypt cost: upgrade it while we have the plaintext
+        await users_collection.update_one({"_id": user["_id"], "password": user["password"]}, {"$set": {"password": new_hash}})
+    return user
 
 @router.post("/", response_model=Token)
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = await authenticate_user(form_data.username, form_data.password)
+    try:
+        user = await authenticate_user(form_data.username, form_data.password)
+    except PasswordQueueFullError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e), headers={"Retry-After": "1"})
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -31,5 +39,5 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    access_token = jwt.encode({"sub": user["email"]}, SECRET_KEY, algorithm=ALGORITHM)
+    access_token = create_access_token(user["email"])
     return {"access_token": access_token, "token_type": "bearer"}
\ No newline at end of file
@@ -0,0 +1,86 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from passlib.context import CryptContext
+import asyncio
+import time
+import os
+
+from .. import metrics
+from ..admission import AdmissionGate
+from ..metrics import stage, record_stage
+
+#------------------ Password hashing settings ---------------------------------
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS") or 12)
+PASSWORD_WORKERS = int(os.environ.get("PASSWORD_WORKERS") or 2)
+PASSWORD_QUEUE_SIZE = int(os.environ.get("PASSWORD_QUEUE_SIZE") or 32)
+#------------------------------------------------------------------------------
+
+# Single context for register and login. Hashes made with a different cost count as
+# needing an update, so login re-hashes them at BCRYPT_ROUNDS.
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+class PasswordQueueFullError(Exception):
+    pass
+
+class PasswordHasher:
+    """Runs bcrypt on a small dedicated thread pool so it never blocks the event loop."""
+
+    def __init__(self, context: CryptContext = pwd_context, workers: int = PASSWORD_WORKERS, queue_size: int = PASSWORD_QUEUE_SIZE):
+        self.context = context
+        self.workers = workers
+        self.queue_size = queue_size
+        self._executor = None
+        # At most `workers` hashes run at once and `queue_size` more may wait; beyond that we shed load
+        self._gate = AdmissionGate(workers + queue_size, PasswordQueueFullError, "Too many password operations in progress")
+        self.operations_total = 0
+        self.queue_wait_sum = 0.0
+        self.queue_wait_max = 0.0
+
+    def start(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _timed(self, submitted, stage_name, fn, *args):
+        wait = time.perf_counter() - submitted
+        self.operations_total += 1
+        self.queue_wait_sum += wait
+        self.queue_wait_max = max(self.queue_wait_max, wait)
+        if metrics.METRICS_ENABLED:
+            record_stage("password_queue", wait)
+        with stage(stage_name):
+            return fn(*args)
+
+    async def _run(self, stage_name, fn, *args):
+        with self._gate.admit():
+            executor = self.start()
+            # The copied context carries the request's stage timings into the bcrypt thread
+            return await asyncio.get_running_loop().run_in_executor(
+                executor, copy_context().run, self._timed, time.perf_counter(), stage_name, fn, *args
+            )
+
+    async def hash(self, password: str) -> str:
+        return await self._run("password_hash", self.context.hash, password)
+
+    async def verify_and_update(self, password: str, hashed_password: str):
+        """(verified, new_hash); new_hash is set when the stored hash used an outdated cost."""
+        return await self._run("password_verify", self.context.verify_and_update, password, hashed_password)
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "bcrypt_rounds": self.context.to_dict().get("bcrypt__rounds", BCRYPT_ROUNDS),
+            "in_flight": self._gate.in_flight,
+            "rejected_total": self._gate.rejected_total,
+            "operations_total": self.operations_total,
+            "mean_queue_wait_ms": 1000 * self.queue_wait_sum / self.operations_total if self.operations_total else 0.0,
+            "max_queue_wait_ms": 1000 * self.queue_wait_max,
+        }
+
+password_hasher = PasswordHasher()
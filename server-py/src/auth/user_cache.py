@@ -0,0 +1,47 @@
+import time
+import os
+
+from ..lru_cache import LRUCache
+
+#------------------ User cache settings ---------------------------------------
+USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE") or 10000)
+USER_CACHE_TTL = float(os.environ.get("USER_CACHE_TTL") or 300)       # seconds, also capped by the token's exp
+#------------------------------------------------------------------------------
+
+# The only fields get_current_user hands to routes; everything else is fetched by the route itself
+USER_IDENTITY_PROJECTION = {"_id": 1, "email": 1, "role": 1}
+
+class UserCache:
+    """LRU + TTL cache of the projected user identity (_id, email, role), keyed by email."""
+
+    def __init__(self, max_entries: int = USER_CACHE_SIZE, ttl_seconds: float = USER_CACHE_TTL, clock=time.time):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # Wall-clock, so entries can be capped by the token's exp
+        self._cache = LRUCache(max_entries, ttl_seconds, clock=clock)
+        self.invalidations = 0
+
+    def get(self, email):
+        user = self._cache.get(email)
+        return None if user is None else dict(user)
+
+    def put(self, email, user, token_expires_at=None):
+        # An entry never outlives the token that loaded it
+        self._cache.put(email, {key: user[key] for key in USER_IDENTITY_PROJECTION if key in user}, expires_at=token_expires_at)
+
+    def invalidate(self, email):
+        if self._cache.pop(email):
+            self.invalidations += 1
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        return {
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            **self._cache.stats(),
+            "invalidations": self.invalidations,
+        }
+
+user_cache = UserCache()
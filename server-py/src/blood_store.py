@@ -0,0 +1,165 @@
+from datetime import date, datetime, time, timedelta
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+import asyncio
+
+from .database import blood_readings_collection, blood_rollups_collection
+
+# One document per user per day in `blood_readings`:
+#   {user_id, date: <UTC midnight>, green, normal, red, kun, total}
+# A regular collection with a unique (user_id, date) index rather than a time-series
+# collection: time-series collections cannot enforce uniqueness and only allow updates
+# on the meta field, which rules out the per-day $inc upserts below.
+#
+# Every write also $incs the matching week and month bucket in `blood_rollups`:
+#   {user_id, period: "week" | "month", start: <UTC midnight>, green, normal, red, kun, total}
+# Ratios are derived from the sums when read, so buckets stay plain counters.
+
+MAX_READINGS_PAGE = 366
+RECENT_DAYS = 30
+# The default window, today - RECENT_DAYS through today inclusive, holds RECENT_DAYS + 1 days
+DEFAULT_READINGS_PAGE = RECENT_DAYS + 1
+
+BLOOD_FIELDS = ("green", "normal", "red", "kun")
+READING_PROJECTION = {"_id": 0, "date": 1, "total": 1, **{field: 1 for field in BLOOD_FIELDS}}
+
+def day_start(day: date) -> datetime:
+    # BSON has no date-only type; days are stored as naive UTC midnights
+    return datetime.combine(day, time.min)
+
+def week_start(day: date) -> date:
+    return day - timedelta(days=day.weekday())
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+ROLLUP_PERIODS = {"week": week_start, "month": month_start}
+
+def reading_out(document):
+    reading = {field: document.get(field, 0) for field in BLOOD_FIELDS}
+    reading["total"] = document.get("total", sum(reading.values()))
+    reading["date"] = document["date"].date().isoformat()
+    return reading
+
+async def ensure_indexes():
+    # Serves both the (user, date) upserts and the newest-first range reads
+    await blood_readings_collection.create_index(
+        [("user_id", ASCENDING), ("date", DESCENDING)], unique=True, name="user_date"
+    )
+    await blood_rollups_collection.create_index(
+        [("user_id", ASCENDING), ("period", ASCENDING), ("start", ASCENDING)], unique=True, name="user_period_start"
+    )
+
+async def find_readings(user_id, from_date: date = None, to_date: date = None, limit: int = DEFAULT_READINGS_PAGE, before: date = None):
+    """Newest-first readings for one user within [from_date, to_date], strictly before `before` if given."""
+    date_range = {}
+    if from_date is not None:
+        date_range["$gte"] = day_start(from_date)
+    if to_date is not None:
+        date_range["$lte"] = day_start(to_date)
+    if before is not None:
+        date_range["$lt"] = day_start(before)
+    query = {"user_id": user_id}
+    if date_range:
+        query["date"] = date_range
+    cursor = blood_readings_collection.find(query, READING_PROJECTION).sort("date", DESCENDING).limit(limit)
+    return [reading_out(document) async for document in cursor]
+
+def increments_for(counts: dict):
+    increments = {field: counts.get(field) or 0 for field in BLOOD_FIELDS}
+    increments["total"] = sum(increments.values())
+    return increments
+
+def rollup_updates(user_id, days: dict):
+    """One $inc upsert per week/month bucket touched by `days` ({day: increments})."""
+    buckets = {}
+    for day, increments in days.items():
+        for period, bucket_start in ROLLUP_PERIODS.items():
+            totals = buckets.setdefault((period, bucket_start(day)), dict.fromkeys(increments, 0))
+            for field, value in increments.items():
+                totals[field] += value
+    return [
+        UpdateOne({"user_id": user_id, "period": period, "start": day_start(start)}, {"$inc": totals}, upsert=True)
+        for (period, start), totals in buckets.items()
+    ]
+
+async def increment_rollups(user_id, days: dict):
+    await blood_rollups_collection.bulk_write(rollup_updates(user_id, days), ordered=False)
+
+async def _increment_reading(user_id, day: date, increments: dict):
+    # Single atomic round-trip: creates the day's document on first write, adds to it afterwards,
+    # and hands back the document exactly as this write left it
+    document = await blood_readings_collection.find_one_and_update(
+        {"user_id": user_id, "date": day_start(day)},
+        {"$inc": increments},
+        upsert=True,
+        projection=READING_PROJECTION,
+        return_document=ReturnDocument.AFTER,
+    )
+    return reading_out(document)
+
+async def increment_day(user_id, day: date, counts: dict):
+    increments = increments_for(counts)
+    reading, _ = await asyncio.gather(
+        _increment_reading(user_id, day, increments),
+        increment_rollups(user_id, {day: increments}),
+    )
+    return reading
+
+def reading_updates(user_id, days: dict):
+    """One $inc upsert per day in `days` ({day: increments})."""
+    return [
+        UpdateOne({"user_id": user_id, "date": day_start(day)}, {"$inc": increments}, upsert=True)
+        for day, increments in days.items()
+    ]
+
+async def increment_days(user_id, entries):
+    """Add many (day, counts) entries; returns only the affected days, newest first.
+
+    Two round-trips whatever the batch size: one unordered bulk_write for the days (issued
+    alongside the rollup bulk_write), then one find restricted to those days. The readings
+    and rollup writes are separate operations, not a transaction, and the read-back shows
+    any concurrent write to the same days as well.
+    """
+    days = {}
+    for day, counts in entries:
+        increments = increments_for(counts)
+        if day in days:
+            # One update per day keeps concurrent upserts of a new day from colliding inside the batch
+            for field, value in increments.items():
+                days[day][field] += value
+        else:
+            days[day] = increments
+    if not days:
+        return []
+    await asyncio.gather(
+        blood_readings_collection.bulk_write(reading_updates(user_id, days), ordered=False),
+        increment_rollups(user_id, days),
+    )
+    query = {"user_id": user_id, "date": {"$in": [day_start(day) for day in days]}}
+    cursor = blood_readings_collection.find(query, READING_PROJECTION).sort("date", DESCENDING)
+    return [reading_out(document) async for document in cursor]
+
+def rollup_out(document):
+    bucket = {field: document.get(field, 0) for field in BLOOD_FIELDS}
+    bucket["total"] = document.get("total", sum(bucket.values()))
+    bucket["ratios"] = {
+        field: bucket[field] / bucket["total"] if bucket["total"] else 0.0 for field in BLOOD_FIELDS
+    }
+    return bucket
+
+async def find_rollups(user_id, period: str, from_date: date, to_date: date):
+    """Oldest-first buckets overlapping [from_date, to_date] plus their combined summary."""
+    query = {
+        "user_id": user_id,
+        "period": period,
+        "start": {"$gte": day_start(ROLLUP_PERIODS[period](from_date)), "$lte": day_start(to_date)},
+    }
+    projection = {"_id": 0, "start": 1, "total": 1, **{field: 1 for field in BLOOD_FIELDS}}
+    buckets = []
+    summary = dict.fromkeys(BLOOD_FIELDS, 0)
+    async for document in blood_rollups_collection.find(query, projection).sort("start", ASCENDING):
+        buckets.append({"start": document["start"].date().isoformat(), **rollup_out(document)})
+        for field in BLOOD_FIELDS:
+            summary[field] += document.get(field, 0)
+    summary["total"] = sum(summary.values())
+    return buckets, rollup_out(summary)
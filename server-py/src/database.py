@@ -20,6 +20,9 @@ client = AsyncIOMotorClient(DB_URL)
 db = client["Blood-Scanner"]
 users_collection = db['users']
 images_collection = db['images.files']
+blood_readings_collection = db['blood_readings']
+blood_rollups_collection = db['blood_rollups']
 #fs = AsyncIOMotorGridFSBucket(db)
 image_fs = AsyncIOMotorGridFSBucket(db, bucket_name='images')
+variant_fs = AsyncIOMotorGridFSBucket(db, bucket_name='image_variants')
 #--------------------------------------------------------------
\ No newline at end of file
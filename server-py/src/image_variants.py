@@ -0,0 +1,135 @@
+from gridfs.errors import NoFile
+import asyncio
+import time
+import os
+
+from .database import image_fs, variant_fs
+from .ml.executor import inference_pool
+from .ml.variants import VARIANT_TYPES, render_variants
+from .metrics import stage
+from .lru_cache import LRUCache
+
+#------------------ Variant cache settings ------------------------------------
+VARIANT_CACHE_BYTES = int(os.environ.get("VARIANT_CACHE_BYTES") or 64 * 1024 * 1024)
+VARIANT_FAILURE_TTL = float(os.environ.get("VARIANT_FAILURE_TTL") or 60)       # seconds a failed render is remembered
+#------------------------------------------------------------------------------
+
+# Variants live in the `image_variants` bucket as "<original id>/<variant>", so the bucket's
+# own filename index finds them and the newest revision wins if one is ever rendered twice.
+
+def variant_name(original_id, variant):
+    return f"{original_id}/{variant}"
+
+generation_stats = {"generated": 0, "failed": 0}
+
+class VariantCache:
+    """LRU of stored variants keyed by (original id, variant), bounded by total bytes."""
+
+    def __init__(self, max_bytes: int = VARIANT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        # entry is (content, content_type, variant file id, upload date)
+        self._cache = LRUCache(max_bytes, sizeof=lambda entry: len(entry[0]))
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def put(self, key, entry):
+        self._cache.put(key, entry)
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        stats = self._cache.stats()
+        return {
+            "max_bytes": self.max_bytes,
+            "size_bytes": self._cache.total_size,
+            "entries": stats["size"],
+            "hits": stats["hits"],
+            "misses": stats["misses"],
+            "hit_ratio": stats["hit_ratio"],
+            "evictions": stats["evictions"],
+            "generated": generation_stats["generated"],
+            "failed": generation_stats["failed"],
+        }
+
+variant_cache = VariantCache()
+
+# One render per original at a time, however many requests or uploads ask for it
+_pending = {}
+# original id -> (expires_at, error) for originals that are missing or cannot be decoded
+_failures = {}
+
+def _remember_failure(original_id, error):
+    now = time.monotonic()
+    for expired in [key for key, (expires_at, _) in _failures.items() if expires_at <= now]:
+        del _failures[expired]
+    _failures[original_id] = (now + VARIANT_FAILURE_TTL, error)
+
+def _raise_if_failed(original_id):
+    # Pool saturation is never remembered: it is transient, unlike a broken original
+    failure = _failures.get(original_id)
+    if failure is not None:
+        if failure[0] > time.monotonic():
+            raise failure[1]
+        del _failures[original_id]
+
+async def _generate(original_id):
+    try:
+        with stage("gridfs_read"):
+            original = await (await image_fs.open_download_stream(original_id)).read()
+        with inference_pool.admit():
+            variants = await inference_pool.run(render_variants, original)
+    except (NoFile, ValueError) as error:
+        _remember_failure(original_id, error)
+        raise
+    with stage("gridfs_write"):
+        await asyncio.gather(*(
+            variant_fs.upload_from_stream(
+                variant_name(original_id, variant),
+                content,
+                metadata={"original_id": original_id, "variant": variant, "contentType": VARIANT_TYPES[variant]},
+            )
+            for variant, content in variants.items()
+        ))
+    generation_stats["generated"] += 1
+
+async def generate_variants(original_id):
+    _raise_if_failed(original_id)
+    task = _pending.get(original_id)
+    if task is None:
+        task = asyncio.ensure_future(_generate(original_id))
+        _pending[original_id] = task
+        task.add_done_callback(lambda _: _pending.pop(original_id, None))
+    # A waiter that goes away (client disconnect) must not cancel the render for the others
+    await asyncio.shield(task)
+
+async def generate_in_background(original_ids):
+    # Runs after the upload response is sent; anything that fails here is rendered on first request instead
+    for original_id in original_ids:
+        try:
+            await generate_variants(original_id)
+        except Exception:
+            generation_stats["failed"] += 1
+
+async def load_variant(original_id, variant):
+    """(content, content_type, variant file id, upload date); renders the variants first if they are missing."""
+    key = (original_id, variant)
+    entry = variant_cache.get(key)
+    if entry is not None:
+        return entry
+    _raise_if_failed(original_id)
+    name = variant_name(original_id, variant)
+    try:
+        with stage("gridfs_open"):
+            grid_out = await variant_fs.open_download_stream_by_name(name)
+    except NoFile:
+        await generate_variants(original_id)
+        with stage("gridfs_open"):
+            grid_out = await variant_fs.open_download_stream_by_name(name)
+    with stage("gridfs_read"):
+        content = await grid_out.read()
+    content_type = (grid_out.metadata or {}).get("contentType") or VARIANT_TYPES[variant]
+    entry = (content, content_type, grid_out._id, grid_out.upload_date)
+    variant_cache.put(key, entry)
+    return entry
@@ -0,0 +1,83 @@
+from collections import OrderedDict
+import time
+
+class LRUCache:
+    """Size-bounded LRU with optional TTL, shared by the user, prediction and variant caches.
+
+    Each entry weighs `sizeof(value)` (1 by default, so `max_size` counts entries); a value
+    heavier than the whole bound is not stored. A `max_size` of 0 or less disables the cache.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float = None, clock=time.monotonic, sizeof=None):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.sizeof = sizeof or (lambda value: 1)
+        self._entries = OrderedDict()
+        self.total_size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        if self.max_size <= 0:
+            return None
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at is not None and expires_at <= self.clock():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value, expires_at=None):
+        """Stores `value` until the TTL runs out, or until `expires_at` if that comes first."""
+        size = self.sizeof(value)
+        if size > self.max_size:
+            return
+        if self.ttl_seconds is not None:
+            ttl_expiry = self.clock() + self.ttl_seconds
+            expires_at = ttl_expiry if expires_at is None else min(expires_at, ttl_expiry)
+        self._remove(key)
+        self._entries[key] = (expires_at, value)
+        self.total_size += size
+        while self.total_size > self.max_size:
+            evicted = next(iter(self._entries))
+            self._remove(evicted)
+            self.evictions += 1
+
+    def pop(self, key):
+        """Drops `key`; True if it was cached."""
+        return self._remove(key)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        self.total_size -= self.sizeof(entry[1])
+        return True
+
+    def clear(self):
+        self._entries.clear()
+        self.total_size = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
@@ -1,13 +1,47 @@
 from starlette.middleware.sessions import SessionMiddleware
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager, suppress
 from dotenv import load_dotenv
+from pymongo.errors import PyMongoError
 from fastapi import FastAPI
+import logging
+import asyncio
 import os
 
-from .routers import users, blood, file_upload
+from .routers import users, blood, file_upload, metrics
 from .auth import auth, login
+from .ml.model_loader import model_fingerprint
+from .ml.batcher import prediction_batcher
+from .ml.executor import inference_pool, worker_model_identity
+from .auth.passwords import password_hasher
+from .blood_store import ensure_indexes
+from .metrics import METRICS_ENABLED, ServerTimingMiddleware
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Only the inference workers parse the model; the loop just tracks the file's hash for cache keys
+    model_fingerprint.refresh()
+    fingerprint_watch = asyncio.create_task(model_fingerprint.watch())
+    try:
+        await ensure_indexes()
+    except PyMongoError:
+        # The indexes only speed up and dedupe blood writes; serve anyway and retry on the next start
+        logger.exception("Could not create blood indexes")
+    inference_pool.start()
+    # Fails startup on a broken model file, and warms the first worker
+    await inference_pool.run(worker_model_identity)
+    await prediction_batcher.start()
+    yield
+    fingerprint_watch.cancel()
+    with suppress(asyncio.CancelledError):
+        await fingerprint_watch
+    await prediction_batcher.stop()
+    inference_pool.shutdown()
+    password_hasher.shutdown()
+
+app = FastAPI(lifespan=lifespan)
 load_dotenv()
 
 origins = [
@@ -21,7 +55,9 @@ app.add_middleware(
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["*"],
-    allow_headers=["*"]
+    allow_headers=["*"],
+    # Cross-origin clients can only read response headers listed here; GET /blood/ pages with it
+    expose_headers=["X-Next-Cursor"]
 )
 
 app.add_middleware(
@@ -29,8 +65,14 @@ app.add_middleware(
     secret_key=os.environ.get("SECRET_KEY")
 )
 
+# Per-stage timings: Server-Timing header on every response and /metrics for Prometheus
+if METRICS_ENABLED:
+    app.add_middleware(ServerTimingMiddleware)
+
 app.include_router(auth.router, prefix="/auth", tags=["Authorization"])
 app.include_router(login.router, prefix="/login", tags=["Login"])
 app.include_router(users.router, prefix="/users", tags=["Users"])
 app.include_router(blood.router, prefix="/blood", tags=["Blood"])
 app.include_router(file_upload.router, prefix="/files", tags=["File Upload"])
+if METRICS_ENABLED:
+    app.include_router(metrics.router, prefix="/metrics", tags=["Metrics"])
@@ -0,0 +1,166 @@
+from contextvars import ContextVar
+from bisect import bisect_left
+import threading
+import time
+import os
+
+#------------------ Metrics settings ------------------------------------------
+# Off by default: stage() then hands back one shared no-op object and nothing is recorded
+METRICS_ENABLED = (os.environ.get("METRICS_ENABLED") or "false").lower() in ("1", "true", "yes")
+METRICS_PREFIX = "blood_scanner"
+# Upper bounds in seconds, from 0.5 ms to 10 s
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+#------------------------------------------------------------------------------
+
+class Histogram:
+    """Cumulative-bucket latency histogram for one label set, in Prometheus layout."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)                                                     # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+class MetricsRegistry:
+    """Histogram families keyed by label values, rendered in the Prometheus text format."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._families = {}                                                                         # name -> (help, label names, {label values: Histogram})
+        self._lock = threading.Lock()                                                               # Thread-pool workers observe too
+
+    def observe(self, name, labels, seconds, help="", label_names=("stage",)):
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = self._families[name] = (help, label_names, {})
+            histogram = family[2].get(labels)
+            if histogram is None:
+                histogram = family[2][labels] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def snapshot(self, name):
+        # {label values: (count, sum)}
+        with self._lock:
+            family = self._families.get(name)
+            return {labels: (h.count, h.sum) for labels, h in family[2].items()} if family else {}
+
+    def clear(self):
+        with self._lock:
+            self._families.clear()
+
+    def render(self, gauges=None):
+        lines = []
+        with self._lock:
+            for name, (help, label_names, series) in sorted(self._families.items()):
+                metric = f"{METRICS_PREFIX}_{name}"
+                lines.append(f"# HELP {metric} {help}")
+                lines.append(f"# TYPE {metric} histogram")
+                for labels, histogram in sorted(series.items()):
+                    label_text = ",".join(f'{key}="{_escape(value)}"' for key, value in zip(label_names, labels))
+                    prefix = label_text + "," if label_text else ""
+                    cumulative = 0
+                    for bound, count in zip(self.buckets + (float("inf"),), histogram.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f'{metric}_bucket{{{prefix}le="{le}"}} {cumulative}')
+                    lines.append(f"{metric}_sum{{{label_text}}} {histogram.sum!r}")
+                    lines.append(f"{metric}_count{{{label_text}}} {histogram.count}")
+        for name, value in sorted((gauges or {}).items()):
+            metric = f"{METRICS_PREFIX}_{name}"
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {float(value)!r}")
+        return "\n".join(lines) + "\n"
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+registry = MetricsRegistry()
+
+# Stage timings of the current request, read by ServerTimingMiddleware for the Server-Timing header
+_request_timings: ContextVar = ContextVar("request_timings", default=None)
+
+class _StageTimer:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record_stage(self.name, time.perf_counter() - self.start)
+        return False
+
+class _NoopTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NOOP = _NoopTimer()
+
+def stage(name):
+    """Context manager timing one hot-path stage; a shared no-op when metrics are off."""
+    return _StageTimer(name) if METRICS_ENABLED else _NOOP
+
+def record_stage(name, seconds):
+    registry.observe("stage_duration_seconds", (name,), seconds, help="Time spent in one request stage")
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((name, seconds))
+
+def server_timing_header(timings, total):
+    # Same-named stages (e.g. one decode per image of a batch) are summed into one entry
+    merged = {}
+    for name, seconds in timings:
+        merged[name] = merged.get(name, 0.0) + seconds
+    entries = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in merged.items()]
+    entries.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(entries)
+
+class ServerTimingMiddleware:
+    """Times every HTTP request and adds its stage timings as a Server-Timing response header."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        timings = []
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing_header(timings, time.perf_counter() - start).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_timings.reset(token)
+            # Endpoint name rather than the raw URL keeps the label set small (ids stay out of it)
+            route = scope.get("route")
+            route_name = getattr(route, "name", None) or "unmatched"
+            registry.observe(
+                "http_request_duration_seconds", (scope["method"], route_name, str(status_code)), time.perf_counter() - start,
+                help="HTTP request latency", label_names=("method", "route", "status"),
+            )
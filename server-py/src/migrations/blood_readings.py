@@ -0,0 +1,74 @@
+"""One-shot move of the embedded `users.blood` arrays into `blood_readings`.
+
+    python -m src.migrations.blood_readings [--drop-embedded]
+
+Days that already have a reading are left alone ($setOnInsert), so re-running never
+overwrites counts that live $inc writes added after deploy. The flip side: embedded
+entries for a day the new write path already created are not merged in. The weekly
+and monthly rollups are rebuilt afterwards.
+"""
+from datetime import date, datetime
+from pymongo import UpdateOne
+import argparse
+import asyncio
+
+from ..database import users_collection, blood_readings_collection
+from ..blood_store import BLOOD_FIELDS, day_start, ensure_indexes
+from .blood_rollups import rebuild
+
+def entry_day(entry):
+    value = entry.get("date")
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if isinstance(value, str):
+        try:
+            return date.fromisoformat(value[:10])
+        except ValueError:
+            return None
+    return None
+
+def merge_entries(entries):
+    """Sum the embedded entries per day; the old PUT could leave several entries on one date."""
+    days = {}
+    for entry in entries or []:
+        day = entry_day(entry)
+        if day is None:
+            continue
+        totals = days.setdefault(day, dict.fromkeys(BLOOD_FIELDS, 0))
+        for field in BLOOD_FIELDS:
+            totals[field] += entry.get(field) or 0
+    for totals in days.values():
+        totals["total"] = sum(totals[field] for field in BLOOD_FIELDS)
+    return days
+
+def reading_upserts(user_id, entries):
+    return [
+        UpdateOne({"user_id": user_id, "date": day_start(day)}, {"$setOnInsert": totals}, upsert=True)
+        for day, totals in merge_entries(entries).items()
+    ]
+
+async def migrate(drop_embedded: bool = False):
+    await ensure_indexes()
+    users = readings = 0
+    async for user in users_collection.find({"blood.0": {"$exists": True}}, {"blood": 1}):
+        operations = reading_upserts(user["_id"], user["blood"])
+        if operations:
+            await blood_readings_collection.bulk_write(operations, ordered=False)
+        if drop_embedded:
+            await users_collection.update_one({"_id": user["_id"]}, {"$unset": {"blood": ""}})
+        users += 1
+        readings += len(operations)
+    await rebuild()
+    return users, readings
+
+def main():
+    parser = argparse.ArgumentParser(description="Move embedded blood arrays into the blood_readings collection")
+    parser.add_argument("--drop-embedded", action="store_true", help="Remove users.blood once its readings are written")
+    args = parser.parse_args()
+    users, readings = asyncio.run(migrate(args.drop_embedded))
+    print(f"Migrated {readings} readings for {users} users")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Recompute the weekly and monthly `blood_rollups` buckets from `blood_readings`.
+
+    python -m src.migrations.blood_rollups [--period week|month]
+
+Runs entirely in MongoDB ($dateTrunc needs 5.0+). Buckets are replaced, not
+incremented, so the command can be re-run at any time; writes that land while it
+runs may need another pass. Live buckets are never emptied: every bucket is merged
+first, and only the ones this run did not rewrite are deleted afterwards.
+"""
+from bson import ObjectId
+from datetime import datetime, timezone
+import argparse
+import asyncio
+
+from ..database import blood_readings_collection, blood_rollups_collection
+from ..blood_store import BLOOD_FIELDS, ROLLUP_PERIODS, ensure_indexes
+
+def rollup_pipeline(period: str, rebuilt_at: datetime):
+    sums = {field: {"$sum": f"${field}"} for field in (*BLOOD_FIELDS, "total")}
+    return [
+        {"$group": {
+            "_id": {
+                "user_id": "$user_id",
+                "start": {"$dateTrunc": {"date": "$date", "unit": period, "startOfWeek": "monday"}},
+            },
+            **sums,
+        }},
+        {"$project": {
+            "_id": 0,
+            "user_id": "$_id.user_id",
+            "period": {"$literal": period},
+            "start": "$_id.start",
+            "rebuilt_at": {"$literal": rebuilt_at},
+            **{field: 1 for field in sums},
+        }},
+        {"$merge": {
+            "into": blood_rollups_collection.name,
+            "on": ["user_id", "period", "start"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert",
+        }},
+    ]
+
+def stale_buckets(period: str, rebuilt_at: datetime):
+    # Buckets the merge did not rewrite have no readings left, unless a live write
+    # created them after the rebuild started; those are newer than the marker's ObjectId
+    return {
+        "period": period,
+        "rebuilt_at": {"$ne": rebuilt_at},
+        "_id": {"$lt": ObjectId.from_datetime(rebuilt_at)},
+    }
+
+async def rebuild(periods=tuple(ROLLUP_PERIODS)):
+    await ensure_indexes()
+    for period in periods:
+        rebuilt_at = datetime.now(timezone.utc).replace(microsecond=0)
+        await blood_readings_collection.aggregate(rollup_pipeline(period, rebuilt_at)).to_list(None)
+        await blood_rollups_collection.delete_many(stale_buckets(period, rebuilt_at))
+        count = await blood_rollups_collection.count_documents({"period": period})
+        print(f"Rebuilt {count} {period} buckets")
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild blood_rollups from blood_readings")
+    parser.add_argument("--period", choices=list(ROLLUP_PERIODS), action="append", help="Only rebuild this period (repeatable)")
+    args = parser.parse_args()
+    asyncio.run(rebuild(tuple(args.period or ROLLUP_PERIODS)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import numpy as np
+import inspect
+import asyncio
+import time
+import os
+
+from .executor import inference_pool, predict_matrix
+
+#------------------ Micro-batching settings -----------------------------------
+PREDICT_BATCH_SIZE = int(os.environ.get("PREDICT_BATCH_SIZE") or 32)
+PREDICT_BATCH_WAIT_MS = float(os.environ.get("PREDICT_BATCH_WAIT_MS") or 5)
+#------------------------------------------------------------------------------
+
+async def _pool_predict(feature_matrix):
+    # Batched predict runs on an inference worker, never on the event loop
+    return await inference_pool.run(predict_matrix, feature_matrix)
+
+class PredictionBatcher:
+    """Collects concurrent feature vectors and scores them with one vectorized predict call."""
+
+    def __init__(self, predict_fn=None, max_batch_size: int = PREDICT_BATCH_SIZE, max_wait_ms: float = PREDICT_BATCH_WAIT_MS):
+        self.predict_fn = predict_fn or _pool_predict
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = None
+        self._worker = None
+        self._loop = None
+        self._reset_metrics()
+
+    def _reset_metrics(self):
+        self.batches_total = 0
+        self.rows_total = 0
+        self.max_batch_seen = 0
+        self.batch_size_counts = {}
+        self.queue_delay_sum = 0.0
+        self.queue_delay_max = 0.0
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None and self._loop is asyncio.get_running_loop():
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        self._worker = None
+
+    async def predict(self, feature_vector):
+        # Returns the class-probability row for a single 768-d feature vector
+        await self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((feature_vector, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        # Anything already queued rides along without waiting
+        while len(batch) < self.max_batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            dispatched_at = time.perf_counter()
+            self._record(batch, dispatched_at)
+            try:
+                probabilities = await self._predict_batch(np.stack([vector for vector, _, _ in batch]))
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for row, (_, future, _) in zip(probabilities, batch):
+                if not future.done():
+                    future.set_result(row)
+
+    async def _predict_batch(self, feature_matrix):
+        result = self.predict_fn(feature_matrix)
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+    def _record(self, batch, dispatched_at):
+        size = len(batch)
+        self.batches_total += 1
+        self.rows_total += size
+        self.max_batch_seen = max(self.max_batch_seen, size)
+        self.batch_size_counts[size] = self.batch_size_counts.get(size, 0) + 1
+        for _, _, enqueued_at in batch:
+            delay = dispatched_at - enqueued_at
+            self.queue_delay_sum += delay
+            self.queue_delay_max = max(self.queue_delay_max, delay)
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches_total": self.batches_total,
+            "rows_total": self.rows_total,
+            "mean_batch_size": self.rows_total / self.batches_total if self.batches_total else 0.0,
+            "max_batch_seen": self.max_batch_seen,
+            "batch_size_counts": dict(sorted(self.batch_size_counts.items())),
+            "mean_queue_delay_ms": 1000 * self.queue_delay_sum / self.rows_total if self.rows_total else 0.0,
+            "max_queue_delay_ms": 1000 * self.queue_delay_max,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+        }
+
+prediction_batcher = PredictionBatcher()
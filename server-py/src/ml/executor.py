@@ -0,0 +1,121 @@
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from contextvars import copy_context
+import threading
+import asyncio
+import time
+import os
+
+from .model_loader import ModelHolder, MODEL_PATH, MODEL_BACKEND
+from .pipeline import decode_image, extract_features
+from .. import metrics
+from ..admission import AdmissionGate
+from ..metrics import stage, record_stage
+
+#------------------ Inference pool settings -----------------------------------
+INFERENCE_POOL = (os.environ.get("INFERENCE_POOL") or "thread").lower()      # thread | process
+INFERENCE_WORKERS = int(os.environ.get("INFERENCE_WORKERS") or os.cpu_count() or 1)
+INFERENCE_QUEUE_SIZE = int(os.environ.get("INFERENCE_QUEUE_SIZE") or 64)
+MAX_BATCH_IMAGES = int(os.environ.get("MAX_BATCH_IMAGES") or 64)
+#------------------------------------------------------------------------------
+
+class PoolSaturatedError(Exception):
+    pass
+
+# Each pool worker (thread or process) owns its own preloaded model
+_worker_state = threading.local()
+
+def _init_worker(model_path, backend=MODEL_BACKEND):
+    _worker_state.model = ModelHolder(model_path, backend)
+    _worker_state.model.load()
+
+def _worker_model():
+    if getattr(_worker_state, "model", None) is None:
+        _init_worker(MODEL_PATH)
+    return _worker_state.model
+
+def decode_and_extract(image_bytes):
+    with stage("decode"):
+        image = decode_image(image_bytes)
+    with stage("features"):
+        return extract_features(image)
+
+def worker_model_identity():
+    return _worker_model().identity()
+
+def predict_matrix(feature_matrix):
+    with stage("predict"):
+        return _worker_model().predict(feature_matrix)
+
+def _timed_call(submitted, fn, *args):
+    # Runs in a pool thread under the request's copied context
+    record_stage("pool_queue", time.perf_counter() - submitted)
+    return fn(*args)
+
+def _timed_in_process(fn, *args):
+    # Stages inside a worker process are not visible here, so the whole call is timed instead
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+class InferencePool:
+    """Runs CPU-bound decode/predict work off the event loop with bounded admission."""
+
+    def __init__(self, kind: str = INFERENCE_POOL, workers: int = INFERENCE_WORKERS, queue_size: int = INFERENCE_QUEUE_SIZE, model_path: str = MODEL_PATH, backend: str = MODEL_BACKEND):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"INFERENCE_POOL must be 'thread' or 'process', got {kind!r}")
+        self.kind = kind
+        self.workers = workers
+        self.queue_size = queue_size
+        self.model_path = model_path
+        self.backend = backend
+        self._executor = None
+        self._gate = AdmissionGate(self.max_in_flight, PoolSaturatedError, "Inference queue is full")
+
+    @property
+    def max_in_flight(self):
+        # Requests being worked on plus requests allowed to wait for a worker
+        return self.workers + self.queue_size
+
+    def start(self):
+        if self._executor is None:
+            executor_class = ThreadPoolExecutor if self.kind == "thread" else ProcessPoolExecutor
+            self._executor = executor_class(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(self.model_path, self.backend),
+            )
+        return self._executor
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def admit(self, jobs: int = 1):
+        # A batch reserves one slot per image it will submit
+        return self._gate.admit(jobs)
+
+    async def run(self, fn, *args):
+        executor = self.start()
+        loop = asyncio.get_running_loop()
+        if not metrics.METRICS_ENABLED:
+            return await loop.run_in_executor(executor, fn, *args)
+        if self.kind == "thread":
+            # The copied context carries the request's stage timings into the worker thread
+            return await loop.run_in_executor(executor, copy_context().run, _timed_call, time.perf_counter(), fn, *args)
+        submitted = time.perf_counter()
+        result, run_seconds = await loop.run_in_executor(executor, _timed_in_process, fn, *args)
+        record_stage("pool_queue", max(0.0, time.perf_counter() - submitted - run_seconds))
+        record_stage(fn.__name__, run_seconds)
+        return result
+
+    def stats(self):
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "in_flight": self._gate.in_flight,
+            "rejected_total": self._gate.rejected_total,
+        }
+
+inference_pool = InferencePool()
@@ -0,0 +1,46 @@
+import numpy as np
+import cv2
+
+# Shared HSV-histogram feature kernel used by serving (src/ml/pipeline.py) and
+# by the ml-py training scripts, so both always see the same 768-d vectors.
+
+#------------------ Feature settings ------------------------------------------
+RESIZE_TO = (512, 512)
+CROP_SIZE = 256
+NUM_BINS = 256
+FEATURE_SIZE = 3 * NUM_BINS
+FEATURE_NAMES = [f'{channel}_{i}' for channel in "HSV" for i in range(NUM_BINS)]
+#------------------------------------------------------------------------------
+
+def crop_center(image):
+    # Resize to 512x512, then center crop to 256x256 (the model-input crop)
+    resized_image = cv2.resize(image, RESIZE_TO)
+    center_x, center_y = resized_image.shape[1] // 2, resized_image.shape[0] // 2
+    half = CROP_SIZE // 2
+    return resized_image[center_y - half:center_y + half, center_x - half:center_x + half]
+
+def extract_features(image, out=None):
+    """Writes the normalized H, S and V histograms of a BGR image into one float32 (768,) buffer."""
+    if out is None:
+        out = np.empty(FEATURE_SIZE, dtype=np.float32)
+
+    hsv_image = cv2.cvtColor(crop_center(image), cv2.COLOR_BGR2HSV)
+    return hsv_histograms(hsv_image, out)
+
+def hsv_histograms(hsv_image, out):
+    # calcHist writes each channel straight into its slice of the output buffer
+    for channel in range(3):
+        channel_hist = out[channel * NUM_BINS:(channel + 1) * NUM_BINS].reshape(NUM_BINS, 1)
+        cv2.calcHist([hsv_image], [channel], None, [NUM_BINS], [0, 256], hist=channel_hist)
+
+    # Every channel histogram sums to the pixel count, so one division normalizes all three
+    np.divide(out, np.float32(hsv_image.shape[0] * hsv_image.shape[1]), out=out)
+    return out
+
+def extract_batch(images, out=None):
+    """Stacks the feature vectors of many BGR images into one float32 (N, 768) matrix."""
+    if out is None:
+        out = np.empty((len(images), FEATURE_SIZE), dtype=np.float32)
+    for row, image in enumerate(images):
+        extract_features(image, out=out[row])
+    return out
@@ -0,0 +1,139 @@
+from datetime import datetime, timezone
+import threading
+import hashlib
+import logging
+import asyncio
+import os
+
+from ..metrics import stage
+
+#------------------ Model settings --------------------------------------------
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(__file__), "../models/lightgbm_model.txt")
+MODEL_PATH = os.environ.get("MODEL_PATH") or DEFAULT_MODEL_PATH
+MODEL_BACKEND = (os.environ.get("MODEL_BACKEND") or "lightgbm").lower()      # lightgbm | numpy
+MODEL_CHECK_INTERVAL = float(os.environ.get("MODEL_CHECK_INTERVAL") or 2)     # seconds between model file checks
+#------------------------------------------------------------------------------
+
+logger = logging.getLogger(__name__)
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as model_file:
+        for chunk in iter(lambda: model_file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class ModelHolder:
+    """Process-wide LightGBM Booster, loaded once and reloaded only when the model file changes."""
+
+    def __init__(self, model_path: str = MODEL_PATH, backend: str = MODEL_BACKEND):
+        if backend not in ("lightgbm", "numpy"):
+            raise ValueError(f"MODEL_BACKEND must be 'lightgbm' or 'numpy', got {backend!r}")
+        self.model_path = os.path.abspath(model_path)
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._booster = None
+        self._mtime = None
+        self._sha256 = None
+        self._loaded_at = None
+
+    def load(self):
+        with self._lock:
+            self._load_locked()
+        return self._booster
+
+    def _load_locked(self):
+        mtime = os.stat(self.model_path).st_mtime_ns
+        sha256 = file_sha256(self.model_path)
+        # Touching the file without changing its content only refreshes the mtime
+        if self._booster is None or sha256 != self._sha256:
+            try:
+                with stage("model_load"):
+                    booster = self._read_model()
+            except Exception:
+                if self._booster is None:
+                    raise
+                # e.g. a half-written file mid-deploy: keep serving the last good model. The mtime is
+                # still recorded so the bad file is not re-parsed on every call; the next write retries.
+                logger.exception("Could not load model %s; keeping the previously loaded model", self.model_path)
+                self._mtime = mtime
+                return
+            self._booster = booster
+            self._sha256 = sha256
+            self._loaded_at = datetime.now(timezone.utc)
+        self._mtime = mtime
+
+    def _read_model(self):
+        if self.backend == "numpy":
+            # Pure-NumPy evaluator: no native lightgbm import on cold start
+            from .tree_compiler import CompiledForest
+            return CompiledForest.from_file(self.model_path)
+        import lightgbm as lgb
+        return lgb.Booster(model_file=self.model_path)
+
+    def get(self):
+        # A stat() per call is cheap; the file is only hashed/parsed when its mtime moves
+        try:
+            mtime = os.stat(self.model_path).st_mtime_ns
+        except OSError:
+            # Model file briefly missing while it is being replaced
+            if self._booster is None:
+                raise
+            return self._booster
+        if self._booster is None or mtime != self._mtime:
+            with self._lock:
+                if self._booster is None or mtime != self._mtime:
+                    self._load_locked()
+        return self._booster
+
+    def predict(self, feature_matrix):
+        booster = self.get()
+        return booster.predict(feature_matrix, num_iteration=booster.best_iteration)
+
+    @property
+    def sha256(self):
+        self.get()
+        return self._sha256
+
+    def identity(self):
+        booster = self.get()
+        return {
+            "backend": self.backend,
+            "sha256": self._sha256,
+            "best_iteration": booster.best_iteration,
+            "num_trees": booster.num_trees(),
+            "num_class": booster.num_model_per_iteration(),
+            "num_feature": booster.num_feature(),
+            "loaded_at": self._loaded_at.isoformat(),
+        }
+
+class ModelFingerprint:
+    """sha256 of the model file, for keying caches; stats and hashes the file but never parses it."""
+
+    def __init__(self, model_path: str = MODEL_PATH, check_interval: float = MODEL_CHECK_INTERVAL):
+        self.model_path = os.path.abspath(model_path)
+        self.check_interval = check_interval
+        self._mtime = None
+        self.sha256 = None
+
+    def refresh(self):
+        # Blocking file I/O: call off the event loop (see watch) or before serving
+        mtime = os.stat(self.model_path).st_mtime_ns
+        if mtime != self._mtime:
+            self.sha256 = file_sha256(self.model_path)
+            self._mtime = mtime
+        return self.sha256
+
+    async def watch(self):
+        # Readers only ever see the last computed value, so a lookup costs an attribute read
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                await loop.run_in_executor(None, self.refresh)
+            except OSError:
+                # Model file mid-replace; keep the last identity and look again next tick
+                pass
+
+model_holder = ModelHolder()
+model_fingerprint = ModelFingerprint()
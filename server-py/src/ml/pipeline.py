@@ -0,0 +1,40 @@
+import numpy as np
+import cv2
+
+from .model_loader import model_holder
+from .features import extract_features
+
+#folder_labels = {'Normal': 0, 'Kun': 1, 'Red': 2, 'Green': 3}
+LABEL_NAMES = ["normal", "kun", "red", "green"]
+
+def decode_image(image_bytes):
+    # Zero-copy uint8 view over the upload buffer (bytes, bytearray or memoryview)
+    buffer = np.frombuffer(image_bytes, dtype=np.uint8)
+    image = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Could not decode image")
+    return image
+
+def predict_label(feature_vector):
+    feature_vector = feature_vector.reshape(1, -1)                                                  # Reshape for LightGBM input
+    y_pred_loaded = model_holder.predict(feature_vector)                                            # Predict using the shared model
+    return label_from_probabilities(y_pred_loaded[0])
+
+def label_counts(labels):
+    counts = {name: 0 for name in LABEL_NAMES}
+    for label in labels:
+        counts[LABEL_NAMES[label]] += 1
+    return counts
+
+def label_from_probabilities(probabilities):
+    return int(np.argmax(probabilities))                                                            # Convert the predicted probabilities to class label
+
+def process_image_bytes(image_bytes):
+    return predict_label(extract_features(decode_image(image_bytes)))
+
+def process_image(image_path):
+    # File-path wrapper kept for the ml-py scripts
+    image = cv2.imread(image_path)
+    if image is None:
+        raise ValueError(f"Could not load image {image_path}")
+    return predict_label(extract_features(image))
@@ -0,0 +1,62 @@
+import hashlib
+import os
+
+from .model_loader import model_fingerprint
+from ..lru_cache import LRUCache
+
+#------------------ Prediction cache settings ---------------------------------
+PREDICTION_CACHE_SIZE = int(os.environ.get("PREDICTION_CACHE_SIZE") or 1024)
+PREDICTION_CACHE_TTL = float(os.environ.get("PREDICTION_CACHE_TTL") or 3600)   # seconds
+#------------------------------------------------------------------------------
+
+def content_hash(image_bytes):
+    return hashlib.sha256(image_bytes).hexdigest()
+
+class PredictionCache:
+    """LRU + TTL cache of class probabilities keyed by upload content and model identity."""
+
+    def __init__(self, max_entries: int = PREDICTION_CACHE_SIZE, ttl_seconds: float = PREDICTION_CACHE_TTL, model_identity=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # Never touches the Booster: the fingerprint is refreshed off the event loop
+        self.model_identity = model_identity or (lambda: model_fingerprint.sha256)
+        self._cache = LRUCache(max_entries, ttl_seconds)
+        self._model_sha = None
+        self.invalidations = 0
+
+    def _key(self, image_hash):
+        model_sha = self.model_identity()
+        if model_sha != self._model_sha:
+            # lightgbm_model.txt changed: nothing cached under the old model is valid
+            if len(self._cache):
+                self.invalidations += 1
+            self._cache.clear()
+            self._model_sha = model_sha
+        return (image_hash, model_sha)
+
+    def get(self, image_hash):
+        """(key, probabilities or None); pass the key back to put() so a result is stored under
+        the model identity that was current when it was looked up, never a newer one."""
+        key = self._key(image_hash)
+        return key, self._cache.get(key)
+
+    def put(self, key, probabilities):
+        if key[1] != self._model_sha:
+            # The model changed while this result was being computed; it may come from either model
+            return
+        probabilities = probabilities.copy()
+        probabilities.setflags(write=False)
+        self._cache.put(key, probabilities)
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        return {
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            **self._cache.stats(),
+            "invalidations": self.invalidations,
+        }
+
+prediction_cache = PredictionCache()
@@ -0,0 +1,177 @@
+import numpy as np
+
+# Compiles a LightGBM text model (lightgbm_model.txt) into flat NumPy arrays and
+# evaluates it without the native lightgbm library. Only numerical splits and
+# the binary/multiclass objectives are supported, which is all the HSV model uses.
+
+K_ZERO_THRESHOLD = 1e-35                                                                            # LightGBM's kZeroThreshold
+MISSING_NONE, MISSING_ZERO, MISSING_NAN = 0, 1, 2
+
+def _parse_values(text, dtype):
+    return np.array(text.split(), dtype=dtype) if text else np.empty(0, dtype=dtype)
+
+def parse_model_text(model_text):
+    header = {}
+    trees = []
+    current = None
+    for line in model_text.splitlines():
+        line = line.strip()
+        if line.startswith("Tree="):
+            current = {}
+            trees.append(current)
+            continue
+        if line == "end of trees":
+            break
+        if "=" not in line:
+            continue
+        key, value = line.split("=", 1)
+        (current if current is not None else header)[key] = value
+    return header, trees
+
+class CompiledForest:
+    """Flat-array form of a LightGBM GBDT, scored level by level over all trees at once."""
+
+    def __init__(self, model_text: str):
+        header, trees = parse_model_text(model_text)
+        if "average_output" in header:
+            raise ValueError("Random-forest models (average_output) are not supported")
+
+        objective = header["objective"].split()
+        self.objective = objective[0]
+        if self.objective not in ("multiclass", "binary"):
+            raise ValueError(f"Unsupported objective {self.objective!r}")
+        options = dict(option.split(":", 1) for option in objective[1:] if ":" in option)
+        self.sigmoid = float(options.get("sigmoid", 1.0))
+        self.num_class = int(header.get("num_class", 1))
+        self.num_tree_per_iteration = int(header.get("num_tree_per_iteration", 1))
+        self.num_features = int(header["max_feature_idx"]) + 1
+        self.feature_names = header.get("feature_names", "").split()
+        self.best_iteration = -1                                                                    # Same as a Booster loaded from file
+
+        # Every tree gets a block of (internal nodes + leaves) in one flat node table.
+        # Leaves point back at themselves, so a row that reaches a leaf stays there.
+        sizes = [2 * int(tree["num_leaves"]) - 1 for tree in trees]
+        offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.intp)
+        num_nodes = int(sum(sizes))
+
+        self.split_feature = np.zeros(num_nodes, dtype=np.intp)
+        self.threshold = np.full(num_nodes, np.inf)
+        self.left_child = np.arange(num_nodes, dtype=np.intp)
+        self.right_child = np.arange(num_nodes, dtype=np.intp)
+        self.default_left = np.zeros(num_nodes, dtype=bool)
+        self.missing_type = np.zeros(num_nodes, dtype=np.int8)
+        self.leaf_value = np.zeros(num_nodes, dtype=np.float64)
+        self.is_leaf = np.zeros(num_nodes, dtype=bool)
+        self.root = offsets.copy()
+        self.tree_class = np.arange(len(trees)) % self.num_tree_per_iteration
+
+        for t, tree in enumerate(trees):
+            if int(tree.get("num_cat", 0)):
+                raise ValueError("Categorical splits are not supported")
+            num_leaves = int(tree["num_leaves"])
+            num_internal = num_leaves - 1
+            offset = offsets[t]
+            leaves = slice(offset + num_internal, offset + num_internal + num_leaves)
+            self.leaf_value[leaves] = _parse_values(tree["leaf_value"], np.float64)
+            self.is_leaf[leaves] = True
+            if num_internal == 0:
+                continue                                                                            # Constant tree: the root is its only leaf
+
+            internal = slice(offset, offset + num_internal)
+            decision_type = _parse_values(tree["decision_type"], np.int64)
+            self.split_feature[internal] = _parse_values(tree["split_feature"], np.intp)
+            self.threshold[internal] = _parse_values(tree["threshold"], np.float64)
+            # Text-format children < 0 are leaves (~child is the leaf index)
+            for source, target in (("left_child", self.left_child), ("right_child", self.right_child)):
+                child = _parse_values(tree[source], np.intp)
+                target[internal] = np.where(child >= 0, offset + child, offset + num_internal + ~child)
+            self.default_left[internal] = (decision_type & 2) != 0
+            self.missing_type[internal] = (decision_type >> 2) & 3
+
+        self.max_depth = self._max_depth()
+        self._handles_missing = bool((self.missing_type != MISSING_NONE).any())
+
+    @classmethod
+    def from_file(cls, model_path):
+        with open(model_path) as model_file:
+            return cls(model_file.read())
+
+    def _max_depth(self):
+        depth = 0
+        for root in self.root:
+            stack = [(root, 0)]
+            while stack:
+                node, level = stack.pop()
+                if self.is_leaf[node]:
+                    depth = max(depth, level)
+                    continue
+                stack.append((self.left_child[node], level + 1))
+                stack.append((self.right_child[node], level + 1))
+        return depth
+
+    # Booster-compatible accessors used by ModelHolder.identity()
+    def num_trees(self):
+        return len(self.root)
+
+    def num_model_per_iteration(self):
+        return self.num_tree_per_iteration
+
+    def num_feature(self):
+        return self.num_features
+
+    def _tree_count(self, num_iteration):
+        if num_iteration is None or num_iteration <= 0:
+            return len(self.root)
+        return min(len(self.root), num_iteration * self.num_tree_per_iteration)
+
+    def raw_score(self, feature_matrix, num_iteration=None):
+        X = np.ascontiguousarray(feature_matrix, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.num_features:
+            raise ValueError(f"Expected {self.num_features} features, got {X.shape[1]}")
+        if not self._handles_missing:
+            X = np.nan_to_num(X, nan=0.0)
+
+        n_rows = X.shape[0]
+        num_trees = self._tree_count(num_iteration)
+        flat_X = X.ravel()
+
+        # One slot per (row, tree); row_base[i] is the offset of that slot's row in flat_X
+        node = np.tile(self.root[:num_trees], n_rows)
+        row_base = np.repeat(np.arange(n_rows, dtype=np.intp) * self.num_features, num_trees)
+        active = np.arange(node.size, dtype=np.intp)
+        for _ in range(self.max_depth):
+            current = node[active]
+            internal = ~self.is_leaf[current]
+            if not internal.all():
+                # Drop slots that already reached a leaf
+                active = active[internal]
+                current = current[internal]
+                if active.size == 0:
+                    break
+            values = flat_X[row_base[active] + self.split_feature[current]]
+            if self._handles_missing:
+                go_left = self._missing_decision(values, current)
+            else:
+                go_left = values <= self.threshold[current]
+            node[active] = np.where(go_left, self.left_child[current], self.right_child[current])
+
+        leaf_values = self.leaf_value[node].reshape(n_rows, -1, self.num_tree_per_iteration)
+        return leaf_values.sum(axis=1)
+
+    def _missing_decision(self, values, current):
+        # Mirrors LightGBM's NumericalDecision: NaN reads as 0.0 unless the split tracks NaN
+        missing_type = self.missing_type[current]
+        is_nan = np.isnan(values)
+        values = np.where(is_nan & (missing_type != MISSING_NAN), 0.0, values)
+        is_missing = ((missing_type == MISSING_ZERO) & (np.abs(values) <= K_ZERO_THRESHOLD)) | ((missing_type == MISSING_NAN) & is_nan)
+        return np.where(is_missing, self.default_left[current], values <= self.threshold[current])
+
+    def predict(self, feature_matrix, num_iteration=None):
+        raw = self.raw_score(feature_matrix, num_iteration)
+        if self.objective == "binary":
+            return 1.0 / (1.0 + np.exp(-self.sigmoid * raw[:, 0]))
+        raw = raw - raw.max(axis=1, keepdims=True)
+        exp = np.exp(raw)
+        return exp / exp.sum(axis=1, keepdims=True)
@@ -0,0 +1,48 @@
+import numpy as np
+import cv2
+import os
+
+from .features import crop_center, hsv_histograms, FEATURE_SIZE
+from .pipeline import decode_image
+from ..metrics import stage
+
+#------------------ Image variant settings ------------------------------------
+THUMBNAIL_SIZE = int(os.environ.get("THUMBNAIL_SIZE") or 128)               # longest side, pixels
+THUMBNAIL_FORMAT = (os.environ.get("THUMBNAIL_FORMAT") or "webp").lower()     # webp | jpeg
+THUMBNAIL_QUALITY = int(os.environ.get("THUMBNAIL_QUALITY") or 80)
+#------------------------------------------------------------------------------
+
+# variant -> content type it is served with
+VARIANT_TYPES = {
+    "crop": "image/png",                                # the exact 256x256 model-input crop, lossless
+    "thumbnail": f"image/{THUMBNAIL_FORMAT}",
+    "features": "application/octet-stream",             # 768 little-endian float32 values
+}
+
+def thumbnail(image):
+    height, width = image.shape[:2]
+    scale = THUMBNAIL_SIZE / max(height, width)
+    if scale < 1:
+        image = cv2.resize(image, (max(1, round(width * scale)), max(1, round(height * scale))), interpolation=cv2.INTER_AREA)
+    quality_flag = cv2.IMWRITE_WEBP_QUALITY if THUMBNAIL_FORMAT == "webp" else cv2.IMWRITE_JPEG_QUALITY
+    ok, encoded = cv2.imencode(f".{THUMBNAIL_FORMAT}", image, [quality_flag, THUMBNAIL_QUALITY])
+    if not ok:
+        raise ValueError(f"Could not encode {THUMBNAIL_FORMAT} thumbnail")
+    return encoded.tobytes()
+
+def render_variants(image_bytes):
+    """Decodes an original once and returns {variant: bytes} for every entry in VARIANT_TYPES."""
+    with stage("decode"):
+        image = decode_image(image_bytes)
+    with stage("variants"):
+        crop = crop_center(image)
+        ok, crop_png = cv2.imencode(".png", crop)
+        if not ok:
+            raise ValueError("Could not encode crop")
+        # Same kernel as extract_features, reusing the crop instead of cropping twice
+        features = hsv_histograms(cv2.cvtColor(crop, cv2.COLOR_BGR2HSV), np.empty(FEATURE_SIZE, dtype=np.float32))
+        return {
+            "crop": crop_png.tobytes(),
+            "thumbnail": thumbnail(image),
+            "features": features.astype("<f4").tobytes(),
+        }
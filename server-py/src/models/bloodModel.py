@@ -1,14 +1,14 @@
-from pydantic import BaseModel
-from typing import Optional, List
-from datetime import date
+from pydantic import BaseModel, Field
+from typing import Optional, List, Dict
+from datetime import date as Date
 
 class BloodModel(BaseModel):
-    date: Optional[date]
-    green: Optional[int]
-    normal: Optional[int]
-    red: Optional[int]
-    kun: Optional[int]
-    total: Optional[int]
+    date: Optional[Date] = None
+    green: Optional[int] = Field(None, ge=0)
+    normal: Optional[int] = Field(None, ge=0)
+    red: Optional[int] = Field(None, ge=0)
+    kun: Optional[int] = Field(None, ge=0)
+    total: Optional[int] = Field(None, ge=0)
     
     class Config:
         json_schema_extra = {
@@ -23,4 +23,19 @@ class BloodModel(BaseModel):
         }
 
 class UpdateBloodModel(BaseModel):
-    blood: Optional[List[BloodModel]]
\ No newline at end of file
+    blood: Optional[List[BloodModel]]
+
+class ImagePredictionModel(BaseModel):
+    filename: Optional[str]
+    label: int
+    label_name: str
+    probabilities: Dict[str, float]
+
+class BatchPredictionModel(BaseModel):
+    predictions: List[ImagePredictionModel]
+    green: int
+    normal: int
+    red: int
+    kun: int
+    total: int
+    saved: Optional[BloodModel] = None
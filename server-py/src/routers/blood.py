@@ -1,138 +1,190 @@
-from fastapi import APIRouter, HTTPException, status, Depends, UploadFile, File
+from fastapi import APIRouter, HTTPException, status, Depends, UploadFile, File, Query, Response
 from datetime import date, timedelta
-import lightgbm as lgb
+from typing import List, Literal, Optional
 import numpy as np
-import cv2
-import os
-
-from ..models.bloodModel import UpdateBloodModel
-from ..auth.auth import get_current_user
-from ..database import users_collection
+import asyncio
+
+from ..models.bloodModel import UpdateBloodModel, BatchPredictionModel
+from ..auth.auth import get_current_user, get_optional_current_user
+from .. import blood_store
+from ..blood_store import MAX_READINGS_PAGE, DEFAULT_READINGS_PAGE, RECENT_DAYS
+from ..ml.pipeline import LABEL_NAMES, label_from_probabilities, label_counts
+from ..ml.batcher import prediction_batcher
+from ..ml.executor import inference_pool, decode_and_extract, predict_matrix, worker_model_identity, PoolSaturatedError, MAX_BATCH_IMAGES
+from ..ml.prediction_cache import prediction_cache, content_hash
+from ..metrics import stage
 
 router = APIRouter()
 
-def process_image(image_path):
-    resized_image = cv2.imread(image_path)
-
-    # Center crop to 256x256
-    center_x, center_y = resized_image.shape[1] // 2, resized_image.shape[0] // 2
-    cropped_image = resized_image[center_y - 128:center_y + 128, center_x - 128:center_x + 128]
-
-    # Convert to HSV color space
-    hsv_image = cv2.cvtColor(cropped_image, cv2.COLOR_BGR2HSV)
-
-    # Extract histograms for H, S, and V channels
-    h_hist = cv2.calcHist([hsv_image], [0], None, [256], [0, 256]).flatten()
-    s_hist = cv2.calcHist([hsv_image], [1], None, [256], [0, 256]).flatten()
-    v_hist = cv2.calcHist([hsv_image], [2], None, [256], [0, 256]).flatten()
-
-    # Normalize histograms
-    h_hist = h_hist / h_hist.sum()
-    s_hist = s_hist / s_hist.sum()
-    v_hist = v_hist / v_hist.sum()
+@router.post("/upload-image-prediction/")
+async def upload_image_prediction(image: UploadFile = File(...)):
+    with stage("upload_read"):
+        image_bytes = await image.read()
 
-    current_dir = os.path.dirname(__file__)
-    model_filename = os.path.join(current_dir, "../models/lightgbm_model.txt")                      # Load Model
-    loaded_model = lgb.Booster(model_file=model_filename) 
+    # Re-uploads of the same photo skip decode and predict entirely
+    with stage("cache_lookup"):
+        image_hash = content_hash(image_bytes)
+        cache_key, probabilities = prediction_cache.get(image_hash)
+    if probabilities is not None:
+        return label_from_probabilities(probabilities)
 
-    feature_vector = np.concatenate([h_hist, s_hist, v_hist])
-    feature_vector = feature_vector.reshape(1, -1)                                                  # Reshape for LightGBM input
-    y_pred_loaded = loaded_model.predict(feature_vector, num_iteration=loaded_model.best_iteration) # Predict using the loaded model
-    predicted_label = np.argmax(y_pred_loaded, axis=1)                                              # Convert the predicted probabilities to class label
-    #folder_labels = {'Normal': 0, 'Kun': 1, 'Red': 2, 'Green': 3}
-    #reverse_folder_labels = {v: k for k, v in folder_labels.items()}                                # Reverse the dict
-    #predicted_label_name = reverse_folder_labels[predicted_label[0]] 
+    try:
+        with inference_pool.admit():
+            feature_vector = await inference_pool.run(decode_and_extract, image_bytes)
+            with stage("batched_predict"):
+                probabilities = await prediction_batcher.predict(feature_vector)
+        prediction_cache.put(cache_key, probabilities)
+        return label_from_probabilities(probabilities)
+    except PoolSaturatedError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e), headers={"Retry-After": "1"})
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Error processing image: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
 
-    return int(predicted_label[0])
+async def add_blood_counts(user_id, counts: dict):
+    # Add counts to today's reading, creating it if the day has none yet
+    return await blood_store.increment_day(user_id, date.today(), counts)
+
+async def extract_feature_matrix(images_bytes: List[bytes]):
+    # Decode every upload on the worker pool and stack them into one (N, 768) matrix
+    vectors = await asyncio.gather(*(inference_pool.run(decode_and_extract, image_bytes) for image_bytes in images_bytes))
+    feature_matrix = np.empty((len(vectors), vectors[0].shape[0]), dtype=np.float32)
+    for row, vector in enumerate(vectors):
+        feature_matrix[row] = vector
+    return feature_matrix
+
+@router.post("/upload-images-prediction/", response_model=BatchPredictionModel)
+async def upload_images_prediction(
+    images: List[UploadFile] = File(...),
+    save: bool = False,
+    current_user: Optional[dict] = Depends(get_optional_current_user)
+):
+    if len(images) > MAX_BATCH_IMAGES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Too many images; at most {MAX_BATCH_IMAGES} per request"
+        )
+    if save and current_user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
 
-@router.post("/upload-image-prediction/")
-async def upload_image_prediction(image: UploadFile = File(...)):
-    temp_file_path = f"temp_{image.filename}"
-    with open(temp_file_path, "wb") as buffer:
-        buffer.write(await image.read())
+    with stage("upload_read"):
+        images_bytes = [await image.read() for image in images]
+    with stage("cache_lookup"):
+        lookups = [prediction_cache.get(content_hash(image_bytes)) for image_bytes in images_bytes]
+    cache_keys = [key for key, _ in lookups]
+    rows = [row for _, row in lookups]
+    missing = [i for i, row in enumerate(rows) if row is None]
     try:
-        predicted_label_name = process_image(temp_file_path)
-
-        os.remove(temp_file_path)
-        return predicted_label_name
+        if missing:
+            with inference_pool.admit(len(missing)):
+                feature_matrix = await extract_feature_matrix([images_bytes[i] for i in missing])
+                missing_probabilities = await inference_pool.run(predict_matrix, feature_matrix)
+            for i, row in zip(missing, missing_probabilities):
+                prediction_cache.put(cache_keys[i], row)
+                rows[i] = row
+    except PoolSaturatedError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e), headers={"Retry-After": "1"})
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Error processing image: {str(e)}")
     except Exception as e:
-        os.remove(temp_file_path)
         raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
 
-@router.get("/", response_model=list)
-async def get_recent_blood_data(current_user: dict = Depends(get_current_user)):
-    today = date.today()
-    thirty_days_ago = today - timedelta(days=30)
-
-    # Query to find blood records within the last 30 days
-    user_data = await users_collection.find_one(
-        {"_id": current_user["_id"]},
-        {"blood": 1}  # Only fetch the "blood" field
-    )
-    
-    if not user_data or "blood" not in user_data:
-        return []
-
-    blood_entries = user_data.get("blood", [])
-
-    # Filter blood entries to include only those within the last 30 days
-    recent_blood_data = [
-        entry for entry in blood_entries
-        if "date" in entry and date.fromisoformat(entry["date"]) >= thirty_days_ago
+    probabilities = np.stack(rows)
+    labels = np.argmax(probabilities, axis=1)
+    predictions = [
+        {
+            "filename": image.filename,
+            "label": int(label),
+            "label_name": LABEL_NAMES[label],
+            "probabilities": dict(zip(LABEL_NAMES, map(float, row))),
+        }
+        for image, label, row in zip(images, labels, probabilities)
     ]
+    counts = label_counts(labels)
+
+    saved = None
+    if save:
+        with stage("db_write"):
+            saved = await add_blood_counts(current_user["_id"], counts)
+
+    return {"predictions": predictions, **counts, "total": len(predictions), "saved": saved}
+
+@router.get("/model")
+async def get_model_info(current_user: dict = Depends(get_current_user)):
+    # Reported by a worker, i.e. the model actually serving predictions
+    return await inference_pool.run(worker_model_identity)
 
-    # Sort the blood data by date in descending order (most recent first)
-    recent_blood_data.sort(key=lambda x: x["date"], reverse=True)
+@router.get("/stats")
+async def get_prediction_stats(current_user: dict = Depends(get_current_user)):
+    return {
+        "batcher": prediction_batcher.stats(),
+        "pool": inference_pool.stats(),
+        "cache": prediction_cache.stats(),
+    }
 
-    return recent_blood_data
+@router.get("/", response_model=list)
+async def get_recent_blood_data(
+    response: Response,
+    from_date: Optional[date] = Query(None, alias="from"),
+    to_date: Optional[date] = Query(None, alias="to"),
+    limit: int = Query(DEFAULT_READINGS_PAGE, ge=1, le=MAX_READINGS_PAGE),
+    cursor: Optional[date] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    # Newest first; pass X-Next-Cursor back as `cursor` to fetch the next page
+    if from_date is None:
+        from_date = date.today() - timedelta(days=RECENT_DAYS)
+    with stage("db_read"):
+        readings = await blood_store.find_readings(current_user["_id"], from_date, to_date, limit, before=cursor)
+    if len(readings) == limit:
+        response.headers["X-Next-Cursor"] = readings[-1]["date"]
+    return readings
+
+@router.get("/rollup")
+async def get_blood_rollup(
+    period: Literal["week", "month"] = "week",
+    days: int = Query(30, ge=1, le=3660),
+    from_date: Optional[date] = Query(None, alias="from"),
+    to_date: Optional[date] = Query(None, alias="to"),
+    current_user: dict = Depends(get_current_user)
+):
+    # Served from whole precomputed buckets, so the first bucket may start before `from`
+    to_date = to_date or date.today()
+    from_date = from_date or to_date - timedelta(days=days - 1)
+    if from_date > to_date:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="'from' must not be after 'to'")
+    with stage("db_read"):
+        buckets, summary = await blood_store.find_rollups(current_user["_id"], period, from_date, to_date)
+    return {
+        "period": period,
+        "from": from_date.isoformat(),
+        "to": to_date.isoformat(),
+        "buckets": buckets,
+        "summary": summary,
+    }
 
 @router.put("/", response_model=UpdateBloodModel)
 async def update_user_blood(
     blood_data: UpdateBloodModel,
     current_user: dict = Depends(get_current_user)
 ):
-    update_data = {k: v for k, v in blood_data.dict().items() if v is not None}
-    
-    if not update_data:
+    if not blood_data.blood:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="No data to update"
         )
 
-    # Check current blood records in the database
-    current_blood_data = await users_collection.find_one({"_id": current_user["_id"]}, {"blood": 1})
-
-    # Convert date to string and handle today's date logic
-    if update_data.get('blood') and update_data['blood']:
-        today_date = date.today().isoformat()
-        blood_entries = update_data['blood']
-
-        # Retrieve existing blood entries
-        existing_blood_entries = current_blood_data.get("blood", [])
-
-        # Create a set of existing dates for easy lookup
-        existing_dates = {blood['date'] for blood in existing_blood_entries if 'date' in blood}
-
-        for entry in blood_entries:
-            # Calculate total before updating date
-            entry['total'] = (entry.get('green', 0) + entry.get('normal', 0) + 
-                              entry.get('red', 0) + entry.get('kun', 0))
-            
-            entry_date = entry.get('date')  # Access date from the dictionary
-
-            if entry_date and entry_date == today_date:
-                entry['date'] = today_date  # Update to today's date if it's today
-            elif entry_date and entry_date not in existing_dates:
-                # If it’s a new date, we can add the new entry with today’s date
-                entry['date'] = today_date  # Use today's date for new entries
-            else:
-                # Optional: If the date is today but needs updating, you can choose to update it here as well
-                entry['date'] = today_date  # Update to today's date if needed
-
-    # Update the user's blood data in the database
-    await users_collection.update_one(
-        {"_id": current_user["_id"]},
-        {"$set": update_data}
-    )
-    
-    return update_data
\ No newline at end of file
+    # Counts are added to each entry's day (today when no date is given); total is always recomputed
+    today = date.today()
+    with stage("db_write"):
+        updated = await blood_store.increment_days(
+            current_user["_id"],
+            [(entry.date or today, entry.dict()) for entry in blood_data.blood]
+        )
+
+    return {"blood": updated}
@@ -1,80 +1,245 @@
-from fastapi import APIRouter,HTTPException, UploadFile, File, status
+from fastapi import APIRouter,HTTPException, UploadFile, File, Request, Response, BackgroundTasks, status
 from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+from email.utils import format_datetime, parsedate_to_datetime
 from fastapi.responses import StreamingResponse
-from typing import Union, AsyncGenerator, List
+from typing import Union, AsyncGenerator, List, Literal, Optional
+from datetime import datetime, timezone
 from urllib.parse import quote
+from gridfs.errors import NoFile
 from bson import ObjectId
+import mimetypes
+import asyncio
+import os
 
 from ..database import image_fs
+from ..metrics import stage
+from ..image_variants import load_variant, generate_in_background
+from ..ml.executor import PoolSaturatedError
+
+#------------------ Upload settings -------------------------------------------
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE") or 255 * 1024)       # bytes per read and per GridFS chunk
+UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES") or 20 * 1024 * 1024)
+UPLOAD_CONCURRENCY = int(os.environ.get("UPLOAD_CONCURRENCY") or 4)           # files written to GridFS at once
+IMAGE_CACHE_MAX_AGE = int(os.environ.get("IMAGE_CACHE_MAX_AGE") or 86400)      # seconds browsers/CDNs may reuse an image
+#------------------------------------------------------------------------------
+
+ALLOWED_IMAGE_TYPES = ["image/jpeg", "image/png", "image/webp"]
+IMAGE_SIGNATURES = {
+    "image/jpeg": lambda head: head.startswith(b"\xff\xd8\xff"),
+    "image/png": lambda head: head.startswith(b"\x89PNG\r\n\x1a\n"),
+    "image/webp": lambda head: head[:4] == b"RIFF" and head[8:12] == b"WEBP",
+}
+
+# Shared by every request so concurrent uploads cannot open unbounded GridFS writes
+upload_slots = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+
 router = APIRouter()
 
-async def get_file_stream(file_id: ObjectId) -> AsyncGenerator[bytes, None]:
-    grid_out = await image_fs.open_download_stream(file_id)
-    while True:
-        chunk = await grid_out.readchunk()
-        if not chunk:
-            break
-        yield chunk
+def sniff_image_type(head: bytes):
+    for content_type, matches in IMAGE_SIGNATURES.items():
+        if matches(head):
+            return content_type
+    return None
+
+async def read_validated_head(file: UploadFile, allowed_content_types: List[str]) -> bytes:
+    # Reject on the declared type, the declared size and the first chunk's magic bytes before anything is stored
+    if file.content_type not in allowed_content_types:
+        raise HTTPException(status_code=400, detail=f"Invalid file type for file {file.filename}. Allowed file types are {', '.join(allowed_content_types)}.")
+    if file.size is not None and file.size > UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"File {file.filename} is larger than {UPLOAD_MAX_BYTES} bytes")
+    with stage("upload_read"):
+        head = await file.read(UPLOAD_CHUNK_SIZE)
+    if sniff_image_type(head) != file.content_type:
+        raise HTTPException(status_code=400, detail=f"File {file.filename} is not a valid {file.content_type} image")
+    return head
+
+async def ingest_file(file: UploadFile, head: bytes, fs_bucket: AsyncIOMotorGridFSBucket) -> ObjectId:
+    # Copies one bounded chunk at a time; the whole file is never held in memory
+    async with upload_slots:
+        grid_in = fs_bucket.open_upload_stream(
+            file.filename,
+            chunk_size_bytes=UPLOAD_CHUNK_SIZE,
+            metadata={"contentType": file.content_type},
+        )
+        size = 0
+        chunk = head
+        try:
+            with stage("gridfs_write"):
+                while chunk:
+                    size += len(chunk)
+                    if size > UPLOAD_MAX_BYTES:
+                        raise HTTPException(status_code=413, detail=f"File {file.filename} is larger than {UPLOAD_MAX_BYTES} bytes")
+                    await grid_in.write(chunk)
+                    chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                await grid_in.close()
+        except BaseException:
+            await grid_in.abort()
+            raise
+    return grid_in._id
 
 async def upload_files(files: List[UploadFile], allowed_content_types: List[str], fs_bucket: AsyncIOMotorGridFSBucket) -> List[str]:
-    file_ids = []
-    for file in files:
-        if file.content_type not in allowed_content_types:
-            raise HTTPException(status_code=400, detail=f"Invalid file type for file {file.filename}. Allowed file types are {', '.join(allowed_content_types)}.")
-        
-        file_id = await fs_bucket.upload_from_stream(file.filename, file.file)
-        file_ids.append(str(file_id))
-    return file_ids
-@router.get("/images/{file_id}")
-async def get_image(file_id: str):
+    heads = [await read_validated_head(file, allowed_content_types) for file in files]
+    results = await asyncio.gather(
+        *(ingest_file(file, head, fs_bucket) for file, head in zip(files, heads)),
+        return_exceptions=True
+    )
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if errors:
+        # All or nothing: drop the files that did make it in
+        for result in results:
+            if not isinstance(result, BaseException):
+                await fs_bucket.delete(result)
+        raise errors[0]
+    return [str(file_id) for file_id in results]
+
+def parse_object_id(file_id: str) -> ObjectId:
     try:
-        file_id = ObjectId(file_id)
+        return ObjectId(file_id)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid file ID format")
 
+async def open_image(file_id: ObjectId):
     try:
-        file = await image_fs.open_download_stream(file_id)
-        return StreamingResponse(file, media_type="image/png")
-    except Exception as e:
-        raise HTTPException(status_code=404, detail=f"File not found: {str(e)}")
+        with stage("gridfs_open"):
+            return await image_fs.open_download_stream(file_id)
+    except NoFile:
+        raise HTTPException(status_code=404, detail="File not found")
 
-@router.post("/images/")
-async def upload_images(image_files: List[UploadFile] = File(...)):
-        file_ids = []
-        for image_file in image_files:
-            file_content = await image_file.read()
-            
-            file_id = await image_fs.upload_from_stream(image_file.filename, file_content)
-            file_ids.append(str(file_id))
-        
-        return {"image_file_ids": file_ids}
+def grid_content_type(grid_out) -> str:
+    # Uploads record their sniffed type; older files fall back to the filename
+    content_type = (grid_out.metadata or {}).get("contentType")
+    return content_type or mimetypes.guess_type(grid_out.filename or "")[0] or "application/octet-stream"
 
+def grid_validators(file_id, length, upload_date):
+    # GridFS files never change once written, so id + length + upload time identify the bytes exactly
+    if upload_date.tzinfo is None:
+        upload_date = upload_date.replace(tzinfo=timezone.utc)
+    etag = f'"{file_id}-{length}-{int(upload_date.timestamp())}"'
+    return etag, upload_date.replace(microsecond=0)
 
-@router.get("/download_image/{file_id}")
-async def download_image(file_id: str):
+def cache_headers(etag, last_modified):
+    return {
+        "ETag": etag,
+        "Last-Modified": format_datetime(last_modified, usegmt=True),
+        "Cache-Control": f"public, max-age={IMAGE_CACHE_MAX_AGE}",
+    }
+
+def etag_matches(header: str, etag: str) -> bool:
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in tags or etag in tags
+
+def is_not_modified(request: Request, etag: str, last_modified: datetime) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return last_modified <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def parse_range(header: str, length: int):
+    """(start, end) inclusive for a single `bytes=` range, None to send the whole file."""
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
     try:
-        # แปลง file_id จาก string เป็น ObjectId
-        object_id = ObjectId(file_id)
-        
-        # ดึงไฟล์จาก MongoDB GridFS
-        grid_out = await image_fs.open_download_stream(object_id)
-        
-        # ตรวจสอบว่าไฟล์มีอยู่หรือไม่
-        if grid_out is None:
-            raise HTTPException(status_code=404, detail="File not found")
-        
-        # เข้ารหัสชื่อไฟล์ใน Content-Disposition header
-        filename = quote(grid_out.filename)
-        content_disposition = f'attachment; filename*=UTF-8\'\'{filename}'
-        
-        # ส่งไฟล์กลับไปยังผู้ใช้เป็น StreamingResponse
-        return StreamingResponse(
-            get_file_stream(object_id), 
-            media_type="application/octet-stream",
-            headers={"Content-Disposition": content_disposition}
-        )
-    except Exception as e:
+        if first:
+            start = int(first)
+            end = min(int(last), length - 1) if last else length - 1
+        else:
+            start = max(length - int(last), 0)
+            end = length - 1
+    except ValueError:
+        return None
+    if start > end or start >= length:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=str(e)
-        )
\ No newline at end of file
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{length}"}
+        )
+    return start, end
+
+async def read_range(grid_out, start: int, end: int) -> AsyncGenerator[bytes, None]:
+    # Seeking lands in the right GridFS chunk, so only the chunks covering the range are fetched
+    grid_out.seek(start)
+    remaining = end - start + 1
+    while remaining > 0:
+        chunk = await grid_out.readchunk()
+        if not chunk:
+            break
+        chunk = chunk[:remaining]
+        remaining -= len(chunk)
+        yield chunk
+
+def grid_file_response(request: Request, grid_out, headers: dict = None) -> Response:
+    etag, last_modified = grid_validators(grid_out._id, grid_out.length, grid_out.upload_date)
+    headers = {**cache_headers(etag, last_modified), "Accept-Ranges": "bytes", **(headers or {})}
+    if is_not_modified(request, etag, last_modified):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    length = grid_out.length
+    start, end = 0, length - 1
+    status_code = status.HTTP_200_OK
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    # A stale If-Range means the client's partial copy is outdated: send the full file instead
+    if range_header and length and (if_range is None or if_range.strip() == etag):
+        byte_range = parse_range(range_header, length)
+        if byte_range is not None:
+            start, end = byte_range
+            status_code = status.HTTP_206_PARTIAL_CONTENT
+            headers["Content-Range"] = f"bytes {start}-{end}/{length}"
+    headers["Content-Length"] = str(end - start + 1 if length else 0)
+    return StreamingResponse(
+        read_range(grid_out, start, end),
+        status_code=status_code,
+        media_type=grid_content_type(grid_out),
+        headers=headers
+    )
+
+async def variant_response(request: Request, file_id: ObjectId, variant: str) -> Response:
+    try:
+        content, content_type, variant_id, upload_date = await load_variant(file_id, variant)
+    except NoFile:
+        raise HTTPException(status_code=404, detail="File not found")
+    except PoolSaturatedError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e), headers={"Retry-After": "1"})
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Error processing image: {str(e)}")
+    etag, last_modified = grid_validators(variant_id, len(content), upload_date)
+    headers = cache_headers(etag, last_modified)
+    if is_not_modified(request, etag, last_modified):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content, media_type=content_type, headers=headers)
+
+@router.get("/images/{file_id}")
+async def get_image(file_id: str, request: Request, variant: Optional[Literal["crop", "thumbnail", "features"]] = None):
+    # variant= serves a derived copy (model-input crop, thumbnail or feature vector) instead of the original
+    file_id = parse_object_id(file_id)
+    if variant is not None:
+        return await variant_response(request, file_id, variant)
+    grid_out = await open_image(file_id)
+    return grid_file_response(request, grid_out)
+
+@router.post("/images/")
+async def upload_images(background_tasks: BackgroundTasks, image_files: List[UploadFile] = File(...)):
+    file_ids = await upload_files(image_files, ALLOWED_IMAGE_TYPES, image_fs)
+    # Crops, thumbnails and features are rendered after the response is sent
+    background_tasks.add_task(generate_in_background, [ObjectId(file_id) for file_id in file_ids])
+    return {"image_file_ids": file_ids}
+
+
+@router.get("/download_image/{file_id}")
+async def download_image(file_id: str, request: Request):
+    # ดึงไฟล์จาก MongoDB GridFS
+    grid_out = await open_image(parse_object_id(file_id))
+
+    # เข้ารหัสชื่อไฟล์ใน Content-Disposition header
+    filename = quote(grid_out.filename)
+    content_disposition = f'attachment; filename*=UTF-8\'\'{filename}'
+
+    return grid_file_response(request, grid_out, {"Content-Disposition": content_disposition})
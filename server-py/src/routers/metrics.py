@@ -0,0 +1,27 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from ..metrics import registry
+from ..ml.batcher import prediction_batcher
+from ..ml.executor import inference_pool
+from ..ml.prediction_cache import prediction_cache
+from ..auth.user_cache import user_cache
+from ..auth.passwords import password_hasher
+from ..image_variants import variant_cache
+
+router = APIRouter()
+
+def numeric_gauges(prefix, stats):
+    return {f"{prefix}_{key}": value for key, value in stats.items() if isinstance(value, (int, float)) and not isinstance(value, bool)}
+
+@router.get("", response_class=PlainTextResponse)
+async def get_metrics():
+    # Prometheus text exposition: stage/request histograms plus the batcher, pool and cache counters
+    gauges = {}
+    gauges.update(numeric_gauges("batcher", prediction_batcher.stats()))
+    gauges.update(numeric_gauges("pool", inference_pool.stats()))
+    gauges.update(numeric_gauges("cache", prediction_cache.stats()))
+    gauges.update(numeric_gauges("user_cache", user_cache.stats()))
+    gauges.update(numeric_gauges("passwords", password_hasher.stats()))
+    gauges.update(numeric_gauges("variant_cache", variant_cache.stats()))
+    return PlainTextResponse(registry.render(gauges), media_type="text/plain; version=0.0.4")
@@ -1,12 +1,19 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, HTTPException, status, Depends
+from datetime import date, timedelta
 
 from ..models.userModel import ReadUserProfileModel
 from ..auth.auth import get_current_user
 from ..database import users_collection
+from .. import blood_store
 
 router = APIRouter()
 
 @router.get("/profile", response_model=ReadUserProfileModel)
-async def read_user_profile(current_user: ReadUserProfileModel = Depends(get_current_user)):
-    return current_user
+async def read_user_profile(current_user: dict = Depends(get_current_user)):
+    # get_current_user only carries the identity; the profile fields are read here
+    user = await users_collection.find_one({"_id": current_user["_id"]}, {"username": 1})
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    user["blood"] = await blood_store.find_readings(current_user["_id"], from_date=date.today() - timedelta(days=blood_store.RECENT_DAYS))
+    return user
     
\ No newline at end of file